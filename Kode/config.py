@@ -156,8 +156,32 @@ STEP6_PRIMARY_FLOW_SCENARIO = "Q95"
 # Flow selection mode for Step 6 (Q-point choice per segment)
 # - "max_per_ov": max Q per ov_id per scenario (entire river)
 # - "max_near_segment": max Q from Q-points within 100m buffer of segment
-# - "downstream_per_segment": nearest Q-point downstream of segment (hydrologically correct)
+# - "downstream_per_segment": first Q-point at or below the segment end on the same ov_id
+#   (linear referencing along the river network; nearest to the segment end as fallback)
 STEP6_FLOW_SELECTION_MODE = "downstream_per_segment"
+# Downstream accumulation (tilstandsvurdering/step6_river_network.py): route the
+# segment flux down the river network and write step6_cmix_accumulated.csv
+STEP6_DOWNSTREAM_ACCUMULATION = True
+# A segment end connects to segments starting within this distance (m); also the
+# tolerance for a Q-point to count as at a segment end (downstream_per_segment)
+STEP6_NETWORK_SNAP_TOLERANCE_M = 1.0
+# Flow-duration exceedance (tilstandsvurdering/step6_flow_duration.py): fraction
+# of time each segment-substance exceeds MKK, interpolated between the flow
+# scenarios; writes step6_exceedance_fraction.csv
+STEP6_FLOW_DURATION_EXCEEDANCE = True
+# Daily exceedance counting (tilstandsvurdering/step6_daily_flow.py, only with
+# RIVER_DAILY_FLOW_PATH): segment-substance rows per block; peak memory is about
+# block rows × days × 20 bytes
+STEP6_DAILY_FLOW_BLOCK_ROWS = 2_000
+# Chunked Step 6: process GVFK partitions that fit this memory budget (MB) and
+# spill partial results to disk. None = single pass with all data in memory.
+# Chunked runs write all Step 6 CSV/matrix outputs but skip the Step 6
+# visualizations (they need every site flux row and the raster pixel samples in
+# memory); rerun with None to get the figures and maps.
+STEP6_MEMORY_BUDGET_MB = None
+# Estimated peak working memory per Step 5 input row in Step 6 (enrichment,
+# raster pixel samples, scenario expansion); sizes the GVFK chunks.
+STEP6_BYTES_PER_INPUT_ROW = 16_000
 # -------------------------------------------------------------------
 # Input Data Column Mappings
 # -------------------------------------------------------------------
@@ -245,10 +269,18 @@ RIVER_FLOW_POINTS_PATH = (
     / "Grunddata_results.gdb"
 )
 RIVER_FLOW_POINTS_LAYER = "dkm_qpoints_gvf_vp3genbesog_kontakt"
+# Daily discharge per Q-point (optional, CSV or Parquet): one row per day with a
+# "Date" column and one column per Q-point, named by Qpoint_Index (row position
+# in the Q-point layer, as in step6_flow_selection.csv). Rows may be unsorted;
+# duplicate dates are an error and missing days are NaN. None = percentile
+# scenarios only.
+RIVER_DAILY_FLOW_PATH = None
 
 # Cache files for repeated spatial operations
 V1_DISSOLVED_CACHE = CACHE_DIR / "v1_dissolved_geometries.shp"
 V2_DISSOLVED_CACHE = CACHE_DIR / "v2_dissolved_geometries.shp"
+# Daily discharge as a (Q-points × days) array for memory-mapped reads
+RIVER_DAILY_FLOW_CACHE = CACHE_DIR / "river_daily_flow.npy"
 
 # -------------------------------------------------------------------
 # Output file paths - CORE WORKFLOW (Steps 1-6)
@@ -259,6 +291,11 @@ CORE_OUTPUTS = {
     # Step 3: V1/V2 contamination sites
     "step3_v1v2_sites": STEP3_DATA_DIR / "step3_v1v2_sites.shp",
     "step3_gvfk_polygons": STEP3_DATA_DIR / "step3_gvfk_with_v1v2.shp",
+    # Step 3: Long site-GVFK-substance table + interned substance texts
+    "step3_site_substances": STEP3_DATA_DIR / "step3_site_substances.csv",
+    "step3_substance_dictionary": STEP3_DATA_DIR / "step3_substance_dictionary.csv",
+    # One dissolved polygon per site with Area_m2 and centroid (GeoParquet, read by Step 6)
+    "step3_site_geometries": STEP3_DATA_DIR / "step3_site_geometries.parquet",
     # Step 3b: Infiltration-filtered sites (BEFORE distance calculation)
     "step3b_filtered_sites": STEP3_DATA_DIR / "step3b_filtered_sites.shp",
     # Step 4: Distance calculations
@@ -274,6 +311,8 @@ CORE_OUTPUTS = {
     / f"step5_gvfk_high_risk_{WORKFLOW_SETTINGS['risk_threshold_m']}m.shp",
     # Step 5b: Compound-specific assessment (PRE-infiltration filter)
     "step5b_compound_combinations": STEP5_DATA_DIR / "step5b_compound_combinations.csv",
+    # Same rows as Parquet dataset partitioned by Qualifying_Category (see data_loaders.load_step5_combinations)
+    "step5b_compound_dataset": STEP5_DATA_DIR / "step5b_compound_combinations_parquet",
     "step5b_compound_gvfk_high_risk": STEP5_DATA_DIR / "step5b_compound_gvfk_high_risk.shp",
     # Step 5c: DEPRECATED - infiltration now happens at Step 3b
     # Keeping the path for backward compatibility with existing files
@@ -282,6 +321,13 @@ CORE_OUTPUTS = {
     "step5_compound_detailed_combinations": STEP5_DATA_DIR / "step5b_compound_combinations.csv",
     "step5_compound_specific_sites": STEP5_DATA_DIR / "step5_compound_specific_sites.csv",
     "step5_compound_gvfk_high_risk": STEP5_DATA_DIR / "step5b_compound_gvfk_high_risk.shp",
+    # Step 5 threshold sweep: qualifying sites/GVFKs/combinations per threshold set
+    "step5_threshold_sweep": STEP5_DATA_DIR / "step5_threshold_sweep.csv",
+    "step5_andre_fuzzy_review": STEP5_DATA_DIR / "step5_andre_fuzzy_review.csv",
+    # Baseline for incremental rule-change analysis (risikovurdering/step5_rule_impact.py)
+    "step5_rule_snapshot": STEP5_DATA_DIR / "step5_rule_snapshot.json",
+    "step5_substance_categories": STEP5_DATA_DIR / "step5_substance_categories.csv",
+    "step5_rule_change_impact": STEP5_DATA_DIR / "step5_rule_change_impact.csv",
     # Step 5: Sites without substance data (parked for later analysis)
     # "step5_unknown_substance_sites": STEP5_DATA_DIR / "step5_unknown_substance_sites.csv",  # Removed: Dead end
     # Step 6: Tilstandsvurdering outputs
@@ -295,6 +341,18 @@ CORE_OUTPUTS = {
     # GVFK-level exceedance view (filtered to MKK exceedances)
     "step6_gvfk_mkk_exceedances": STEP6_DATA_DIR / "step6_gvfk_mkk_exceedance.csv",
     "step6_filtering_audit": STEP6_DATA_DIR / "step6_filtering_audit_detailed.csv",
+    # Cmix from flux accumulated downstream along the river network (step6_river_network.py)
+    "step6_cmix_accumulated": STEP6_DATA_DIR / "step6_cmix_accumulated.csv",
+    # Fraction of time exceeding MKK per segment-substance (step6_flow_duration.py)
+    "step6_exceedance_fraction": STEP6_DATA_DIR / "step6_exceedance_fraction.csv",
+    # Exceedance days and longest exceedance run from daily flows (step6_daily_flow.py)
+    "step6_daily_exceedance": STEP6_DATA_DIR / "step6_daily_exceedance.csv",
+    # Sparse (segment, scenario) x (site, GVFK) volume matrix + flows for what-if Cmix
+    "step6_flux_matrix": STEP6_DATA_DIR / "step6_flux_matrix",
+    # Segment -> Q-point -> flow selection per scenario (read by the Step 6 maps and tools)
+    "step6_flow_selection": STEP6_DATA_DIR / "step6_flow_selection.csv",
+    # Temporary per-chunk spill files (chunked Step 6 only, removed after the run)
+    "step6_chunk_spill": STEP6_DATA_DIR / "step6_chunks",
     # Workflow summary
     "workflow_summary": WORKFLOW_SUMMARY_DIR / "workflow_summary.csv",
     "interactive_distance_map": WORKFLOW_SUMMARY_DIR / "interactive_distance_map.html",
@@ -6,11 +6,14 @@ and improve maintainability across workflow steps.
 
 from __future__ import annotations
 
+import hashlib
 from pathlib import Path
 from typing import Dict, Iterable, Sequence
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyproj
 
 from config import (
     COLUMN_MAPPINGS,
@@ -18,29 +21,200 @@ from config import (
     GRUNDVAND_GDB_PATH,
     GRUNDVAND_LAYER_NAME,
     RIVER_FLOW_POINTS_LAYER,
+    RIVER_DAILY_FLOW_CACHE,
+    RIVER_DAILY_FLOW_PATH,
     RIVER_FLOW_POINTS_PATH,
     RIVERS_LAYER_NAME,
     RIVERS_PATH,
+    STEP6_FLOW_SELECTION_MODE,
+    STEP6_NETWORK_SNAP_TOLERANCE_M,
     WORKFLOW_SETTINGS,
     get_output_path,
+    ensure_cache_directory,
+    is_cache_valid,
 )
 
 
-def load_step5_results() -> pd.DataFrame:
+STEP5_PARTITION_COLUMN = "Qualifying_Category"
+
+# Identifier and text columns of the Step 5b output. Both the Parquet dataset
+# and the CSV fallback return these as object strings (NaN for missing), so
+# numeric-looking IDs never come back as int/float depending on the source.
+STEP5_TEXT_COLUMNS = (
+    "Lokalitet_ID",
+    "GVFK",
+    "Site_Type",
+    "Nearest_River_ov_id",
+    "Nearest_River_ov_navn",
+    "River_Segment_FIDs",
+    "River_Segment_ov_ids",
+    "Lokalitetensbranche",
+    "Lokalitetensaktivitet",
+    "Lokalitetensstoffer",
+    "Lokalitetsnavn",
+    "Lokalitetetsforureningsstatus",
+    "Regionsnavn",
+    "Kommunenavn",
+    "Qualifying_Category",
+    "Qualifying_Substance",
+    "Original_Category",
+    "Losseplads_Subcategory",
+)
+
+_FILTER_OPS = {
+    "==": lambda col, val: col == val,
+    "!=": lambda col, val: col != val,
+    "<": lambda col, val: col < val,
+    "<=": lambda col, val: col <= val,
+    ">": lambda col, val: col > val,
+    ">=": lambda col, val: col >= val,
+    "in": lambda col, val: col.isin(list(val)),
+    "not in": lambda col, val: ~col.isin(list(val)),
+}
+
+
+def _apply_filters(df: pd.DataFrame, filters: Sequence[tuple]) -> pd.DataFrame:
+    """Apply pyarrow-style (column, op, value) filters (AND-combined) in pandas."""
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        mask &= _FILTER_OPS[op](df[column], value)
+    return df[mask]
+
+
+def _apply_step5_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the STEP5_TEXT_COLUMNS present in df to object strings, keeping NaN."""
+    for column in STEP5_TEXT_COLUMNS:
+        if column in df.columns:
+            values = df[column]
+            df[column] = values.astype(str).astype(object).where(values.notna(), np.nan)
+    return df
+
+
+# ------------------------------------------------------------------
+# Process-wide layer cache (river, Q-point and GVFK layers)
+# ------------------------------------------------------------------
+
+# (path, layer) -> layer as read; (path, layer, CRS) -> reprojected copy
+_LAYER_CACHE: Dict[tuple, gpd.GeoDataFrame] = {}
+
+
+def read_layer(
+    path: Path | str, layer: str | None = None, crs: object | None = None
+) -> gpd.GeoDataFrame:
+    """Read a vector layer at most once per process, optionally reprojected.
+
+    Args:
+        path: Vector source (shapefile, GeoPackage, file geodatabase)
+        layer: Layer name (None = first layer)
+        crs: Target CRS (anything pyproj accepts, e.g. "EPSG:4326"); each
+            projection of a layer is computed once. Layers without a CRS are
+            taken to be EPSG:25832.
+
+    Returns:
+        A copy of the cached GeoDataFrame (callers may modify it freely).
+    """
+    key = (str(Path(path)), layer)
+    if key not in _LAYER_CACHE:
+        _LAYER_CACHE[key] = gpd.read_file(path, layer=layer)
+    if crs is None:
+        return _LAYER_CACHE[key].copy()
+
+    target = pyproj.CRS.from_user_input(crs)
+    projected_key = key + (target.to_string(),)
+    if projected_key not in _LAYER_CACHE:
+        source = _LAYER_CACHE[key]
+        if source.crs is None:
+            source = source.set_crs("EPSG:25832")
+        _LAYER_CACHE[projected_key] = source if source.crs == target else source.to_crs(target)
+    return _LAYER_CACHE[projected_key].copy()
+
+
+def clear_layer_cache() -> None:
+    """Drop all cached layers (e.g. after the input data has changed)."""
+    _LAYER_CACHE.clear()
+
+
+def load_step5_combinations(
+    columns: Sequence[str] | None = None,
+    categories: Iterable[str] | None = None,
+    filters: Sequence[tuple] | None = None,
+) -> pd.DataFrame:
+    """Load Step 5b site-GVFK-substance combinations, reading only what is needed.
+
+    Reads the Parquet dataset partitioned by Qualifying_Category when it is
+    newer than the CSV: the column selection and filters are pushed down to the
+    reader, so a category filter only opens those partitions. Falls back to the
+    CSV (reading only the needed columns) for older results or when the CSV has
+    been rewritten since the dataset.
+
+    Args:
+        columns: Columns to return (default: all)
+        categories: Only these Qualifying_Category values
+        filters: Extra pyarrow-style filters, e.g. [("Distance_to_River_m", "<=", 100)]
+            (AND-combined; ops: ==, !=, <, <=, >, >=, in, not in)
+
+    Returns:
+        DataFrame in the CSV row order
+    """
+    filters = list(filters or [])
+    if categories is not None:
+        filters.append((STEP5_PARTITION_COLUMN, "in", sorted(set(categories))))
+
+    csv_path = get_output_path("step5b_compound_combinations")
+    dataset_path = get_output_path("step5b_compound_dataset")
+    if is_cache_valid(dataset_path, csv_path):
+        # _row (written by Step 5) restores the CSV row order across partitions
+        df = pd.read_parquet(
+            dataset_path,
+            columns=list(columns) + ["_row"] if columns is not None else None,
+            filters=filters or None,
+        )
+        df = _apply_step5_dtypes(df)
+        # Remaining text columns back to object/NaN, as read from the CSV
+        for column in df.select_dtypes(include=["string", "category"]).columns:
+            df[column] = df[column].astype(object).where(df[column].notna(), np.nan)
+        if "_row" in df.columns:
+            df = df.sort_values("_row", kind="stable").drop(columns="_row")
+        # Partitioning moves Qualifying_Category last; restore the CSV column order
+        order = columns if columns is not None else pd.read_csv(csv_path, nrows=0).columns
+        return df[[column for column in order if column in df.columns]].reset_index(drop=True)
+
+    usecols = None
+    if columns is not None:
+        needed = list(columns) + [column for column, _, _ in filters]
+        usecols = list(dict.fromkeys(needed))
+    df = pd.read_csv(
+        csv_path,
+        usecols=usecols,
+        dtype={column: object for column in STEP5_TEXT_COLUMNS},
+        encoding="utf-8",
+    )
+    df = _apply_step5_dtypes(df)
+    if filters:
+        df = _apply_filters(df, filters)
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+
+def load_step5_results(
+    columns: Sequence[str] | None = None,
+    categories: Iterable[str] | None = None,
+    filters: Sequence[tuple] | None = None,
+) -> pd.DataFrame:
     """Load Step 5 output and validate required columns.
 
+    Args:
+        columns: Optional column subset (required columns are always loaded)
+        categories: Optional Qualifying_Category subset
+        filters: Optional row filters, see load_step5_combinations()
+
     Returns:
         DataFrame with site-GVFK-substance combinations
 
     Raises:
         ValueError: If file is empty or missing required columns
     """
-    step5_path = get_output_path("step5_compound_detailed_combinations")
-    df = pd.read_csv(step5_path, encoding="utf-8")
-
-    if df.empty:
-        raise ValueError(f"Step 5 output is empty: {step5_path}")
-
     required_columns = [
         "Lokalitet_ID",
         "GVFK",
@@ -51,6 +225,15 @@ def load_step5_results() -> pd.DataFrame:
         "Nearest_River_ov_id",
         "River_Segment_Count",
     ]
+    if columns is not None:
+        columns = list(dict.fromkeys(required_columns + list(columns)))
+
+    step5_path = get_output_path("step5_compound_detailed_combinations")
+    df = load_step5_combinations(columns=columns, categories=categories, filters=filters)
+
+    if df.empty:
+        raise ValueError(f"Step 5 output is empty: {step5_path}")
+
     missing_columns = [col for col in required_columns if col not in df.columns]
     if missing_columns:
         raise ValueError(f"Step 5 output missing columns: {', '.join(missing_columns)}")
@@ -61,9 +244,41 @@ def load_step5_results() -> pd.DataFrame:
     return df
 
 
+def load_site_substances() -> pd.DataFrame | None:
+    """Load the long site-GVFK-substance table written by Step 3.
+
+    Substance texts are interned: the Substance column is a Categorical whose
+    codes are the Step 3 Substance_ID values.
+
+    Returns:
+        DataFrame with Lokalitet_ID, GVFK, Substance_ID, Substance, or None if
+        Step 3 has not produced the table (older result folders).
+    """
+    long_path = get_output_path("step3_site_substances")
+    dictionary_path = get_output_path("step3_substance_dictionary")
+    if not long_path.exists() or not dictionary_path.exists():
+        return None
+
+    site_substances = pd.read_csv(long_path, encoding="utf-8")
+    dictionary = pd.read_csv(dictionary_path, encoding="utf-8")
+
+    # Map IDs onto a dense categorical (dictionary may be a subset after filtering)
+    dictionary = dictionary.sort_values("Substance_ID").reset_index(drop=True)
+    position = pd.Series(dictionary.index, index=dictionary["Substance_ID"])
+    site_substances["Substance"] = pd.Categorical.from_codes(
+        site_substances["Substance_ID"].map(position).to_numpy(),
+        categories=dictionary["Substance"],
+    )
+    return site_substances
+
+
 def load_site_geometries() -> gpd.GeoDataFrame:
     """Load Step 3 site geometries and compute areas.
 
+    Reads the per-site table written by Step 3 (dissolved polygons with area and
+    centroid precomputed) when it is newer than step3_v1v2_sites.shp; otherwise
+    dissolves the Step 3 shapefile as before.
+
     Returns:
         GeoDataFrame with dissolved site polygons, areas, and centroids
 
@@ -71,7 +286,23 @@ def load_site_geometries() -> gpd.GeoDataFrame:
         ValueError: If geometries are empty
     """
     site_id_col = COLUMN_MAPPINGS["contamination_shp"]["site_id"]
-    sites = gpd.read_file(get_output_path("step3_v1v2_sites"))
+    sites_path = get_output_path("step3_v1v2_sites")
+    table_path = get_output_path("step3_site_geometries")
+
+    if is_cache_valid(table_path, sites_path):
+        try:
+            table = gpd.read_parquet(table_path)
+        except (ImportError, ValueError):
+            table = None
+        if table is not None and not table.empty:
+            table["Centroid"] = gpd.GeoSeries(
+                gpd.points_from_xy(table["Centroid_x"], table["Centroid_y"]),
+                index=table.index,
+                crs=table.crs,
+            )
+            return table[[site_id_col, "Area_m2", "Centroid", "geometry"]]
+
+    sites = gpd.read_file(sites_path)
     if sites.empty:
         raise ValueError("Step 3 geometries are empty – cannot derive site areas.")
 
@@ -102,7 +333,7 @@ def load_gvfk_layer_mapping(columns: Sequence[str] | None = None) -> gpd.GeoData
             "This dataset is required for infiltration calculations."
         )
 
-    gvfk_gdf = gpd.read_file(GRUNDVAND_GDB_PATH, layer=GRUNDVAND_LAYER_NAME)
+    gvfk_gdf = read_layer(GRUNDVAND_GDB_PATH, GRUNDVAND_LAYER_NAME)
 
     gvfk_col = COLUMN_MAPPINGS["gvfk_layer_mapping"]["gvfk_id"]
     layer_col = COLUMN_MAPPINGS["gvfk_layer_mapping"]["model_layer"]
@@ -126,9 +357,14 @@ def load_gvfk_layer_mapping(columns: Sequence[str] | None = None) -> gpd.GeoData
     return gvfk_gdf
 
 
-def load_river_segments() -> gpd.GeoDataFrame:
+def load_river_segments(crs: object | None = None, contact_only: bool = True) -> gpd.GeoDataFrame:
     """Load river network with GVFK contact.
 
+    Args:
+        crs: Optional target CRS (served from the layer cache, see read_layer)
+        contact_only: False returns all segments (full network, e.g. for
+            downstream routing); River_FID is the same in both cases
+
     Returns:
         GeoDataFrame with river segments and metadata
 
@@ -138,7 +374,7 @@ def load_river_segments() -> gpd.GeoDataFrame:
     if not RIVERS_PATH.exists():
         raise FileNotFoundError(f"River network not found: {RIVERS_PATH}")
 
-    rivers = gpd.read_file(RIVERS_PATH, layer=RIVERS_LAYER_NAME)
+    rivers = read_layer(RIVERS_PATH, RIVERS_LAYER_NAME, crs=crs)
     if rivers.empty:
         raise ValueError("River segment file is empty – cannot continue.")
 
@@ -154,6 +390,9 @@ def load_river_segments() -> gpd.GeoDataFrame:
     if missing:
         raise ValueError(f"River shapefile missing columns: {', '.join(missing)}")
 
+    if not contact_only:
+        return rivers
+
     rivers[gvfk_col] = rivers[gvfk_col].astype(str).str.strip()
     contact_col = COLUMN_MAPPINGS["rivers"]["contact"]
     valid_mask = rivers[gvfk_col] != ""
@@ -183,7 +422,7 @@ def load_flow_scenarios() -> pd.DataFrame:
     if not RIVER_FLOW_POINTS_PATH.exists():
         raise FileNotFoundError(f"Flow data not found: {RIVER_FLOW_POINTS_PATH}")
 
-    qpoints = gpd.read_file(RIVER_FLOW_POINTS_PATH, layer=RIVER_FLOW_POINTS_LAYER)
+    qpoints = read_layer(RIVER_FLOW_POINTS_PATH, RIVER_FLOW_POINTS_LAYER)
 
     river_id_col = COLUMN_MAPPINGS["flow_points"]["river_id"]
 
@@ -266,7 +505,11 @@ def apply_sampling(df, id_column: str = "Lokalitet_ID", seed: int = 42):
 
 __all__ = [
     "apply_sampling",
+    "clear_layer_cache",
+    "read_layer",
+    "load_step5_combinations",
     "load_step5_results",
+    "load_site_substances",
     "load_site_geometries",
     "load_gvfk_layer_mapping",
     "load_river_segments",
@@ -289,7 +532,7 @@ def load_flow_scenarios_extended() -> tuple[pd.DataFrame, gpd.GeoDataFrame]:
     if not RIVER_FLOW_POINTS_PATH.exists():
         raise FileNotFoundError(f"Flow data not found: {RIVER_FLOW_POINTS_PATH}")
 
-    qpoints = gpd.read_file(RIVER_FLOW_POINTS_PATH, layer=RIVER_FLOW_POINTS_LAYER)
+    qpoints = read_layer(RIVER_FLOW_POINTS_PATH, RIVER_FLOW_POINTS_LAYER)
 
     river_id_col = COLUMN_MAPPINGS["flow_points"]["river_id"]
 
@@ -333,3 +576,197 @@ def load_flow_scenarios_extended() -> tuple[pd.DataFrame, gpd.GeoDataFrame]:
     return flow_max, qpoints
 
 __all__.append("load_flow_scenarios_extended")
+
+
+# ------------------------------------------------------------------
+# Step 6 flow selection (segment -> Q-point -> flow)
+# ------------------------------------------------------------------
+
+def flow_selection_input_hash() -> str:
+    """Hash of the inputs behind the Step 6 flow selection.
+
+    Covers the river and Q-point sources (file names, sizes and modification
+    times - a .gdb is a directory of files), STEP6_FLOW_SELECTION_MODE,
+    FLOW_SCENARIO_COLUMNS and STEP6_NETWORK_SNAP_TOLERANCE_M (network used for
+    the linear referencing of the downstream mode).
+    """
+    digest = hashlib.sha1()
+    digest.update(
+        f"{STEP6_FLOW_SELECTION_MODE}|{sorted(FLOW_SCENARIO_COLUMNS.items())}|"
+        f"{STEP6_NETWORK_SNAP_TOLERANCE_M}".encode("utf-8")
+    )
+    for source in (Path(RIVERS_PATH), Path(RIVER_FLOW_POINTS_PATH)):
+        files = sorted(p for p in source.rglob("*") if p.is_file()) if source.is_dir() else [source]
+        for path in files:
+            if not path.exists():
+                continue
+            stat = path.stat()
+            name = path.relative_to(source.parent).as_posix()
+            digest.update(f"{name}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def load_flow_selection() -> pd.DataFrame | None:
+    """Load the segment -> Q-point -> flow selection written by Step 6.
+
+    Returns:
+        DataFrame with one row per segment and flow scenario (Nearest_River_FID,
+        Nearest_River_ov_id, Flow_Scenario, Qpoint_Index, Flow_m3_s, Flow_Source,
+        Selection_Mode, Is_Fallback, Input_Hash). Qpoint_Index is the row position
+        in the Q-point layer. None if the table is missing or was built from other
+        river/Q-point inputs or another flow selection mode.
+    """
+    selection_path = get_output_path("step6_flow_selection")
+    if not selection_path.exists():
+        print(f"NOTE: Step 6 flow selection not found ({selection_path}) - run Step 6 first.")
+        return None
+
+    selection = pd.read_csv(
+        selection_path,
+        encoding="utf-8",
+        dtype={"Nearest_River_ov_id": str, "Input_Hash": str},
+    )
+    if (selection["Input_Hash"] != flow_selection_input_hash()).any():
+        print(
+            "NOTE: Step 6 flow selection is out of date (river/Q-point data or "
+            "STEP6_FLOW_SELECTION_MODE changed) - run Step 6 again."
+        )
+        return None
+
+    selection["Qpoint_Index"] = selection["Qpoint_Index"].astype("Int64")
+    return selection
+
+__all__ += ["flow_selection_input_hash", "load_flow_selection"]
+
+
+# ------------------------------------------------------------------
+# Daily discharge series per Q-point (optional Step 6 input)
+# ------------------------------------------------------------------
+
+DAILY_FLOW_CHUNK_DAYS = 366
+
+
+def _daily_flow_chunks(path: Path, chunk_days: int):
+    """Yield the daily flow table in blocks of days (CSV or Parquet)."""
+    if path.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_days):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_days, encoding="utf-8")
+
+
+def _daily_flow_days(source: Path) -> np.ndarray:
+    """Date column of the daily flow table as datetime64[D], in file order."""
+    if source.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+
+        values = pq.read_table(source, columns=["Date"]).column("Date").to_pandas()
+    else:
+        values = pd.concat(
+            pd.read_csv(source, usecols=["Date"], chunksize=100_000, encoding="utf-8"),
+            ignore_index=True,
+        )["Date"]
+    return pd.to_datetime(values, errors="coerce").to_numpy().astype("datetime64[D]")
+
+
+def _build_daily_flow_cache(source: Path, cache_path: Path, index_path: Path) -> None:
+    """
+    Write the (Q-points × days) cache from the wide daily table, one block of days at a time.
+
+    Rows may come in any order: each day is written to its column on a gap-free
+    calendar from the first to the last date. Days missing from the table stay
+    NaN (they count as no data and break exceedance runs); duplicate or
+    unparseable dates raise a ValueError.
+    """
+    if source.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+
+        columns = pq.ParquetFile(source).metadata.schema.names
+    else:
+        columns = pd.read_csv(source, nrows=0, encoding="utf-8").columns.tolist()
+
+    qpoint_columns = [column for column in columns if column != "Date" and not str(column).startswith("__")]
+    try:
+        qpoint_index = np.array([int(column) for column in qpoint_columns], dtype=np.int64)
+    except ValueError as exc:
+        raise ValueError(
+            f"Daily flow columns must be Date + Qpoint_Index per Q-point ({source}): {exc}"
+        ) from exc
+
+    days = _daily_flow_days(source)
+    if not len(days):
+        raise ValueError(f"Daily flow table has no rows ({source})")
+    if np.isnat(days).any():
+        raise ValueError(
+            f"Daily flow table has {int(np.isnat(days).sum())} rows without a valid Date ({source})"
+        )
+    unique_days, counts = np.unique(days, return_counts=True)
+    if (counts > 1).any():
+        duplicates = unique_days[counts > 1]
+        raise ValueError(
+            f"Daily flow table has {len(duplicates)} duplicate dates ({source}), e.g. "
+            + ", ".join(str(day) for day in duplicates[:5])
+        )
+
+    # Gap-free calendar; column of each source row on it
+    dates = np.arange(unique_days[0], unique_days[-1] + np.timedelta64(1, "D"))
+    day_column = (days - dates[0]).astype(np.int64)
+    missing = np.setdiff1d(np.arange(len(dates)), day_column)
+
+    ensure_cache_directory()
+    flows = np.lib.format.open_memmap(
+        cache_path, mode="w+", dtype=np.float64, shape=(len(qpoint_columns), len(dates))
+    )
+    if missing.size:
+        print(f"  NOTE: {missing.size:,} days missing in {source.name} - stored as NaN")
+        flows[:, missing] = np.nan
+    start = 0
+    for chunk in _daily_flow_chunks(source, DAILY_FLOW_CHUNK_DAYS):
+        stop = start + len(chunk)
+        flows[:, day_column[start:stop]] = chunk[qpoint_columns].to_numpy(dtype=np.float64).T
+        start = stop
+    flows.flush()
+    del flows
+    np.savez(index_path, qpoint_index=qpoint_index, dates=dates, source=str(source.resolve()))
+
+
+def load_daily_flow_series(
+    source_path: Path | None = None,
+) -> tuple[np.ndarray, np.ndarray, pd.DatetimeIndex] | None:
+    """Load the daily discharge per Q-point as a read-only memory map.
+
+    The source table (RIVER_DAILY_FLOW_PATH) is converted once to
+    RIVER_DAILY_FLOW_CACHE - one row of days per Q-point - so Step 6 reads only
+    the Q-points it needs.
+
+    Returns:
+        (flows, qpoint_index, dates): flows is a (Q-points × days) float64 memmap
+        in m³/s, qpoint_index the Qpoint_Index per row and dates the days.
+        None if no daily flow source is configured.
+    """
+    source_path = source_path or RIVER_DAILY_FLOW_PATH
+    if source_path is None:
+        return None
+    source = Path(source_path)
+    if not source.exists():
+        raise FileNotFoundError(f"Daily flow data not found: {source}")
+
+    cache_path = Path(RIVER_DAILY_FLOW_CACHE)
+    index_path = cache_path.with_suffix(".index.npz")
+    cache_valid = is_cache_valid(cache_path, source) and is_cache_valid(index_path, source)
+    if cache_valid:
+        with np.load(index_path) as index:
+            cache_valid = str(index["source"]) == str(source.resolve())
+    if not cache_valid:
+        print(f"Building daily flow cache from {source.name}...")
+        _build_daily_flow_cache(source, cache_path, index_path)
+
+    flows = np.load(cache_path, mmap_mode="r")
+    with np.load(index_path) as index:
+        qpoint_index = index["qpoint_index"]
+        dates = pd.DatetimeIndex(index["dates"])
+    return flows, qpoint_index, dates
+
+__all__.append("load_daily_flow_series")
@@ -147,6 +147,7 @@ def create_denmark_map():
         GRUNDVAND_PATH, GRUNDVAND_LAYER_NAME,
         COLUMN_MAPPINGS, get_output_path, DATA_DIR,
     )
+    from data_loaders import load_step5_combinations
 
     print("\n" + "=" * 55)
     print("REPORT MAP — All GVFKs vs Trin 5b Results")
@@ -184,7 +185,7 @@ def create_denmark_map():
     p3_gdf = gpd.read_file(get_output_path("step3_gvfk_polygons")).to_crs(crs)
     p3_gdf["geometry"] = p3_gdf.geometry.simplify(50, preserve_topology=True)
 
-    df5b  = pd.read_csv(get_output_path("step5b_compound_combinations"))
+    df5b  = load_step5_combinations(columns=["GVFK"])
     ids5b = set(df5b["GVFK"])
     gdf5b = clip_bornholm(p3_gdf[p3_gdf[gvfk_col].isin(ids5b)].copy())
 
@@ -296,6 +297,7 @@ def _load_map_data():
         GRUNDVAND_PATH, GRUNDVAND_LAYER_NAME,
         COLUMN_MAPPINGS, get_output_path, DATA_DIR,
     )
+    from data_loaders import load_step5_combinations
 
     gvfk_col = COLUMN_MAPPINGS["grundvand"]["gvfk_id"]
 
@@ -327,7 +329,7 @@ def _load_map_data():
     print("[4/5] Trin 5b GVFKs...")
     p3_gdf = gpd.read_file(get_output_path("step3_gvfk_polygons")).to_crs(crs)
     p3_gdf["geometry"] = p3_gdf.geometry.simplify(50, preserve_topology=True)
-    df5b  = pd.read_csv(get_output_path("step5b_compound_combinations"))
+    df5b  = load_step5_combinations(columns=["GVFK"])
     ids5b = set(df5b["GVFK"])
     gdf5b = clip_bornholm(p3_gdf[p3_gdf[gvfk_col].isin(ids5b)].copy())
     gdf5b = assign_regions(gdf5b, regions, gvfk_col)
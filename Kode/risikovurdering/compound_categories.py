@@ -196,7 +196,7 @@ COMPOUND_CATEGORIES = {
 # Helper functions
 # -------------------------------------------------------------------
 
-def _normalize(text: str) -> str:
+def normalize_text(text: str) -> str:
     """Normalize text for matching: remove accents, lowercase."""
     if not isinstance(text, str):
         return ''
@@ -243,12 +243,42 @@ def categorize_substance(substance_text: str) -> tuple[str, float]:
         >>> categorize_substance("unknown stuff")
         ('ANDRE', 500.0)  # Fallback
     """
-    normalized = _normalize(substance_text)
+    category, distance, _ = categorize_substance_with_source(substance_text)
+    return category, distance
+
+
+@lru_cache(maxsize=2048)
+def categorize_substance_with_source(substance_text: str) -> tuple[str, float, str | None]:
+    """
+    Same as categorize_substance(), but also report where the distance came from.
+
+    Returns:
+        Tuple of (category_name, distance_meters, compound_key) where compound_key
+        is the COMPOUND_SPECIFIC_DISTANCES key that set the distance, or None if
+        the category default (or ANDRE fallback) was used.
+    """
+    return categorize_with_rules(
+        substance_text, COMPOUND_CATEGORIES, COMPOUND_SPECIFIC_DISTANCES, DEFAULT_DISTANCE
+    )
+
+
+def categorize_with_rules(
+    substance_text: str,
+    categories: Dict[str, dict],
+    specific_distances: Dict[str, float],
+    default_distance: float = DEFAULT_DISTANCE,
+) -> tuple[str, float, str | None]:
+    """
+    categorize_substance_with_source() for an explicit rule set.
+
+    Used to evaluate saved (older) rule sets, e.g. by step5_rule_impact.
+    """
+    normalized = normalize_text(substance_text)
     if not normalized:
-        return 'ANDRE', DEFAULT_DISTANCE
+        return 'ANDRE', float(default_distance), None
 
     # Step 1: Check compound-specific overrides
-    for compound, specific_distance in COMPOUND_SPECIFIC_DISTANCES.items():
+    for compound, specific_distance in specific_distances.items():
         if compound == 'benzen':
             # Special case: Only match pure "benzen", not compounds like "trichlorbenzen"
             if (normalized == 'benzen' or
@@ -257,22 +287,22 @@ def categorize_substance(substance_text: str) -> tuple[str, float]:
                 normalized.startswith('benzen,') or
                 normalized.startswith('benzen;')):
                 # Find which category it belongs to
-                for category, info in COMPOUND_CATEGORIES.items():
-                    if any(_normalize(kw) in normalized for kw in info['keywords']):
-                        return category, float(specific_distance)
+                for category, info in categories.items():
+                    if any(normalize_text(kw) in normalized for kw in info['keywords']):
+                        return category, float(specific_distance), compound
         else:
             # For other compounds, simple substring matching
             if compound in normalized:
-                for category, info in COMPOUND_CATEGORIES.items():
-                    if any(_normalize(kw) in normalized for kw in info['keywords']):
-                        return category, float(specific_distance)
+                for category, info in categories.items():
+                    if any(normalize_text(kw) in normalized for kw in info['keywords']):
+                        return category, float(specific_distance), compound
 
     # Step 2: Check general category keywords (longest keyword match wins)
     matches = []
-    for category, info in COMPOUND_CATEGORIES.items():
+    for category, info in categories.items():
         for keyword in info['keywords']:
             # Normalize keyword to match normalized input (handles Danish æøå)
-            normalized_keyword = _normalize(keyword)
+            normalized_keyword = normalize_text(keyword)
             if normalized_keyword and normalized_keyword in normalized:
                 matches.append((len(normalized_keyword), category, info['distance_m']))
 
@@ -280,7 +310,7 @@ def categorize_substance(substance_text: str) -> tuple[str, float]:
         # Sort by keyword length (longest match = most specific)
         matches.sort(reverse=True)
         _, category, distance = matches[0]
-        return category, float(distance)
+        return category, float(distance), None
 
     # Step 3: Fallback to ANDRE category
-    return 'ANDRE', DEFAULT_DISTANCE
+    return 'ANDRE', float(default_distance), None
@@ -0,0 +1,266 @@
+"""
+ANDRE Fuzzy Matching - Trigram Review of Uncategorized Substances
+==================================================================
+
+Substances that match no keyword in COMPOUND_CATEGORIES fall back to ANDRE
+(500m default). Many are spelling variants of existing keywords (missing
+hyphens, Danish/English forms, "klor" vs "chlor"). This tool proposes the most
+similar keyword and category for every ANDRE substance.
+
+Method:
+    Every keyword and every ANDRE substance (the full string and each word in it)
+    is turned into a vector of character trigrams. With all vectors
+    L2-normalized, one sparse matrix product gives the cosine similarity of all
+    text/keyword pairs at once - no pairwise string comparisons.
+
+NOT part of the main workflow - run manually after Step 3 to review ANDRE.
+
+Usage:
+    python -m risikovurdering.optional_analysis.andre_fuzzy_matching
+
+Outputs:
+    step5_andre_fuzzy_review.csv - one row per ANDRE substance with the best
+    candidate category/keyword, similarity score and usage counts. Fill in the
+    Accept column and fold accepted keywords back into COMPOUND_CATEGORIES.
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Add parent directories to path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from config import get_output_path
+from data_loaders import load_site_substances
+from risikovurdering.compound_categories import (
+    COMPOUND_CATEGORIES,
+    COMPOUND_SPECIFIC_DISTANCES,
+    categorize_substance,
+    get_category_distance,
+    normalize_text,
+)
+
+NGRAM_SIZE = 3
+MIN_TOKEN_LENGTH = 4  # Shorter words (e.g. "i", "og", "sum") carry no signal
+MIN_SIMILARITY = 0.3  # Candidates below this score are not reported
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+# ===========================================================================
+# Trigram index
+# ===========================================================================
+
+
+def _ngrams(text: str, n: int = NGRAM_SIZE) -> list[str]:
+    """Character n-grams of a normalized text, padded so short words still match."""
+    padded = f" {text} "
+    return [padded[i : i + n] for i in range(max(len(padded) - n + 1, 1))]
+
+
+def build_keyword_vocabulary() -> pd.DataFrame:
+    """
+    Normalized keyword vocabulary (Keyword, Category) from COMPOUND_CATEGORIES.
+
+    Compound-specific overrides are included under the category their keyword
+    already belongs to.
+    """
+    records = []
+    for category, info in COMPOUND_CATEGORIES.items():
+        for keyword in info["keywords"]:
+            records.append((normalize_text(keyword).strip(), category))
+    for compound in COMPOUND_SPECIFIC_DISTANCES:
+        category, _ = categorize_substance(compound)
+        if category != "ANDRE":
+            records.append((normalize_text(compound).strip(), category))
+
+    vocabulary = pd.DataFrame(records, columns=["Keyword", "Category"])
+    vocabulary = vocabulary[vocabulary["Keyword"] != ""]
+    return vocabulary.drop_duplicates("Keyword").reset_index(drop=True)
+
+
+class TrigramIndex:
+    """Sparse, L2-normalized trigram vectors of a fixed set of texts."""
+
+    def __init__(self, texts: Iterable[str]):
+        self.texts = list(texts)
+        self.ngram_ids: dict[str, int] = {}
+        self.matrix = self._vectorize(self.texts, grow=True)
+
+    def _vectorize(self, texts: list[str], grow: bool = False) -> sparse.csr_matrix:
+        rows, cols = [], []
+        for row, text in enumerate(texts):
+            for gram in set(_ngrams(text)):
+                col = self.ngram_ids.get(gram)
+                if col is None:
+                    if not grow:
+                        continue  # n-gram unknown to the index -> cannot match
+                    col = self.ngram_ids[gram] = len(self.ngram_ids)
+                rows.append(row)
+                cols.append(col)
+
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(len(texts), len(self.ngram_ids)),
+        )
+        # Normalize by the full n-gram count of each text (incl. unknown n-grams)
+        lengths = np.array([len(set(_ngrams(text))) for text in texts], dtype=float)
+        scale = np.divide(1.0, np.sqrt(lengths), out=np.zeros_like(lengths), where=lengths > 0)
+        return sparse.diags(scale) @ matrix
+
+    def similarity(self, queries: list[str]) -> sparse.coo_matrix:
+        """Cosine similarity of every query to every indexed text (sparse)."""
+        return (self._vectorize(queries) @ self.matrix.T).tocoo()
+
+
+# ===========================================================================
+# ANDRE candidates
+# ===========================================================================
+
+
+def _query_texts(substances: pd.Series) -> pd.DataFrame:
+    """Full normalized string plus each word of it; one row per (substance, query)."""
+    normalized = substances.map(normalize_text).str.strip()
+    queries = pd.DataFrame({"Substance": substances.to_numpy(), "Query": normalized.to_numpy()})
+
+    words = queries.assign(Query=queries["Query"].str.split(_TOKEN_SPLIT)).explode("Query")
+    words = words[words["Query"].str.len() >= MIN_TOKEN_LENGTH]
+
+    queries = pd.concat([queries, words], ignore_index=True)
+    return queries[queries["Query"] != ""].drop_duplicates(ignore_index=True)
+
+
+def propose_andre_candidates(
+    andre_substances: pd.Series, vocabulary: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """
+    Best and runner-up (different category) keyword for each ANDRE substance.
+
+    Args:
+        andre_substances: Distinct substance strings categorized as ANDRE
+        vocabulary: Keyword table from build_keyword_vocabulary()
+
+    Returns:
+        One row per substance with Best_Category, Best_Keyword, Matched_Text,
+        Similarity and Runner_Up_Category / Runner_Up_Similarity.
+    """
+    if vocabulary is None:
+        vocabulary = build_keyword_vocabulary()
+    andre_substances = pd.Series(andre_substances).dropna().drop_duplicates()
+
+    queries = _query_texts(andre_substances)
+    index = TrigramIndex(vocabulary["Keyword"])
+    scores = index.similarity(queries["Query"].tolist())
+
+    pairs = pd.DataFrame(
+        {
+            "Substance": queries["Substance"].to_numpy()[scores.row],
+            "Matched_Text": queries["Query"].to_numpy()[scores.row],
+            "Best_Keyword": vocabulary["Keyword"].to_numpy()[scores.col],
+            "Best_Category": vocabulary["Category"].to_numpy()[scores.col],
+            "Similarity": scores.data,
+        }
+    )
+    pairs = pairs[pairs["Similarity"] >= MIN_SIMILARITY]
+
+    # Best pair per (substance, category), then rank categories per substance
+    per_category = pairs.sort_values("Similarity", ascending=False, kind="stable")
+    per_category = per_category.drop_duplicates(["Substance", "Best_Category"])
+    best = per_category.drop_duplicates("Substance")
+    runner_up = (
+        per_category[~per_category.index.isin(best.index)]
+        .drop_duplicates("Substance")
+        .set_index("Substance")
+    )
+
+    candidates = pd.DataFrame({"Substance": andre_substances.to_numpy()})
+    candidates = candidates.merge(best, on="Substance", how="left")
+    candidates["Runner_Up_Category"] = candidates["Substance"].map(runner_up["Best_Category"])
+    candidates["Runner_Up_Similarity"] = candidates["Substance"].map(runner_up["Similarity"])
+    candidates["Similarity"] = candidates["Similarity"].round(3)
+    candidates["Runner_Up_Similarity"] = candidates["Runner_Up_Similarity"].round(3)
+    candidates["Proposed_Distance_m"] = candidates["Best_Category"].map(
+        lambda category: get_category_distance(category) if isinstance(category, str) else np.nan
+    )
+    return candidates
+
+
+def build_andre_review_table(site_substances: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Review table of all ANDRE substances in the Step 3 site-substance table.
+
+    Returns:
+        Candidates from propose_andre_candidates() plus Site_GVFK_Rows and
+        Sites counts, sorted by usage, with an empty Accept column for review.
+    """
+    if site_substances is None:
+        site_substances = load_site_substances()
+        if site_substances is None:
+            raise FileNotFoundError(
+                "Step 3 site-substance table not found - run Step 3 first"
+            )
+
+    substances = site_substances["Substance"].astype(str)
+    distinct = pd.Series(substances.unique())
+    is_andre = distinct.map(lambda s: categorize_substance(s)[0] == "ANDRE")
+    andre = distinct[is_andre.to_numpy()]
+
+    usage = (
+        site_substances.assign(Substance=substances)[substances.isin(andre).to_numpy()]
+        .groupby("Substance")
+        .agg(Site_GVFK_Rows=("Lokalitet_ID", "size"), Sites=("Lokalitet_ID", "nunique"))
+    )
+
+    review = propose_andre_candidates(andre)
+    review = review.join(usage, on="Substance")
+    review["Accept"] = ""
+    review = review.sort_values(
+        ["Site_GVFK_Rows", "Similarity"], ascending=[False, False], na_position="last"
+    )
+    columns = [
+        "Substance",
+        "Site_GVFK_Rows",
+        "Sites",
+        "Best_Category",
+        "Best_Keyword",
+        "Matched_Text",
+        "Similarity",
+        "Proposed_Distance_m",
+        "Runner_Up_Category",
+        "Runner_Up_Similarity",
+        "Accept",
+    ]
+    return review[columns].reset_index(drop=True)
+
+
+def run_andre_fuzzy_review(save: bool = True) -> pd.DataFrame:
+    """Build the ANDRE review table, print a summary and save it as CSV."""
+    print("=" * 70)
+    print("ANDRE FUZZY MATCHING (trigram index)")
+    print("=" * 70)
+
+    review = build_andre_review_table()
+    matched = review["Best_Category"].notna()
+
+    print(f"ANDRE substances: {len(review):,} ({review['Site_GVFK_Rows'].sum():,} site-GVFK rows)")
+    print(f"With candidate (similarity >= {MIN_SIMILARITY}): {matched.sum():,}")
+    for category, count in review.loc[matched, "Best_Category"].value_counts().items():
+        print(f"  {category:32}: {count:5,}")
+
+    if save:
+        output_path = get_output_path("step5_andre_fuzzy_review")
+        review.to_csv(output_path, index=False, encoding="utf-8")
+        print(f"\n✓ Review table saved: {output_path}")
+    return review
+
+
+if __name__ == "__main__":
+    run_andre_fuzzy_review()
@@ -16,6 +16,7 @@ from config import (
     WORKFLOW_SETTINGS,
     get_output_path,
 )
+from data_loaders import load_step5_combinations
 
 
 def create_html_table(data, headers, title, filename, output_dir):
@@ -662,7 +663,7 @@ def create_progression_plot(figures_path, required_files):
         # Step 5b: Compound-specific assessment
         step5b_path = get_output_path("step5_compound_detailed_combinations")
         if os.path.exists(step5b_path):
-            step5b_df = pd.read_csv(step5b_path)
+            step5b_df = load_step5_combinations(columns=["GVFK"])
             step5b_gvfks = step5b_df["GVFK"].nunique()
         else:
             raise FileNotFoundError(f"Cannot find Step 5b file: {step5b_path}")
@@ -816,7 +817,7 @@ def create_sites_progression_plot(figures_path):
 
         # Step 5b: Compound-specific
         if os.path.exists(step5b_path):
-            step5b_df = pd.read_csv(step5b_path)
+            step5b_df = load_step5_combinations(columns=["Lokalitet_ID"])
             step5b_sites = step5b_df["Lokalitet_ID"].nunique()
             sites_counts.append(step5b_sites)
             stages.append("Stofspecifik risiko\n(Trin 5b)")
@@ -913,7 +914,7 @@ def create_gvfk_cascade_table_from_data():
             # Load compound sites if available
             compound_path = get_output_path("step5_compound_detailed_combinations")
             if os.path.exists(compound_path):
-                compound_sites = pd.read_csv(compound_path)
+                compound_sites = load_step5_combinations(columns=["GVFK"])
                 compound_gvfks = compound_sites["GVFK"].dropna().nunique()
                 compound_pct = (compound_gvfks / total_gvfk) * 100
                 print(
@@ -936,7 +937,6 @@ def create_compound_category_table_from_data():
     """Create enhanced compound category analysis table for presentation with threshold details."""
     try:
         from config import get_output_path
-        import pandas as pd
 
         print("\n[LAB] TRIN 5b: STOFKATEGORI ANALYSE - ENHANCED FOR PRESENTATION")
         print("=" * 100)
@@ -951,7 +951,9 @@ def create_compound_category_table_from_data():
             print("Step 5 compound results not found - run Step 5 first")
             return
 
-        combinations_df = pd.read_csv(combinations_path)
+        combinations_df = load_step5_combinations(
+            columns=["Lokalitet_ID", "Qualifying_Category", "Category_Threshold_m"]
+        )
 
         # Define base thresholds and landfill overrides for reference
         base_thresholds = {
@@ -1128,7 +1130,16 @@ def create_losseplads_subcategory_table_from_data():
             print("Step 5 compound results not found - run Step 5 first")
             return
 
-        combinations_df = pd.read_csv(combinations_path)
+        combinations_df = load_step5_combinations(
+            columns=[
+                "Lokalitet_ID",
+                "Qualifying_Category",
+                "Category_Threshold_m",
+                "Landfill_Override_Applied",
+                "Original_Category",
+                "Losseplads_Subcategory",
+            ]
+        )
 
         # PART 1: LANDFILL OVERRIDE THRESHOLDS TABLE
         print("\n1. LOSSEPLADS-SPECIFIKKE TÃ†RSKLER")
@@ -1432,11 +1443,10 @@ def create_threshold_decision_tree_table():
 
     try:
         from config import get_output_path
-        import pandas as pd
 
         combinations_path = get_output_path("step5_compound_detailed_combinations")
         if os.path.exists(combinations_path):
-            combinations_df = pd.read_csv(combinations_path)
+            combinations_df = load_step5_combinations(columns=["Landfill_Override_Applied"])
 
             total_combinations = len(combinations_df)
 
@@ -1503,7 +1513,6 @@ def create_losseplads_override_impact(figures_path):
     """Create a chart showing the impact of Losseplads override by category using real data."""
     try:
         from config import get_output_path
-        import pandas as pd
 
         # Load actual override data
         combinations_path = get_output_path("step5_compound_detailed_combinations")
@@ -1513,7 +1522,15 @@ def create_losseplads_override_impact(figures_path):
             )
             return
 
-        combinations_df = pd.read_csv(combinations_path)
+        combinations_df = load_step5_combinations(
+            columns=[
+                "Lokalitet_ID",
+                "Original_Category",
+                "Category_Threshold_m",
+                "Landfill_Override_Applied",
+            ],
+            filters=[("Landfill_Override_Applied", "==", True)],
+        )
 
         # Get landfill overrides (where Landfill_Override_Applied == True)
         if "Landfill_Override_Applied" not in combinations_df.columns:
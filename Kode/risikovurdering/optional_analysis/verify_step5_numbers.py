@@ -10,6 +10,12 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import get_output_path
+from data_loaders import load_step5_combinations
+from risikovurdering.step5_utils import (
+    ensure_landfill_flags,
+    has_substance_tokens,
+    is_landfill_site,
+)
 
 print("=" * 80)
 print("STEP 5 NUMBERS VERIFICATION")
@@ -32,7 +38,7 @@ print(f"Total unique GVFKs: {total_unique_gvfks:,}")
 # Calculate sites within 500m BEFORE substance filtering
 print("\n2. SITES WITHIN 500M (BEFORE SUBSTANCE FILTERING):")
 print("-" * 80)
-within_500m = df[df["Distance_to_River_m"] <= 500]
+within_500m = df[df["Distance_to_River_m"] <= 500].copy()
 within_500m_combinations = len(within_500m)
 within_500m_sites = within_500m["Lokalitet_ID"].nunique()
 within_500m_gvfks = within_500m["GVFK"].nunique()
@@ -47,50 +53,20 @@ print("\n3. SUBSTANCE/LANDFILL DATA AVAILABILITY:")
 print("-" * 80)
 
 
-def has_substance_data(row):
-    """Check if site has substance data"""
-    substances_str = str(row.get("Lokalitetensstoffer", ""))
-    has_substance = not (
-        pd.isna(substances_str)
-        or substances_str.strip() == ""
-        or substances_str == "nan"
-    )
-    return has_substance
-
-
-def has_landfill_keywords(text):
-    """Check if text contains landfill keywords"""
-    if pd.isna(text):
-        return False
-    text_lower = str(text).lower()
-    landfill_keywords = [
-        "losseplads",
-        "affald",
-        "depon",
-        "deponi",
-        "fyld",
-        "fyldplads",
-        "skraldeplads",
-    ]
-    return any(keyword in text_lower for keyword in landfill_keywords)
-
-
-def has_qualifying_data(row):
-    """Check if site has substance or landfill keywords"""
-    has_substance = has_substance_data(row)
-
-    branch_text = row.get("Lokalitetensbranche", "")
-    activity_text = row.get("Lokalitetensaktivitet", "")
-    has_landfill = has_landfill_keywords(branch_text) or has_landfill_keywords(
-        activity_text
-    )
+def has_substance_data(frame):
+    """At least one substance token (shared Step 5 check)"""
+    return has_substance_tokens(frame["Lokalitetensstoffer"])
+
 
-    return has_substance or has_landfill
+def has_qualifying_data(frame):
+    """Substance data OR landfill keywords (shared Step 5 detector)"""
+    return has_substance_data(frame) | is_landfill_site(frame)
 
 
-# Apply to full dataset
-df["Has_Qualifying_Data"] = df.apply(has_qualifying_data, axis=1)
-df["Has_Substance_Data"] = df.apply(has_substance_data, axis=1)
+# Apply to full dataset (reuses Is_Landfill_* flags written by Step 4)
+df = ensure_landfill_flags(df)
+df["Has_Qualifying_Data"] = has_qualifying_data(df)
+df["Has_Substance_Data"] = has_substance_data(df)
 
 qualifying = df[df["Has_Qualifying_Data"] == True]
 parked = df[df["Has_Qualifying_Data"] == False]
@@ -109,8 +85,9 @@ print(f"  Unique GVFKs: {parked['GVFK'].nunique():,}")
 print("\n4. WITHIN 500M - BREAKDOWN BY DATA AVAILABILITY:")
 print("-" * 80)
 
-# Need to reapply the function to within_500m dataframe
-within_500m["Has_Qualifying_Data"] = within_500m.apply(has_qualifying_data, axis=1)
+# within_500m was sliced before the flags were added
+within_500m = ensure_landfill_flags(within_500m)
+within_500m["Has_Qualifying_Data"] = has_qualifying_data(within_500m)
 
 within_500m_qualifying = within_500m[within_500m["Has_Qualifying_Data"] == True]
 within_500m_parked = within_500m[within_500m["Has_Qualifying_Data"] == False]
@@ -131,7 +108,7 @@ print("-" * 80)
 
 step5b_file = get_output_path("step5_compound_detailed_combinations")
 if os.path.exists(step5b_file):
-    df_compound = pd.read_csv(step5b_file)
+    df_compound = load_step5_combinations(columns=["Lokalitet_ID", "GVFK"])
     compound_combinations = len(df_compound)
     compound_sites = df_compound["Lokalitet_ID"].nunique()
     compound_gvfks = df_compound["GVFK"].dropna().nunique()
@@ -336,6 +336,7 @@ def create_distance_histograms(unique_df, all_combinations_df, figures_path):
 def create_step5_plots():
     """Create all Step 5 risk assessment visualizations."""
     from config import get_output_path, get_visualization_path, CATEGORY_DISPLAY_NAMES
+    from data_loaders import load_step5_combinations
 
     figures_path = get_visualization_path("step5")
 
@@ -345,7 +346,18 @@ def create_step5_plots():
         print("  ⚠ Step 5b compound data not found")
         return
 
-    compound_df = pd.read_csv(compound_path)
+    # Only the columns the plots below use
+    compound_df = load_step5_combinations(
+        columns=[
+            "Lokalitet_ID",
+            "Distance_to_River_m",
+            "Qualifying_Category",
+            "Category_Threshold_m",
+            "Landfill_Override_Applied",
+            "Lokalitetensbranche",
+            "Lokalitetensaktivitet",
+        ]
+    )
 
     # Apply standardized category names
     if 'Qualifying_Category' in compound_df.columns:
@@ -687,6 +699,7 @@ def create_landfill_analysis_plots(compound_df, figures_path):
 def create_step5_comparison_plot(figures_path):
     """Create plot comparing Step 5a (general) vs Step 5b (compound-specific)."""
     from config import get_output_path
+    from data_loaders import load_step5_combinations
 
     # Load both datasets
     step5a_path = get_output_path("step5_high_risk_sites")
@@ -697,7 +710,7 @@ def create_step5_comparison_plot(figures_path):
         return
 
     step5a_df = pd.read_csv(step5a_path)
-    step5b_df = pd.read_csv(step5b_path)
+    step5b_df = load_step5_combinations(columns=["Lokalitet_ID", "GVFK"])
 
     # Calculate statistics
     step5a_sites = step5a_df['Lokalitet_ID'].nunique()
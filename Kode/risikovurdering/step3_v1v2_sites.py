@@ -13,7 +13,6 @@ import pandas as pd
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="pyogrio.raw")
 from shapely.errors import ShapelyDeprecationWarning
-from tqdm import tqdm
 from config import (
     COLUMN_MAPPINGS,
     GRUNDVAND_LAYER_NAME,
@@ -192,7 +191,24 @@ def run_step3(rivers_gvfk):
     # ========================================================================
     # SECTION 4: Combine and deduplicate
     # ========================================================================
-    v1v2_combined = _combine_and_deduplicate_v1v2(v1_processed, v2_processed)
+    # Normalized (site, GVFK, substance) table - the only place ";" lists are split
+    rivers_gvfk_set = set(rivers_gvfk)
+    site_substances, substance_dictionary = build_site_substance_table(
+        pd.concat(
+            [
+                v1_csv[v1_csv[gvfk_id_col].isin(rivers_gvfk_set)],
+                v2_csv[v2_csv[gvfk_id_col].isin(rivers_gvfk_set)],
+            ],
+            ignore_index=True,
+        ),
+        site_id_col,
+        gvfk_id_col,
+        substances_col,
+    )
+
+    v1v2_combined = _combine_and_deduplicate_v1v2(
+        v1_processed, v2_processed, site_substances, substance_dictionary
+    )
 
     # Get GVFKs with sites
     if 'Navn' in v1v2_combined.columns:
@@ -207,6 +223,11 @@ def run_step3(rivers_gvfk):
     # ========================================================================
     _save_step3_results(v1v2_combined, gvfk_with_v1v2_names, site_id_shp_col,
                        gvfk_id_col, grundvand_gvfk_col, len(rivers_gvfk))
+    if not v1v2_combined.empty:
+        _save_site_substance_table(
+            site_substances, substance_dictionary, v1v2_combined, site_id_shp_col, gvfk_id_col
+        )
+        _save_site_geometry_table(v1v2_combined, site_id_shp_col)
 
     report_completion(3)
 
@@ -254,13 +275,13 @@ def _process_v1v2_data(csv_data, geom_data, rivers_gvfk, locality_col, site_type
         print(f"  {site_type}: No sites in river-contact GVFKs")
         return []
 
-    # Aggregate by lokalitet-GVFK combination
-    agg_dict = {substances_col: lambda x: '; '.join(x.dropna().astype(str).unique())}
-    for col in filtered_csv.columns:
-        if col not in [csv_lokalitet_col, gvfk_id_col, substances_col]:
-            agg_dict[col] = 'first'
-
-    unique_csv = filtered_csv.groupby([csv_lokalitet_col, gvfk_id_col], as_index=False).agg(agg_dict)
+    # Aggregate by lokalitet-GVFK combination. Substances are not joined here:
+    # they come from the long site-substance table (see build_site_substance_table)
+    unique_csv = (
+        filtered_csv.drop(columns=[substances_col], errors='ignore')
+        .groupby([csv_lokalitet_col, gvfk_id_col], as_index=False)
+        .first()
+    )
 
     report_counts(f"{site_type}", sites=unique_sites, gvfks=len(filtered_csv[gvfk_id_col].unique()),
                  combinations=len(unique_csv), indent=1)
@@ -274,8 +295,14 @@ def _process_v1v2_data(csv_data, geom_data, rivers_gvfk, locality_col, site_type
     return []
 
 
-def _combine_and_deduplicate_v1v2(v1_processed, v2_processed):
-    """Combine V1 and V2 data and handle duplicate lokalitet-GVFK combinations."""
+def _combine_and_deduplicate_v1v2(v1_processed, v2_processed, site_substances=None,
+                                  substance_dictionary=None):
+    """Combine V1 and V2 data and handle duplicate lokalitet-GVFK combinations.
+
+    Sites present in both V1 and V2 for the same GVFK collapse to one row marked
+    'V1 og V2'. The Lokalitetensstoffer column is rebuilt from the long
+    site-substance table (union of V1 and V2 substances).
+    """
     if not v1_processed and not v2_processed:
         return gpd.GeoDataFrame()
 
@@ -284,51 +311,134 @@ def _combine_and_deduplicate_v1v2(v1_processed, v2_processed):
         return gpd.GeoDataFrame()
 
     v1v2_combined_raw = pd.concat(datasets, ignore_index=True)
+    key_cols = ['Lokalitet_', 'Navn']
 
     # Check for duplicates (same site in both V1 and V2)
-    all_combinations = v1v2_combined_raw.groupby(['Lokalitet_', 'Navn']).size()
-    duplicate_combinations = all_combinations[all_combinations > 1]
-
-    if len(duplicate_combinations) > 0:
-        # For duplicates, aggregate substances and mark as 'V1 og V2'
-        v1v2_deduped_list = []
-
-        # Iterate over ALL combinations (not just duplicates)
-        print(f"  Processing {len(all_combinations):,} site-GVFK combinations...")
-        for (lokalitet_id, gvfk_name), count in tqdm(all_combinations.items(), desc="  Deduplicating", unit="combo"):
-            subset = v1v2_combined_raw[
-                (v1v2_combined_raw['Lokalitet_'] == lokalitet_id) &
-                (v1v2_combined_raw['Navn'] == gvfk_name)
-            ]
-
-            if count > 1:
-                # Handle duplicates: aggregate substances
-                aggregated_record = subset.iloc[0:1].copy()
-
-                all_substances = []
-                for _, row in subset.iterrows():
-                    substances_str = str(row.get('Lokalitetensstoffer', ''))
-                    if pd.notna(substances_str) and substances_str.strip() and substances_str != 'nan':
-                        substances = [s.strip() for s in substances_str.split(';') if s.strip()]
-                        all_substances.extend(substances)
-
-                if all_substances:
-                    unique_substances = list(dict.fromkeys(all_substances))
-                    aggregated_record['Lokalitetensstoffer'] = '; '.join(unique_substances)
-
-                aggregated_record['Lokalitete'] = 'V1 og V2'
-                v1v2_deduped_list.append(aggregated_record)
-            else:
-                # Keep single record as is (V1-only or V2-only)
-                v1v2_deduped_list.append(subset)
-
-        v1v2_combined = pd.concat(v1v2_deduped_list, ignore_index=True)
+    combination_size = v1v2_combined_raw.groupby(key_cols)['Lokalitete'].transform('size')
+    duplicate_count = int((combination_size > 1).sum())
+
+    if duplicate_count > 0:
+        print(f"  Merging {duplicate_count:,} rows of sites listed in both V1 and V2...")
+        first_rows = ~v1v2_combined_raw.duplicated(subset=key_cols, keep='first')
+        v1v2_combined = v1v2_combined_raw[first_rows].copy()
+        v1v2_combined.loc[combination_size[first_rows] > 1, 'Lokalitete'] = 'V1 og V2'
+        v1v2_combined = v1v2_combined.sort_values(key_cols, kind='stable').reset_index(drop=True)
     else:
         v1v2_combined = v1v2_combined_raw.copy()
 
+    if site_substances is not None and substance_dictionary is not None:
+        joined = join_site_substances(site_substances, substance_dictionary)
+        joined = joined.rename(
+            columns={'Lokalitet_ID': 'Lokalitet_', 'GVFK': 'Navn'}
+        )
+        # Keep the column where it was (the merge appends it last)
+        column_order = list(v1v2_combined.columns)
+        if 'Lokalitetensstoffer' not in column_order:
+            column_order.append('Lokalitetensstoffer')
+        v1v2_combined = v1v2_combined.drop(
+            columns=['Lokalitetensstoffer'], errors='ignore'
+        ).merge(joined, on=key_cols, how='left')[column_order]
+        v1v2_combined['Lokalitetensstoffer'] = v1v2_combined['Lokalitetensstoffer'].fillna('')
+
     return v1v2_combined
 
 
+def build_site_substance_table(csv_data, site_id_col, gvfk_id_col, substances_col):
+    """
+    Split the semicolon-separated substance lists once into a long table.
+
+    Args:
+        csv_data: V1/V2 CSV rows (V1 rows first, so V1 substance order wins)
+        site_id_col, gvfk_id_col, substances_col: Input column names
+
+    Returns:
+        tuple: (site_substances, substance_dictionary)
+            site_substances: Lokalitet_ID, GVFK, Substance_ID - one row per unique
+                substance per site-GVFK combination, in first-seen order
+            substance_dictionary: Substance_ID, Substance - each text stored once
+    """
+    long = csv_data[[site_id_col, gvfk_id_col, substances_col]].dropna(subset=[substances_col])
+    long = long.rename(
+        columns={site_id_col: 'Lokalitet_ID', gvfk_id_col: 'GVFK', substances_col: 'Substance'}
+    )
+    long['Substance'] = long['Substance'].astype(str).str.split(';')
+    long = long.explode('Substance', ignore_index=True)
+    long['Substance'] = long['Substance'].str.strip()
+    long = long[(long['Substance'] != '') & (long['Substance'] != 'nan')]
+    long = long.drop_duplicates(subset=['Lokalitet_ID', 'GVFK', 'Substance'])
+
+    codes, texts = pd.factorize(long['Substance'], sort=True)
+    site_substances = pd.DataFrame({
+        'Lokalitet_ID': long['Lokalitet_ID'].to_numpy(),
+        'GVFK': long['GVFK'].to_numpy(),
+        'Substance_ID': codes.astype('int32'),
+    })
+    substance_dictionary = pd.DataFrame({
+        'Substance_ID': pd.RangeIndex(len(texts)).astype('int32'),
+        'Substance': texts,
+    })
+    return site_substances, substance_dictionary
+
+
+def join_site_substances(site_substances, substance_dictionary, separator='; '):
+    """Rebuild the joined Lokalitetensstoffer string per site-GVFK combination."""
+    texts = substance_dictionary.set_index('Substance_ID')['Substance']
+    named = site_substances.assign(Substance=site_substances['Substance_ID'].map(texts))
+    return (
+        named.groupby(['Lokalitet_ID', 'GVFK'], sort=False)['Substance']
+        .agg(separator.join)
+        .reset_index(name='Lokalitetensstoffer')
+    )
+
+
+def _save_site_substance_table(site_substances, substance_dictionary, v1v2_combined,
+                               site_id_shp_col, gvfk_id_col):
+    """Save the long site-substance table for combinations kept by Step 3."""
+    kept = v1v2_combined[[site_id_shp_col, gvfk_id_col]].drop_duplicates()
+    kept = kept.rename(columns={site_id_shp_col: 'Lokalitet_ID', gvfk_id_col: 'GVFK'})
+    site_substances = site_substances.merge(kept, on=['Lokalitet_ID', 'GVFK'], how='inner')
+
+    used_ids = site_substances['Substance_ID'].unique()
+    substance_dictionary = substance_dictionary[
+        substance_dictionary['Substance_ID'].isin(used_ids)
+    ]
+
+    site_substances.to_csv(get_output_path('step3_site_substances'), index=False, encoding="utf-8")
+    substance_dictionary.to_csv(
+        get_output_path('step3_substance_dictionary'), index=False, encoding="utf-8"
+    )
+    print(f"  Saved: {len(site_substances):,} site-substance rows "
+          f"({len(substance_dictionary):,} unique substances)")
+
+
+def _save_site_geometry_table(v1v2_combined, site_id_shp_col):
+    """Save one dissolved geometry per site with area and centroid (GeoParquet) for Step 6."""
+    sites = v1v2_combined[[site_id_shp_col, 'geometry']]
+    # Sites repeat the same polygon once per GVFK - only union the distinct ones
+    distinct = sites[~sites.assign(_wkb=sites.geometry.to_wkb()).duplicated([site_id_shp_col, '_wkb'])]
+    dissolved = distinct.dissolve(by=site_id_shp_col, as_index=False)
+
+    centroids = dissolved.geometry.centroid
+    site_geometries = gpd.GeoDataFrame(
+        {
+            site_id_shp_col: dissolved[site_id_shp_col],
+            'Area_m2': dissolved.geometry.area,
+            'Centroid_x': centroids.x,
+            'Centroid_y': centroids.y,
+        },
+        geometry=dissolved.geometry,
+        crs=dissolved.crs,
+    )
+
+    output_path = get_output_path('step3_site_geometries')
+    try:
+        site_geometries.to_parquet(output_path, index=False)
+        print(f"  Saved: {len(site_geometries):,} site geometries (area + centroid)")
+    except (ImportError, ValueError) as exc:
+        output_path.unlink(missing_ok=True)
+        print(f"  WARNING: Could not save site geometry table ({exc}) - Step 6 will dissolve")
+
+
 def _save_step3_results(v1v2_combined, gvfk_with_v1v2_names, site_id_shp_col,
                        gvfk_id_col, grundvand_gvfk_col, input_gvfk_count):
     """Save Step 3 results and generate summary statistics."""
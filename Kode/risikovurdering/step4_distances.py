@@ -20,6 +20,7 @@ from config import (
     WORKFLOW_SETTINGS,
     get_output_path,
 )
+from risikovurdering.step5_utils import add_landfill_flags
 from step_reporter import report_step_header, report_counts, report_subsection
 
 
@@ -313,6 +314,9 @@ def _save_distance_results(results_df, valid_results, v1v2_combined, site_id_col
     output_columns = base_columns + available_step5_columns
     all_combinations = valid_results[output_columns].copy()
 
+    # Precompute landfill keyword flags once so Step 5 never re-scans the text
+    all_combinations = add_landfill_flags(all_combinations)
+
     # Save ALL combinations for Step 5
     all_combinations.to_csv(
         get_output_path("step4_final_distances_for_risk_assessment"), index=False, encoding="utf-8"
@@ -9,7 +9,12 @@ import pandas as pd
 import os
 from collections import Counter
 from config import get_output_path, TOTAL_GVFK_DENMARK
-from .step5_utils import _extract_unique_gvfk_names, get_keyword_stats
+from .step5_utils import (
+    _extract_unique_gvfk_names,
+    explode_site_substances,
+    get_keyword_stats,
+    get_site_substances,
+)
 
 
 def print_keyword_summary():
@@ -93,12 +98,13 @@ def print_summary(
 
         # Substances
         if "Lokalitetensstoffer" in general_sites.columns:
-            all_substances = []
-            for sub_str in general_sites["Lokalitetensstoffer"].dropna():
-                substances = [s.strip() for s in str(sub_str).split(";") if s.strip()]
-                all_substances.extend(substances)
-            if all_substances:
-                sub_counts = pd.Series(all_substances).value_counts().head(3)
+            exploded = explode_site_substances(
+                general_sites, get_site_substances(general_sites)
+            )
+            if not exploded.empty:
+                sub_counts = (
+                    exploded["Substance"].astype(str).value_counts().head(3)
+                )
                 sub_str = ", ".join([f"{k} ({v})" for k, v in sub_counts.items()])
                 print(f"  Substances: {sub_str}")
 
@@ -12,8 +12,10 @@ Clean, focused implementation with supporting functions moved to separate module
 ################################################################################
 # SECTION 1: IMPORTS & CONFIGURATION
 ################################################################################
+import numpy as np
 import pandas as pd
 import os
+import shutil
 
 from config import (
     GRUNDVAND_LAYER_NAME,
@@ -24,11 +26,16 @@ from config import (
 )
 from .step5_utils import (
     categorize_contamination_substance,
-    categorize_by_branch_activity,
     create_gvfk_shapefile,
+    ensure_landfill_flags,
+    explode_site_substances,
+    get_site_substances,
+    is_landfill_category_site,
+    is_landfill_site,
     separate_sites_by_substance_data,
     _extract_unique_gvfk_names,
 )
+from .compound_categories import DEFAULT_DISTANCE, get_category_distance
 from .step5_analysis import (
     print_keyword_summary,
     print_summary,
@@ -101,6 +108,11 @@ def run_step5():
     report_subsection("Step 5b: Compound-Specific Assessment")
     compound_combinations = run_compound_assessment(sites_with_substances)
 
+    # Baseline for incremental rule-change analysis (local import: circular)
+    from .step5_rule_impact import save_rule_snapshot
+
+    save_rule_snapshot(sites_with_substances)
+
     # Handle parked sites
     unknown_substance_sites = handle_unknown_substance_sites(sites_without_substances)
 
@@ -194,91 +206,81 @@ def run_compound_assessment(distance_results):
     return compound_combinations
 
 
-def apply_compound_filtering(distance_results):
-    """Apply compound-specific distance filtering."""
-    high_risk_combinations = []
-
-    def _has_landfill_keywords(text):
-        if pd.isna(text):
-            return False
-        text_lower = str(text).lower()
-        landfill_keywords = [
-            "losseplads",
-            "affald",
-            "depon",
-            "deponi",
-            "fyld",
-            "fyldplads",
-            "skraldeplads",
-        ]
-        return any(keyword in text_lower for keyword in landfill_keywords)
-
-    for _, row in distance_results.iterrows():
-        substances_str = str(row.get("Lokalitetensstoffer", ""))
-        site_distance = row["Distance_to_River_m"]
-        branch_text = row.get("Lokalitetensbranche", "")
-        activity_text = row.get("Lokalitetensaktivitet", "")
-        is_landfill_site = _has_landfill_keywords(
-            branch_text
-        ) or _has_landfill_keywords(activity_text)
-
-        # Check if site has substance data
-        has_substance_data = not (
-            pd.isna(substances_str)
-            or substances_str.strip() == ""
-            or substances_str == "nan"
-        )
+def apply_compound_filtering(distance_results, site_substances=None):
+    """
+    Apply compound-specific distance filtering.
+
+    Substances come from the long site-substance table materialized in Step 3,
+    so each distinct substance string is categorized once and the per-row
+    threshold test is a single vectorized comparison.
+    """
+    distance_results = ensure_landfill_flags(distance_results).reset_index(drop=True)
+    landfill_mask = is_landfill_site(distance_results).to_numpy()
+    landfill_category_mask = is_landfill_category_site(distance_results).to_numpy()
+    site_distance = distance_results["Distance_to_River_m"].to_numpy()
+    default_threshold = WORKFLOW_SETTINGS.get("risk_threshold_m", 500)
+
+    if site_substances is None:
+        site_substances = get_site_substances(distance_results)
+    exploded = explode_site_substances(distance_results, site_substances)
+
+    # Categorize each distinct substance once
+    substances = exploded["Substance"].cat.categories
+    categorized = [categorize_contamination_substance(s) for s in substances]
+    codes = exploded["Substance"].cat.codes.to_numpy()
+    category_lookup = np.array([c for c, _ in categorized], dtype=object)
+    threshold_lookup = np.array(
+        [default_threshold if d is None else d for _, d in categorized], dtype=float
+    )
 
-        if has_substance_data:
-            # Process substance-based categorization
-            substances = [s.strip() for s in substances_str.split(";") if s.strip()]
-
-            for substance in substances:
-                category, compound_threshold = categorize_contamination_substance(
-                    substance
-                )
-
-                if compound_threshold is None:
-                    compound_threshold = WORKFLOW_SETTINGS.get("risk_threshold_m", 500)
-
-                effective_threshold = compound_threshold
-                if is_landfill_site and category in LANDFILL_THRESHOLDS:
-                    effective_threshold = LANDFILL_THRESHOLDS[category]
-
-                # Check if site is within this compound's threshold
-                if site_distance <= effective_threshold:
-                    combo_row = row.to_dict()
-                    combo_row["Qualifying_Substance"] = substance
-                    combo_row["Qualifying_Category"] = category
-                    combo_row["Category_Threshold_m"] = compound_threshold
-                    combo_row["Within_Threshold"] = True
-                    high_risk_combinations.append(combo_row)
-        else:
-            # Process branch/activity-based categorization
-            category, compound_threshold = categorize_by_branch_activity(
-                branch_text, activity_text
-            )
-
-            if compound_threshold is None:
-                compound_threshold = WORKFLOW_SETTINGS.get("risk_threshold_m", 500)
-
-            if site_distance <= compound_threshold:
-                combo_row = row.to_dict()
-                combo_row["Qualifying_Substance"] = f"Branch/Activity: {category}"
-                combo_row["Qualifying_Category"] = category
-                combo_row["Category_Threshold_m"] = compound_threshold
-                combo_row["Within_Threshold"] = True
-                high_risk_combinations.append(combo_row)
-
-    # Convert to DataFrame
-    combinations_df = (
-        pd.DataFrame(high_risk_combinations)
-        if high_risk_combinations
-        else pd.DataFrame()
+    rows = exploded["_row"].to_numpy()
+    categories = category_lookup[codes]
+    compound_threshold = threshold_lookup[codes]
+    landfill_threshold = (
+        pd.Series(categories).map(LANDFILL_THRESHOLDS).to_numpy(dtype=float)
     )
+    effective_threshold = np.where(
+        landfill_mask[rows] & ~np.isnan(landfill_threshold),
+        landfill_threshold,
+        compound_threshold,
+    )
+    keep = site_distance[rows] <= effective_threshold
+
+    substance_combos = distance_results.iloc[rows[keep]].copy()
+    substance_combos["Qualifying_Substance"] = substances.to_numpy()[codes[keep]]
+    substance_combos["Qualifying_Category"] = categories[keep]
+    substance_combos["Category_Threshold_m"] = compound_threshold[keep]
+    substance_combos["_row"] = rows[keep]
+
+    # Sites without substance data: branch/activity-based categorization
+    no_substance = ~np.isin(np.arange(len(distance_results)), rows)
+    branch_category = np.where(landfill_category_mask, "LOSSEPLADS", "ANDRE")
+    losseplads_threshold = get_category_distance("LOSSEPLADS")
+    branch_threshold = np.where(
+        landfill_category_mask,
+        default_threshold if losseplads_threshold is None else losseplads_threshold,
+        DEFAULT_DISTANCE,
+    ).astype(float)
+    branch_keep = no_substance & (site_distance <= branch_threshold)
+
+    branch_combos = distance_results[branch_keep].copy()
+    branch_combos["Qualifying_Substance"] = [
+        f"Branch/Activity: {category}" for category in branch_category[branch_keep]
+    ]
+    branch_combos["Qualifying_Category"] = branch_category[branch_keep]
+    branch_combos["Category_Threshold_m"] = branch_threshold[branch_keep]
+    branch_combos["_row"] = np.flatnonzero(branch_keep)
+
+    if substance_combos.empty and branch_combos.empty:
+        return pd.DataFrame()
 
-    if combinations_df.empty:
-        return combinations_df
+    combinations_df = (
+        pd.concat([substance_combos, branch_combos], ignore_index=True)
+        .sort_values("_row", kind="stable")
+        .drop(columns="_row")
+        .reset_index(drop=True)
+    )
+    combinations_df["Within_Threshold"] = True
 
     # Apply landfill override
     combinations_df = _apply_landfill_override(combinations_df)
@@ -294,52 +296,29 @@ def _apply_landfill_override(combinations_df):
     combinations_df["Original_Category"] = None
     combinations_df["Landfill_Override_Applied"] = False
 
-    override_count = 0
-    indices_to_drop = []
-
-    # Process each combination
-    for idx, row in combinations_df.iterrows():
-        # Skip if already classified as LOSSEPLADS
-        if row["Qualifying_Category"] == "LOSSEPLADS":
-            continue
-
-        branch_text = row.get("Lokalitetensbranche", "")
-        activity_text = row.get("Lokalitetensaktivitet", "")
+    # Landfill-site combinations not already LOSSEPLADS whose category has a
+    # landfill threshold (Is_Landfill_Category flag from add_landfill_flags)
+    original_category = combinations_df["Qualifying_Category"]
+    landfill_threshold = original_category.map(LANDFILL_THRESHOLDS)
+    candidates = (
+        is_landfill_category_site(combinations_df)
+        & (original_category != "LOSSEPLADS")
+        & landfill_threshold.notna()
+    )
+    override = candidates & (combinations_df["Distance_to_River_m"] <= landfill_threshold)
+    override_count = int(override.sum())
 
-        landfill_category, _ = categorize_by_branch_activity(
-            branch_text, activity_text
-        )
+    # Apply override
+    original = original_category[override]
+    combinations_df.loc[override, "Original_Category"] = original
+    combinations_df.loc[override, "Losseplads_Subcategory"] = "LOSSEPLADS_" + original
+    combinations_df.loc[override, "Category_Threshold_m"] = landfill_threshold[override]
+    combinations_df.loc[override, "Qualifying_Substance"] = "Landfill Override: " + original
+    combinations_df.loc[override, "Landfill_Override_Applied"] = True
+    combinations_df.loc[override, "Qualifying_Category"] = "LOSSEPLADS"
 
-        if landfill_category == "LOSSEPLADS":
-            original_category = row["Qualifying_Category"]
-            site_distance = row["Distance_to_River_m"]
-
-            # Check if category has landfill threshold
-            if original_category in LANDFILL_THRESHOLDS:
-                landfill_threshold = LANDFILL_THRESHOLDS[original_category]
-
-                if site_distance <= landfill_threshold:
-                    # Apply override
-                    combinations_df.loc[idx, "Original_Category"] = original_category
-                    combinations_df.loc[idx, "Qualifying_Category"] = "LOSSEPLADS"
-                    combinations_df.loc[idx, "Losseplads_Subcategory"] = (
-                        f"LOSSEPLADS_{original_category}"
-                    )
-                    combinations_df.loc[idx, "Category_Threshold_m"] = (
-                        landfill_threshold
-                    )
-                    combinations_df.loc[idx, "Qualifying_Substance"] = (
-                        f"Landfill Override: {original_category}"
-                    )
-                    combinations_df.loc[idx, "Landfill_Override_Applied"] = True
-                    override_count += 1
-                else:
-                    # No longer qualifies - mark for removal
-                    indices_to_drop.append(idx)
-
-    # Drop disqualified rows
-    if indices_to_drop:
-        combinations_df = combinations_df.drop(indices_to_drop)
+    # Drop disqualified rows (beyond the landfill threshold)
+    combinations_df = combinations_df[~(candidates & ~override)]
 
     if override_count > 0:
         print(f"  Landfill overrides applied: {override_count} combinations")
@@ -394,10 +373,39 @@ def save_compound_results(compound_combinations):
     # Save to Step 5b output file (will NOT be overwritten by Step 5c)
     detailed_path = get_output_path("step5b_compound_combinations")
     compound_combinations.to_csv(detailed_path, index=False, encoding="utf-8")
+    _save_compound_dataset(compound_combinations)
 
     create_gvfk_shapefile(compound_combinations, "step5b_compound_gvfk_high_risk")
 
 
+def _save_compound_dataset(compound_combinations):
+    """
+    Write Step 5b combinations as a Parquet dataset partitioned by category.
+
+    Lets consumers (data_loaders.load_step5_combinations) read only the columns
+    and categories they need. The CSV stays the reference output; if Parquet
+    cannot be written the stale dataset is removed so loaders use the CSV.
+    """
+    dataset_path = get_output_path("step5b_compound_dataset")
+    if dataset_path.exists():
+        shutil.rmtree(dataset_path)
+
+    dataset = compound_combinations.reset_index(drop=True)
+    dataset["_row"] = np.arange(len(dataset))
+    # Mixed-type text columns (e.g. IDs) must have one type per column in Parquet
+    text_columns = dataset.select_dtypes(include=["object", "string"]).columns
+    dataset[text_columns] = dataset[text_columns].astype("string")
+
+    try:
+        dataset.to_parquet(
+            dataset_path, partition_cols=["Qualifying_Category"], index=False
+        )
+    except (ImportError, ValueError, TypeError) as e:
+        if dataset_path.exists():
+            shutil.rmtree(dataset_path)
+        print(f"  Warning: Parquet dataset not written ({e}) - loaders use CSV")
+
+
 if __name__ == "__main__":
     # Run Step 5 risk assessment
     results = run_step5()
@@ -0,0 +1,676 @@
+"""
+Step 5 Rule Change Impact - Incremental Re-categorization
+=========================================================
+
+Every Step 5 run saves the keyword rules it used (step5_rule_snapshot.json) and
+the category of every distinct substance (step5_substance_categories.csv).
+After editing COMPOUND_CATEGORIES, COMPOUND_SPECIFIC_DISTANCES or
+LANDFILL_THRESHOLDS, this module compares the current rules with that snapshot
+and only redoes the work the edit can affect:
+
+1. Rules: added/removed keywords, changed distances and landfill thresholds.
+2. Vocabulary: only substances containing a changed keyword/compound key, or in
+   a category whose distance changed, are re-categorized.
+3. Step 5b: only site-GVFK rows holding a substance whose category/distance
+   changed (or landfill rows of a category whose landfill threshold changed)
+   are filtered again.
+4. Step 6: flux rows of those site-GVFKs are recomputed from the areas and
+   infiltration already in step6_flux_site_segment.csv; Cmix/MKK are
+   re-evaluated for the touched segments with the flows in step6_cmix_results.csv.
+   Site-GVFKs without Step 6 inputs are reported as needs_full_step6, and the
+   segments they reach as needs_full_step6_placeholder.
+
+Step 5/6 outputs are not overwritten - rerun the pipeline to adopt a rule change.
+
+Usage:
+    python -m risikovurdering.step5_rule_impact
+
+Output:
+    step5_rule_change_impact.csv - one row per change with Level
+    (Rule / Substance / Site_GVFK / Site / GVFK / Segment), ID, Change, Before, After.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import re
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+if __package__ is None or __package__ == "":
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from config import get_output_path
+from data_loaders import load_step5_combinations
+from risikovurdering.compound_categories import (
+    COMPOUND_CATEGORIES,
+    COMPOUND_SPECIFIC_DISTANCES,
+    DEFAULT_DISTANCE,
+    categorize_substance_with_source,
+    categorize_with_rules,
+    normalize_text,
+)
+from risikovurdering.step5_risk_assessment import (
+    LANDFILL_THRESHOLDS,
+    apply_compound_filtering,
+)
+from risikovurdering.step5_utils import (
+    get_site_substances,
+    is_landfill_site,
+    separate_sites_by_substance_data,
+)
+
+PAIR_COLUMNS = ["Lokalitet_ID", "GVFK"]
+LEVEL_ORDER = ["Rule", "Substance", "Site_GVFK", "Site", "GVFK", "Segment"]
+
+
+# ===========================================================================
+# Rule snapshot
+# ===========================================================================
+
+
+def current_rules() -> Dict[str, object]:
+    """The rule set Step 5b uses right now, as plain JSON-serializable data."""
+    return {
+        "categories": {
+            category: {
+                "distance_m": float(info["distance_m"]),
+                "keywords": list(info["keywords"]),
+            }
+            for category, info in COMPOUND_CATEGORIES.items()
+        },
+        "compound_specific": {
+            compound: float(distance)
+            for compound, distance in COMPOUND_SPECIFIC_DISTANCES.items()
+        },
+        "default_distance": float(DEFAULT_DISTANCE),
+        "landfill_thresholds": {
+            category: float(distance) for category, distance in LANDFILL_THRESHOLDS.items()
+        },
+    }
+
+
+def categorize_vocabulary(
+    substances: pd.Series, rules: Dict[str, object] | None = None
+) -> pd.DataFrame:
+    """Category, distance and compound key per substance (current rules if omitted)."""
+    substances = pd.Series(substances, dtype=object).drop_duplicates()
+    if rules is None:
+        categorized = [categorize_substance_with_source(s) for s in substances]
+    else:
+        categorized = [
+            categorize_with_rules(
+                s,
+                rules["categories"],
+                rules["compound_specific"],
+                rules["default_distance"],
+            )
+            for s in substances
+        ]
+    vocabulary = pd.DataFrame(
+        categorized, columns=["Category", "Distance_m", "Compound_Key"]
+    )
+    vocabulary.insert(0, "Substance", substances.to_numpy())
+    return vocabulary
+
+
+def save_rule_snapshot(distance_results: pd.DataFrame) -> None:
+    """
+    Save the current rules and categorized substance vocabulary.
+
+    Called at the end of Step 5 so the next rule-change analysis has a baseline.
+    """
+    snapshot_path = get_output_path("step5_rule_snapshot")
+    with open(snapshot_path, "w", encoding="utf-8") as handle:
+        json.dump(current_rules(), handle, ensure_ascii=False, indent=2)
+
+    site_substances = get_site_substances(distance_results)
+    vocabulary = categorize_vocabulary(site_substances["Substance"].astype(str).unique())
+    vocabulary.to_csv(
+        get_output_path("step5_substance_categories"), index=False, encoding="utf-8"
+    )
+
+
+def load_rule_snapshot() -> Tuple[Dict[str, object], pd.DataFrame]:
+    """Load the rules and vocabulary saved by the last Step 5 run."""
+    snapshot_path = get_output_path("step5_rule_snapshot")
+    vocabulary_path = get_output_path("step5_substance_categories")
+    if not snapshot_path.exists() or not vocabulary_path.exists():
+        raise FileNotFoundError(
+            "No Step 5 rule snapshot found - run Step 5 once with the old rules first."
+        )
+    with open(snapshot_path, encoding="utf-8") as handle:
+        rules = json.load(handle)
+    vocabulary = pd.read_csv(vocabulary_path, encoding="utf-8")
+    return rules, vocabulary
+
+
+# ===========================================================================
+# Rule diff and incremental re-categorization
+# ===========================================================================
+
+
+def _change(level, change_id, change, before="", after="") -> Dict[str, object]:
+    return {"Level": level, "ID": change_id, "Change": change, "Before": before, "After": after}
+
+
+def diff_rules(
+    old: Dict[str, object], new: Dict[str, object]
+) -> Tuple[List[Dict[str, object]], Dict[str, object]]:
+    """
+    Compare two rule sets.
+
+    Returns:
+        (changes, scope): report rows at Level "Rule", and the scope of the
+        change - changed normalized keywords/compound keys, categories whose
+        distance or landfill threshold changed, and whether a full
+        re-categorization is needed (category order changed).
+    """
+    changes = []
+    scope = {
+        "patterns": set(),
+        "distance_categories": set(),
+        "landfill_categories": set(),
+        "full": False,
+    }
+
+    old_categories, new_categories = old["categories"], new["categories"]
+    for category in sorted(set(old_categories) | set(new_categories)):
+        old_info = old_categories.get(category)
+        new_info = new_categories.get(category)
+        old_keywords = {normalize_text(kw) for kw in old_info["keywords"]} if old_info else set()
+        new_keywords = {normalize_text(kw) for kw in new_info["keywords"]} if new_info else set()
+
+        for keyword in sorted(new_keywords - old_keywords):
+            changes.append(_change("Rule", category, "keyword_added", after=keyword))
+        for keyword in sorted(old_keywords - new_keywords):
+            changes.append(_change("Rule", category, "keyword_removed", before=keyword))
+        scope["patterns"] |= old_keywords ^ new_keywords
+
+        old_distance = old_info["distance_m"] if old_info else None
+        new_distance = new_info["distance_m"] if new_info else None
+        if old_info is None:
+            changes.append(_change("Rule", category, "category_added", after=new_distance))
+        elif new_info is None:
+            changes.append(_change("Rule", category, "category_removed", before=old_distance))
+        elif old_distance != new_distance:
+            changes.append(
+                _change("Rule", category, "category_distance", old_distance, new_distance)
+            )
+        if old_distance != new_distance:
+            scope["distance_categories"].add(category)
+
+    # Compound overrides pick their category by iterating categories in order
+    common = [c for c in old_categories if c in new_categories]
+    if common != [c for c in new_categories if c in old_categories]:
+        changes.append(_change("Rule", "COMPOUND_CATEGORIES", "category_order"))
+        scope["full"] = True
+
+    old_compounds, new_compounds = old["compound_specific"], new["compound_specific"]
+    for compound in sorted(set(old_compounds) | set(new_compounds)):
+        before, after = old_compounds.get(compound), new_compounds.get(compound)
+        if before != after:
+            change = (
+                "compound_added" if before is None
+                else "compound_removed" if after is None
+                else "compound_distance"
+            )
+            changes.append(_change("Rule", compound, change, before or "", after or ""))
+            scope["patterns"].add(compound)
+
+    if old["default_distance"] != new["default_distance"]:
+        changes.append(
+            _change("Rule", "ANDRE", "default_distance", old["default_distance"], new["default_distance"])
+        )
+        scope["distance_categories"].add("ANDRE")
+
+    old_landfill, new_landfill = old["landfill_thresholds"], new["landfill_thresholds"]
+    for category in sorted(set(old_landfill) | set(new_landfill)):
+        before, after = old_landfill.get(category), new_landfill.get(category)
+        if before != after:
+            changes.append(_change("Rule", category, "landfill_threshold", before or "", after or ""))
+            scope["landfill_categories"].add(category)
+
+    scope["patterns"].discard("")
+    return changes, scope
+
+
+def recategorize_vocabulary(
+    substances: pd.Series,
+    old_vocabulary: pd.DataFrame,
+    scope: Dict[str, object],
+) -> pd.DataFrame:
+    """
+    Re-categorize only the substances a rule change can affect.
+
+    A substance can only change if it contains a changed keyword/compound key
+    (as a substring, like the categorizer itself), belongs to a category whose
+    distance changed, or is missing from the snapshot.
+
+    Returns:
+        One row per substance with Old_Category/Old_Distance_m/Old_Compound_Key,
+        the current Category/Distance_m/Compound_Key, Recategorized and Changed.
+    """
+    vocabulary = pd.DataFrame({"Substance": pd.Series(substances, dtype=object).unique()})
+    old = old_vocabulary.rename(
+        columns={
+            "Category": "Old_Category",
+            "Distance_m": "Old_Distance_m",
+            "Compound_Key": "Old_Compound_Key",
+        }
+    )
+    vocabulary = vocabulary.merge(old, on="Substance", how="left")
+
+    candidates = vocabulary["Old_Category"].isna()
+    if scope["full"]:
+        candidates[:] = True
+    else:
+        if scope["patterns"]:
+            pattern = "|".join(re.escape(p) for p in sorted(scope["patterns"]))
+            normalized = vocabulary["Substance"].map(normalize_text)
+            candidates |= normalized.str.contains(pattern, regex=True)
+        candidates |= vocabulary["Old_Category"].isin(scope["distance_categories"])
+
+    vocabulary["Category"] = vocabulary["Old_Category"]
+    vocabulary["Distance_m"] = vocabulary["Old_Distance_m"]
+    vocabulary["Compound_Key"] = vocabulary["Old_Compound_Key"]
+    recategorized = categorize_vocabulary(vocabulary.loc[candidates, "Substance"])
+    vocabulary.loc[candidates, ["Category", "Distance_m", "Compound_Key"]] = (
+        recategorized[["Category", "Distance_m", "Compound_Key"]].to_numpy()
+    )
+
+    vocabulary["Recategorized"] = candidates
+    vocabulary["Changed"] = candidates & (
+        (vocabulary["Category"] != vocabulary["Old_Category"])
+        | (vocabulary["Distance_m"].astype(float) != vocabulary["Old_Distance_m"])
+        | (vocabulary["Compound_Key"].fillna("") != vocabulary["Old_Compound_Key"].fillna(""))
+    )
+    return vocabulary
+
+
+# ===========================================================================
+# Propagation through Step 5b
+# ===========================================================================
+
+
+def _pair_index(df: pd.DataFrame) -> pd.MultiIndex:
+    return pd.MultiIndex.from_frame(df[PAIR_COLUMNS].astype(str))
+
+
+def find_affected_pairs(
+    step5_input: pd.DataFrame,
+    site_substances: pd.DataFrame,
+    vocabulary: pd.DataFrame,
+    scope: Dict[str, object],
+) -> pd.MultiIndex:
+    """Site-GVFK pairs whose Step 5b rows can change under the new rules."""
+    substance_text = site_substances["Substance"].astype(str)
+    changed = set(vocabulary.loc[vocabulary["Changed"], "Substance"])
+    affected = [_pair_index(site_substances[substance_text.isin(changed).to_numpy()])]
+
+    landfill_pairs = _pair_index(step5_input[is_landfill_site(step5_input)])
+    if scope["landfill_categories"]:
+        in_landfill_category = vocabulary["Old_Category"].isin(scope["landfill_categories"]) | (
+            vocabulary["Category"].isin(scope["landfill_categories"])
+        )
+        landfill_substances = set(vocabulary.loc[in_landfill_category, "Substance"])
+        pairs = _pair_index(site_substances[substance_text.isin(landfill_substances).to_numpy()])
+        affected.append(pairs[pairs.isin(landfill_pairs)])
+
+    # Branch/activity rows (no substances) use the LOSSEPLADS / ANDRE distances
+    branch_pairs = _pair_index(step5_input).difference(_pair_index(site_substances))
+    if "LOSSEPLADS" in scope["distance_categories"]:
+        affected.append(branch_pairs[branch_pairs.isin(landfill_pairs)])
+    if "ANDRE" in scope["distance_categories"]:
+        affected.append(branch_pairs[~branch_pairs.isin(landfill_pairs)])
+
+    result = affected[0]
+    for pairs in affected[1:]:
+        result = result.union(pairs)
+    return result.unique()
+
+
+def _signature(rows: pd.DataFrame) -> pd.Series:
+    """Comparable description of the Step 5b rows per site-GVFK pair."""
+    if rows.empty:
+        return pd.Series(dtype=object)
+    labels = (
+        rows["Qualifying_Category"].astype(str)
+        + " | "
+        + rows["Qualifying_Substance"].astype(str)
+        + " | "
+        + rows["Category_Threshold_m"].astype(float).map("{:g}m".format)
+    )
+    return labels.groupby(_pair_index(rows)).agg(lambda s: "; ".join(sorted(s)))
+
+
+def _compare_membership(level, before: set, after: set) -> List[Dict[str, object]]:
+    changes = [_change(level, item, "entered_step5b") for item in sorted(after - before)]
+    changes += [_change(level, item, "left_step5b") for item in sorted(before - after)]
+    return changes
+
+
+def compare_step5b(
+    old_rows: pd.DataFrame,
+    new_rows: pd.DataFrame,
+    affected: pd.MultiIndex,
+    old_all: pd.DataFrame,
+) -> List[Dict[str, object]]:
+    """Report rows for site-GVFK pairs, sites and GVFKs that move in Step 5b."""
+    old_signature = _signature(old_rows)
+    new_signature = _signature(new_rows)
+
+    changes = []
+    for pair in affected:
+        before = old_signature.get(pair, "")
+        after = new_signature.get(pair, "")
+        if before == after:
+            continue
+        if not before:
+            change = "entered_step5b"
+        elif not after:
+            change = "left_step5b"
+        else:
+            old_categories = {label.split(" | ")[0] for label in before.split("; ")}
+            new_categories = {label.split(" | ")[0] for label in after.split("; ")}
+            change = "categories_changed" if old_categories != new_categories else "rows_changed"
+        changes.append(_change("Site_GVFK", f"{pair[0]} / {pair[1]}", change, before, after))
+
+    # Site and GVFK membership of the whole Step 5b result
+    unaffected = old_all[~_pair_index(old_all).isin(affected)]
+    patched = pd.concat([unaffected[PAIR_COLUMNS], new_rows[PAIR_COLUMNS]], ignore_index=True)
+    for level, column in (("Site", "Lokalitet_ID"), ("GVFK", "GVFK")):
+        before = set(old_all[column].dropna().astype(str))
+        after = set(patched[column].dropna().astype(str))
+        changes += _compare_membership(level, before, after)
+    return changes
+
+
+# ===========================================================================
+# Propagation through Step 6 (flux, Cmix, MKK)
+# ===========================================================================
+
+ENRICHMENT_COLUMNS = [
+    "Area_m2",
+    "Infiltration_mm_per_year",
+    "River_Segment_Name",
+    "River_Segment_Length_m",
+    "River_Segment_GVFK",
+]
+
+
+def _segment_state(cmix: pd.DataFrame, segment_flux: pd.DataFrame) -> pd.DataFrame:
+    """Per segment: categories, total flux, max exceedance ratio and exceedance flag."""
+    flux = segment_flux.groupby("Nearest_River_FID").agg(
+        Categories=("Qualifying_Category", lambda s: ", ".join(sorted(set(s.astype(str))))),
+        Total_Flux_kg_per_year=("Total_Flux_kg_per_year", "sum"),
+    )
+    if cmix.empty:
+        flux["Max_Exceedance_Ratio"] = np.nan
+        flux["Exceeds_MKK"] = False
+        return flux
+    ratio = cmix.groupby("Nearest_River_FID").agg(
+        Max_Exceedance_Ratio=("Exceedance_Ratio", "max"),
+        Exceeds_MKK=("Exceedance_Flag", "any"),
+    )
+    state = flux.join(ratio, how="left")
+    state["Exceeds_MKK"] = state["Exceeds_MKK"].fillna(False).astype(bool)
+    return state
+
+
+def _describe_segment(state: pd.Series | None) -> str:
+    if state is None:
+        return ""
+    ratio = state["Max_Exceedance_Ratio"]
+    ratio_text = "n/a" if pd.isna(ratio) else f"{ratio:.3g}"
+    return (
+        f"{state['Categories']}; flux={state['Total_Flux_kg_per_year']:.4g} kg/yr; "
+        f"max_ratio={ratio_text}; exceeds={bool(state['Exceeds_MKK'])}"
+    )
+
+
+def propagate_to_step6(
+    affected: pd.MultiIndex, new_rows: pd.DataFrame
+) -> List[Dict[str, object]]:
+    """
+    Recompute flux/Cmix/MKK for the affected site-GVFK pairs and their segments.
+
+    Areas, infiltration, river metadata and flows are reused from the last
+    Step 6 run; pairs that never reached Step 6 flux are reported instead.
+    Segments receiving such a pair are only known from placeholder inputs and
+    are reported as needs_full_step6_placeholder, without flux/Cmix values.
+    """
+    flux_path = get_output_path("step6_flux_site_segment")
+    cmix_path = get_output_path("step6_cmix_results")
+    if not flux_path.exists() or not cmix_path.exists():
+        print("  NOTE: Step 6 outputs not found - segment impact skipped")
+        return []
+
+    from tilstandsvurdering.step6_tilstandsvurdering import (
+        _aggregate_flux_by_segment,
+        _apply_mkk_thresholds,
+        _calculate_flux,
+        _compute_cmix,
+    )
+
+    old_flux = pd.read_csv(flux_path, encoding="utf-8")
+    old_cmix = pd.read_csv(cmix_path, encoding="utf-8")
+    in_affected = _pair_index(old_flux).isin(affected)
+
+    changes = []
+    pending_segments: Dict[object, int] = {}
+
+    # Recompute flux for new rows, reusing site-GVFK inputs from the old flux table
+    enrichment = old_flux.loc[
+        in_affected, PAIR_COLUMNS + ["Nearest_River_FID"] + ENRICHMENT_COLUMNS
+    ].drop_duplicates(PAIR_COLUMNS + ["Nearest_River_FID"])
+    enrichment[PAIR_COLUMNS] = enrichment[PAIR_COLUMNS].astype(str)
+    enriched = new_rows.drop(columns=ENRICHMENT_COLUMNS, errors="ignore").copy()
+    enriched[PAIR_COLUMNS] = enriched[PAIR_COLUMNS].astype(str)
+    enriched = enriched.merge(
+        enrichment, on=PAIR_COLUMNS + ["Nearest_River_FID"], how="left", indicator=True
+    )
+    missing = enriched["_merge"] == "left_only"
+    if missing.any():
+        # Only pairs with a category that yields flux (no -1 concentration) matter;
+        # placeholder inputs are enough to let _calculate_flux decide that
+        placeholder = enriched[missing].drop(columns="_merge").assign(
+            Area_m2=1.0,
+            Infiltration_mm_per_year=1.0,
+            River_Segment_Name="",
+            River_Segment_Length_m=0.0,
+            River_Segment_GVFK="",
+        )
+        placeholder_flux, _ = _calculate_flux(placeholder)
+
+        audit_path = get_output_path("step6_filtering_audit")
+        filtered_pairs = pd.MultiIndex.from_tuples([], names=PAIR_COLUMNS)
+        if audit_path.exists():
+            filtered_pairs = _pair_index(pd.read_csv(audit_path, encoding="utf-8"))
+        missing_pairs = (
+            _pair_index(placeholder_flux).unique() if not placeholder_flux.empty else []
+        )
+        for pair in missing_pairs:
+            change = "filtered_in_step6" if pair in filtered_pairs else "needs_full_step6"
+            changes.append(_change("Site_GVFK", f"{pair[0]} / {pair[1]}", change))
+        # Placeholder flux only tells which segments receive these pairs - the
+        # segments themselves cannot be re-evaluated without a full Step 6 run
+        pending = placeholder_flux[~_pair_index(placeholder_flux).isin(filtered_pairs)]
+        pending_segments = (
+            pending.drop_duplicates(PAIR_COLUMNS + ["Nearest_River_FID"])
+            .groupby("Nearest_River_FID")
+            .size()
+            .to_dict()
+        )
+    enriched = enriched[~missing].drop(columns="_merge")
+
+    new_flux = pd.DataFrame(columns=old_flux.columns)
+    if not enriched.empty:
+        new_flux, _ = _calculate_flux(enriched)
+
+    segments = (
+        set(old_flux.loc[in_affected, "Nearest_River_FID"])
+        | set(new_flux["Nearest_River_FID"])
+        | set(pending_segments)
+    )
+    if not segments:
+        return changes
+
+    old_segment_rows = old_flux[old_flux["Nearest_River_FID"].isin(segments)]
+    patched_rows = pd.concat(
+        [old_segment_rows[~_pair_index(old_segment_rows).isin(affected)], new_flux],
+        ignore_index=True,
+    )
+    old_segment_flux = _aggregate_flux_by_segment(old_segment_rows)
+    new_segment_flux = _aggregate_flux_by_segment(patched_rows)
+
+    # Flows per segment and scenario from the last Step 6 run
+    flows = old_cmix.loc[
+        old_cmix["Nearest_River_FID"].isin(segments),
+        ["Nearest_River_FID", "Flow_Scenario", "Flow_m3_s"],
+    ].drop_duplicates(["Nearest_River_FID", "Flow_Scenario"])
+    # Segments without a known flow from the last Step 6 run
+    without_flow = segments - set(flows["Nearest_River_FID"])
+
+    new_cmix = pd.DataFrame()
+    if not new_segment_flux.empty:
+        new_cmix = new_segment_flux.merge(flows, on="Nearest_River_FID", how="inner")
+        new_cmix = _apply_mkk_thresholds(_compute_cmix(new_cmix))
+
+    old_state = (
+        _segment_state(old_cmix[old_cmix["Nearest_River_FID"].isin(segments)], old_segment_flux)
+        if not old_segment_flux.empty
+        else pd.DataFrame()
+    )
+    new_state = (
+        _segment_state(new_cmix, new_segment_flux)
+        if not new_segment_flux.empty
+        else pd.DataFrame()
+    )
+
+    for fid in sorted(segments):
+        before = old_state.loc[fid] if fid in old_state.index else None
+        after = new_state.loc[fid] if fid in new_state.index else None
+        if fid in pending_segments:
+            changes.append(
+                _change(
+                    "Segment",
+                    int(fid),
+                    "needs_full_step6_placeholder",
+                    _describe_segment(before),
+                    f"{pending_segments[fid]} site-GVFK(s) without Step 6 inputs; "
+                    "not re-evaluated",
+                )
+            )
+            continue
+        if fid in without_flow:
+            change = "needs_full_step6"
+        elif before is None:
+            change = "new_segment"
+        elif after is None:
+            change = "segment_removed"
+        elif before["Exceeds_MKK"] != after["Exceeds_MKK"]:
+            change = "new_exceedance" if after["Exceeds_MKK"] else "exceedance_resolved"
+        elif before["Categories"] != after["Categories"]:
+            change = "categories_changed"
+        elif not np.isclose(
+            before["Total_Flux_kg_per_year"], after["Total_Flux_kg_per_year"], rtol=1e-9
+        ):
+            change = "flux_changed"
+        else:
+            continue
+        changes.append(
+            _change("Segment", int(fid), change, _describe_segment(before), _describe_segment(after))
+        )
+    return changes
+
+
+# ===========================================================================
+# Entry point
+# ===========================================================================
+
+
+def run_rule_change_impact(save: bool = True) -> pd.DataFrame:
+    """
+    Report what moves between the last Step 5 run and the current rule set.
+
+    Returns:
+        Report DataFrame (Level, ID, Change, Before, After)
+    """
+    print("=" * 70)
+    print("STEP 5 RULE CHANGE IMPACT")
+    print("=" * 70)
+
+    old_rules, old_vocabulary = load_rule_snapshot()
+    rule_changes, scope = diff_rules(old_rules, current_rules())
+    print(f"Rule changes: {len(rule_changes)}")
+    if not rule_changes:
+        print("  Rules unchanged since the last Step 5 run - nothing to do")
+        return pd.DataFrame(rule_changes, columns=["Level", "ID", "Change", "Before", "After"])
+
+    distance_results = pd.read_csv(
+        get_output_path("step4_final_distances_for_risk_assessment")
+    )
+    step5_input, _ = separate_sites_by_substance_data(distance_results)
+    site_substances = get_site_substances(step5_input)
+
+    vocabulary = recategorize_vocabulary(
+        site_substances["Substance"].astype(str), old_vocabulary, scope
+    )
+    changed_vocabulary = vocabulary[vocabulary["Changed"]]
+    print(
+        f"Substances re-categorized: {int(vocabulary['Recategorized'].sum()):,} of "
+        f"{len(vocabulary):,} ({len(changed_vocabulary):,} changed)"
+    )
+    substance_changes = [
+        _change(
+            "Substance",
+            row.Substance,
+            "not_in_snapshot" if pd.isna(row.Old_Category) else "recategorized",
+            "" if pd.isna(row.Old_Category) else f"{row.Old_Category} ({row.Old_Distance_m:g}m)",
+            f"{row.Category} ({float(row.Distance_m):g}m)",
+        )
+        for row in changed_vocabulary.itertuples(index=False)
+    ]
+
+    affected = find_affected_pairs(step5_input, site_substances, vocabulary, scope)
+    print(f"Site-GVFK combinations to re-evaluate: {len(affected):,}")
+
+    subset = step5_input[_pair_index(step5_input).isin(affected)]
+    new_rows = apply_compound_filtering(subset, site_substances) if not subset.empty else pd.DataFrame()
+    if new_rows.empty:
+        new_rows = pd.DataFrame(columns=PAIR_COLUMNS + ["Qualifying_Category", "Nearest_River_FID"])
+
+    old_all = load_step5_combinations(columns=PAIR_COLUMNS)
+    affected_sites = sorted({site for site, _ in affected})
+    old_rows = load_step5_combinations(filters=[("Lokalitet_ID", "in", affected_sites)])
+    old_rows = old_rows[_pair_index(old_rows).isin(affected)]
+
+    step5_changes = compare_step5b(old_rows, new_rows, affected, old_all)
+    segment_changes = propagate_to_step6(affected, new_rows) if len(affected) else []
+
+    report = pd.DataFrame(
+        rule_changes + substance_changes + step5_changes + segment_changes,
+        columns=["Level", "ID", "Change", "Before", "After"],
+    )
+    report["Level"] = pd.Categorical(report["Level"], categories=LEVEL_ORDER, ordered=True)
+    report = report.sort_values(["Level", "Change", "ID"], kind="stable").reset_index(drop=True)
+    report["Level"] = report["Level"].astype(str)
+
+    print("\nImpact:")
+    for (level, change), count in report.groupby(["Level", "Change"], sort=False).size().items():
+        print(f"  {level:10} {change:28}: {count:,}")
+
+    if save:
+        output_path = get_output_path("step5_rule_change_impact")
+        report.to_csv(output_path, index=False, encoding="utf-8")
+        print(f"\nReport saved: {output_path}")
+    return report
+
+
+if __name__ == "__main__":
+    run_rule_change_impact()
@@ -0,0 +1,378 @@
+"""
+Step 5 Threshold Sweep - Sensitivity of Compound-Specific Distances
+===================================================================
+
+Evaluates many alternative threshold sets for Step 5b in one pass instead of
+re-running Step 5 once per set. Every threshold Step 5b uses is a named
+parameter:
+
+- "category:<CATEGORY>"  COMPOUND_CATEGORIES[...]['distance_m'] (ANDRE = DEFAULT_DISTANCE)
+- "compound:<compound>"  COMPOUND_SPECIFIC_DISTANCES[...]
+- "landfill:<CATEGORY>"  LANDFILL_THRESHOLDS[...] (landfill sites only)
+
+Each exploded site-substance row is governed by exactly one parameter, so the
+rows are grouped per parameter and their distances sorted once. For any
+threshold vector, the qualifying rows of a group are a prefix of that sorted
+array (found with searchsorted), and sites/GVFKs/combinations are counted with
+array operations.
+
+Usage:
+    python -m risikovurdering.step5_threshold_sweep
+
+Output:
+    step5_threshold_sweep.csv - one row per (Scenario_ID, Qualifying_Category)
+    incl. a TOTAL row, with the threshold value of every varied parameter.
+"""
+
+from __future__ import annotations
+
+from itertools import product
+from pathlib import Path
+import sys
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+if __package__ is None or __package__ == "":
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from config import get_output_path
+from risikovurdering.compound_categories import (
+    COMPOUND_CATEGORIES,
+    COMPOUND_SPECIFIC_DISTANCES,
+    DEFAULT_DISTANCE,
+    categorize_substance_with_source,
+)
+from risikovurdering.step5_risk_assessment import LANDFILL_THRESHOLDS
+from risikovurdering.step5_utils import (
+    ensure_landfill_flags,
+    explode_site_substances,
+    get_site_substances,
+    is_landfill_category_site,
+    is_landfill_site,
+)
+
+TOTAL_LABEL = "TOTAL"
+
+
+# ===========================================================================
+# Parameters
+# ===========================================================================
+
+
+def baseline_thresholds() -> Dict[str, float]:
+    """Return the current Step 5b thresholds keyed by parameter name."""
+    params = {
+        f"category:{category}": float(info["distance_m"])
+        for category, info in COMPOUND_CATEGORIES.items()
+    }
+    params["category:ANDRE"] = float(DEFAULT_DISTANCE)
+    params.update(
+        {
+            f"compound:{compound}": float(distance)
+            for compound, distance in COMPOUND_SPECIFIC_DISTANCES.items()
+        }
+    )
+    params.update(
+        {
+            f"landfill:{category}": float(distance)
+            for category, distance in LANDFILL_THRESHOLDS.items()
+        }
+    )
+    return params
+
+
+def build_grid(parameter_values: Dict[str, Sequence[float]]) -> pd.DataFrame:
+    """Full factorial grid: one row per combination of the given parameter values."""
+    names = list(parameter_values)
+    rows = list(product(*(parameter_values[name] for name in names)))
+    return pd.DataFrame(rows, columns=names)
+
+
+def one_at_a_time_grid(
+    values: Sequence[float], parameters: Iterable[str] | None = None
+) -> pd.DataFrame:
+    """
+    Vary one parameter at a time over `values`, all others at baseline.
+
+    Unvaried parameters are left as NaN, which run_threshold_sweep() reads as
+    "use the baseline value".
+    """
+    if parameters is None:
+        parameters = baseline_thresholds().keys()
+    records = [{name: float(value)} for name in parameters for value in values]
+    return pd.DataFrame.from_records(records)
+
+
+# ===========================================================================
+# Exploded site-substance table
+# ===========================================================================
+
+
+def build_sweep_rows(
+    distance_results: pd.DataFrame, site_substances: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """
+    Explode Step 4 site-GVFK rows into the rows Step 5b evaluates.
+
+    Substances come from the Step 3 long site-substance table.
+    Returns one row per site-GVFK-substance (or one branch/activity row for
+    landfill sites without substance data) with the governing Threshold_Key and
+    the category the row ends up in if it qualifies (landfill-governed rows
+    become LOSSEPLADS, mirroring the Step 5b landfill override).
+    """
+    df = ensure_landfill_flags(distance_results.reset_index(drop=True))
+    df["_is_landfill"] = is_landfill_site(df).to_numpy()
+    df["_is_landfill_category"] = is_landfill_category_site(df).to_numpy()
+    if site_substances is None:
+        site_substances = get_site_substances(df)
+    exploded = explode_site_substances(df, site_substances)
+    has_substances = np.isin(np.arange(len(df)), exploded["_row"].to_numpy())
+
+    base_cols = [
+        "Lokalitet_ID",
+        "GVFK",
+        "Distance_to_River_m",
+        "_is_landfill",
+        "_is_landfill_category",
+    ]
+
+    # Substance rows
+    substance_rows = df.iloc[exploded["_row"].to_numpy()][base_cols].reset_index(
+        drop=True
+    )
+    substance_rows["Substance"] = exploded["Substance"].astype(str).to_numpy()
+
+    # Categorize once per unique substance text
+    unique_substances = substance_rows["Substance"].drop_duplicates()
+    categorized = pd.DataFrame(
+        [categorize_substance_with_source(s) for s in unique_substances],
+        columns=["Category", "_distance", "_compound"],
+        index=unique_substances.to_numpy(),
+    )
+    substance_rows = substance_rows.join(categorized, on="Substance")
+    substance_rows["Threshold_Key"] = np.where(
+        substance_rows["_compound"].notna(),
+        "compound:" + substance_rows["_compound"].astype(str),
+        "category:" + substance_rows["Category"],
+    )
+
+    # Landfill sites: categories with a landfill threshold are governed by it
+    landfill_governed = substance_rows["_is_landfill"] & substance_rows["Category"].isin(
+        LANDFILL_THRESHOLDS.keys()
+    )
+    substance_rows.loc[landfill_governed, "Threshold_Key"] = (
+        "landfill:" + substance_rows.loc[landfill_governed, "Category"]
+    )
+    # The override only re-tags sites matching the stricter category keywords
+    substance_rows["Final_Category"] = np.where(
+        landfill_governed & substance_rows["_is_landfill_category"],
+        "LOSSEPLADS",
+        substance_rows["Category"],
+    )
+
+    # Branch/activity rows (no substance data; qualifying only via landfill
+    # keywords): LOSSEPLADS on the category keywords, otherwise ANDRE
+    branch_rows = df.loc[~has_substances & df["_is_landfill"], base_cols].copy()
+    branch_category = np.where(branch_rows["_is_landfill_category"], "LOSSEPLADS", "ANDRE")
+    branch_rows["Substance"] = pd.Series(branch_category, index=branch_rows.index).map(
+        lambda category: f"Branch/Activity: {category}"
+    )
+    branch_rows["Category"] = branch_category
+    branch_rows["Threshold_Key"] = "category:" + branch_rows["Category"]
+    branch_rows["Final_Category"] = branch_category
+
+    columns = [
+        "Lokalitet_ID",
+        "GVFK",
+        "Distance_to_River_m",
+        "Substance",
+        "Category",
+        "Final_Category",
+        "Threshold_Key",
+    ]
+    return pd.concat(
+        [substance_rows[columns], branch_rows[columns]], ignore_index=True
+    )
+
+
+# ===========================================================================
+# Sweep engine
+# ===========================================================================
+
+
+class ThresholdSweep:
+    """Sorted per-parameter distance arrays answering many threshold vectors."""
+
+    def __init__(self, sweep_rows: pd.DataFrame):
+        key_codes, self.keys = pd.factorize(sweep_rows["Threshold_Key"], sort=True)
+        site_codes, self.sites = pd.factorize(sweep_rows["Lokalitet_ID"])
+        gvfk_codes, self.gvfks = pd.factorize(sweep_rows["GVFK"])
+        cat_codes, self.categories = pd.factorize(sweep_rows["Final_Category"], sort=True)
+
+        # Sort rows by (parameter, distance) once; each parameter is a contiguous block
+        distances = sweep_rows["Distance_to_River_m"].to_numpy(dtype=float)
+        order = np.lexsort((distances, key_codes))
+        self.key_codes = key_codes[order]
+        self.distances = distances[order]
+        self.site_codes = site_codes[order]
+        self.gvfk_codes = gvfk_codes[order]
+        self.cat_codes = cat_codes[order]
+
+        self.block_start = np.searchsorted(self.key_codes, np.arange(len(self.keys)))
+        # Position of every row inside its parameter block
+        self.rank = np.arange(len(self.key_codes)) - self.block_start[self.key_codes]
+
+        # One integer search key per row: (parameter, dense distance rank) packed
+        # as key_code * stride + rank + 1, non-decreasing in the sort order
+        self.unique_distances = np.unique(self.distances)
+        self.stride = len(self.unique_distances) + 1
+        self.search_keys = (
+            self.key_codes.astype(np.int64) * self.stride
+            + np.searchsorted(self.unique_distances, self.distances)
+            + 1
+        )
+
+    def _cutoffs(self, thresholds: np.ndarray) -> np.ndarray:
+        """
+        Number of qualifying rows per parameter block (distance <= threshold).
+
+        thresholds is (..., n_keys); all blocks and vectors are answered by one
+        searchsorted over the packed search keys.
+        """
+        thresholds = np.asarray(thresholds, dtype=float)
+        # Unique distances <= threshold; target stays inside the parameter's block
+        below = np.searchsorted(self.unique_distances, thresholds, side="right")
+        target = np.arange(len(self.keys), dtype=np.int64) * self.stride + below
+        return np.searchsorted(self.search_keys, target, side="right") - self.block_start
+
+    def evaluate(self, threshold_vectors: np.ndarray) -> pd.DataFrame:
+        """
+        Count qualifying combinations/sites/GVFKs for each threshold vector.
+
+        Args:
+            threshold_vectors: array (n_vectors × n_keys) aligned with self.keys
+
+        Returns:
+            Long DataFrame with Scenario_ID, Qualifying_Category, Combinations,
+            Sites, GVFKs (plus a TOTAL category per scenario).
+        """
+        n_cats = len(self.categories)
+        n_sites = len(self.sites)
+        n_gvfks = len(self.gvfks)
+        records: List[Dict[str, object]] = []
+
+        all_cuts = self._cutoffs(threshold_vectors)
+        for scenario_id, cuts in enumerate(all_cuts):
+            mask = self.rank < cuts[self.key_codes]
+
+            cats = self.cat_codes[mask]
+            sites = self.site_codes[mask]
+            gvfks = self.gvfk_codes[mask]
+
+            combos_per_cat = np.bincount(cats, minlength=n_cats)
+            sites_per_cat = np.bincount(
+                np.unique(cats * n_sites + sites) // n_sites, minlength=n_cats
+            )
+            gvfks_per_cat = np.bincount(
+                np.unique(cats * n_gvfks + gvfks) // n_gvfks, minlength=n_cats
+            )
+
+            for c, category in enumerate(self.categories):
+                records.append(
+                    {
+                        "Scenario_ID": scenario_id,
+                        "Qualifying_Category": category,
+                        "Combinations": int(combos_per_cat[c]),
+                        "Sites": int(sites_per_cat[c]),
+                        "GVFKs": int(gvfks_per_cat[c]),
+                    }
+                )
+            records.append(
+                {
+                    "Scenario_ID": scenario_id,
+                    "Qualifying_Category": TOTAL_LABEL,
+                    "Combinations": int(mask.sum()),
+                    "Sites": int(np.unique(sites).size),
+                    "GVFKs": int(np.unique(gvfks).size),
+                }
+            )
+
+        return pd.DataFrame.from_records(records)
+
+
+def run_threshold_sweep(
+    grid: pd.DataFrame | List[Dict[str, float]],
+    distance_results: pd.DataFrame | None = None,
+    save: bool = True,
+) -> pd.DataFrame:
+    """
+    Evaluate a grid of threshold vectors against the Step 4 distances.
+
+    Args:
+        grid: One row per scenario; columns are parameter names (see module
+            docstring). Missing columns / NaN cells fall back to the baseline.
+        distance_results: Step 4 site-GVFK table (loaded from disk if omitted)
+        save: Write step5_threshold_sweep.csv
+
+    Returns:
+        Tidy results table (see module docstring). Scenario_ID 0 is always the
+        baseline, so its TOTAL row reproduces the Step 5b counts.
+    """
+    if distance_results is None:
+        distance_results = pd.read_csv(
+            get_output_path("step4_final_distances_for_risk_assessment")
+        )
+
+    grid = pd.DataFrame(grid).reset_index(drop=True)
+    baseline = baseline_thresholds()
+    unknown = [name for name in grid.columns if name not in baseline]
+    if unknown:
+        raise KeyError(
+            f"Unknown threshold parameter(s): {', '.join(unknown)}. "
+            f"Available: {', '.join(sorted(baseline))}"
+        )
+
+    # Scenario 0 = baseline
+    grid = pd.concat([pd.DataFrame([{}], columns=grid.columns), grid], ignore_index=True)
+
+    sweep = ThresholdSweep(build_sweep_rows(distance_results))
+
+    full = pd.DataFrame({key: baseline.get(key, np.nan) for key in sweep.keys}, index=grid.index)
+    for name in grid.columns:
+        if name in full.columns:
+            full[name] = grid[name].fillna(full[name])
+
+    results = sweep.evaluate(full[list(sweep.keys)].to_numpy(dtype=float))
+
+    # Parameters that govern no row cannot change any count
+    idle = [name for name in grid.columns if name not in full.columns]
+    if idle:
+        print(
+            f"  NOTE: {len(idle)} parameter(s) govern no rows - their scenarios equal "
+            f"the baseline: {', '.join(idle)}"
+        )
+
+    # Identify scenarios by the effective value of every requested parameter
+    varied = list(grid.columns)
+    scenario_params = pd.DataFrame(
+        {name: grid[name].fillna(baseline[name]) for name in varied}, index=grid.index
+    )
+    scenario_params["Scenario_ID"] = scenario_params.index
+    results = scenario_params.merge(results, on="Scenario_ID", how="right")
+
+    if save:
+        output_path = get_output_path("step5_threshold_sweep")
+        results.to_csv(output_path, index=False, encoding="utf-8")
+        print(f"  Saved threshold sweep ({len(grid)} scenarios): {output_path}")
+
+    return results
+
+
+if __name__ == "__main__":
+    # Literature sensitivity: each threshold varied on its own over a common range
+    sweep_values = [30, 50, 70, 100, 150, 200, 250, 300, 500, 750, 1000]
+    results = run_threshold_sweep(one_at_a_time_grid(sweep_values))
+    totals = results[results["Qualifying_Category"] == TOTAL_LABEL]
+    print(totals.head(20).to_string(index=False))
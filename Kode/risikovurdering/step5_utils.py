@@ -9,8 +9,10 @@ GVFK handling, and file operations.
 from __future__ import annotations
 
 from pathlib import Path
+import re
 import sys
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 
@@ -23,6 +25,7 @@ from config import (
     WORKFLOW_SETTINGS,
     get_output_path,
 )
+from data_loaders import load_site_substances
 from risikovurdering.compound_categories import (
     DEFAULT_DISTANCE,
     categorize_substance,
@@ -45,11 +48,111 @@ def categorize_contamination_substance(substance_text: str):
     return category, float(distance)
 
 
+# Landfill keywords searched in branch/activity text (case-insensitive substring match).
+# 'depon' also covers 'deponi'/'deponering'; 'fyld' covers 'fyldplads'/'opfyldning'.
+# These broad keywords drive the Is_Landfill_* flags: site qualification and the
+# landfill distance thresholds in Step 5b.
+LANDFILL_KEYWORDS = ["losseplads", "affald", "depon", "fyld", "skraldeplads"]
+_LANDFILL_PATTERN = re.compile("|".join(re.escape(kw) for kw in LANDFILL_KEYWORDS))
+
+# Stricter keywords for classifying a site as LOSSEPLADS (branch/activity-only
+# sites and the landfill override): only 'fyldplads', so e.g. 'påfyldning' is
+# not re-tagged as a landfill.
+LANDFILL_CATEGORY_KEYWORDS = ["losseplads", "affald", "depon", "fyldplads", "skraldeplads"]
+_LANDFILL_CATEGORY_PATTERN = re.compile(
+    "|".join(re.escape(kw) for kw in LANDFILL_CATEGORY_KEYWORDS)
+)
+
+LANDFILL_FLAG_COLUMNS = {
+    "Lokalitetensbranche": "Is_Landfill_Branch",
+    "Lokalitetensaktivitet": "Is_Landfill_Activity",
+}
+# Branch OR activity matches LANDFILL_CATEGORY_KEYWORDS
+LANDFILL_CATEGORY_FLAG = "Is_Landfill_Category"
+
+
+def detect_landfill_keywords(values: pd.Series, pattern: re.Pattern = _LANDFILL_PATTERN) -> pd.Series:
+    """
+    Return the landfill keyword found in each value (NaN if none).
+
+    The regex is evaluated once per unique string and mapped back onto the rows,
+    so repeated branch/activity texts are only scanned once. pattern defaults to
+    the broad LANDFILL_KEYWORDS.
+    """
+    text = values.fillna("").astype(str).str.lower()
+    unique_text = text.drop_duplicates()
+    matches = {}
+    for value in unique_text:
+        match = pattern.search(value)
+        matches[value] = match.group(0) if match else None
+    return text.map(matches)
+
+
+def add_landfill_flags(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Attach Is_Landfill_Branch / Is_Landfill_Activity boolean columns, plus
+    Is_Landfill_Category for the stricter LOSSEPLADS classification.
+
+    Missing branch/activity columns yield all-False flags.
+    """
+    global _KEYWORD_STATS
+    _KEYWORD_STATS["total_checks"] += len(df)
+
+    df[LANDFILL_CATEGORY_FLAG] = False
+    for text_col, flag_col in LANDFILL_FLAG_COLUMNS.items():
+        if text_col not in df.columns:
+            df[flag_col] = False
+            continue
+        keywords = detect_landfill_keywords(df[text_col])
+        df[flag_col] = keywords.notna().to_numpy()
+        # Category keywords are a subset: only rows with a broad match can hit
+        strict = keywords.notna().to_numpy().copy()
+        strict[strict] = detect_landfill_keywords(
+            df.loc[strict, text_col], _LANDFILL_CATEGORY_PATTERN
+        ).notna().to_numpy()
+        df[LANDFILL_CATEGORY_FLAG] = df[LANDFILL_CATEGORY_FLAG].to_numpy() | strict
+
+        stats_key = "branch" if flag_col == "Is_Landfill_Branch" else "activity"
+        for keyword, count in keywords.value_counts().items():
+            _KEYWORD_STATS[stats_key][keyword] = (
+                _KEYWORD_STATS[stats_key].get(keyword, 0) + int(count)
+            )
+
+    return df
+
+
+def ensure_landfill_flags(df: pd.DataFrame) -> pd.DataFrame:
+    """Add landfill flags unless they were already attached (e.g. by Step 4)."""
+    flag_columns = list(LANDFILL_FLAG_COLUMNS.values()) + [LANDFILL_CATEGORY_FLAG]
+    if all(col in df.columns for col in flag_columns):
+        for col in flag_columns:
+            df[col] = df[col].fillna(False).astype(bool)
+        return df
+    return add_landfill_flags(df)
+
+
+def is_landfill_site(df: pd.DataFrame) -> pd.Series:
+    """Boolean mask: branch OR activity text contains a landfill keyword."""
+    return df["Is_Landfill_Branch"] | df["Is_Landfill_Activity"]
+
+
+def is_landfill_category_site(df: pd.DataFrame) -> pd.Series:
+    """
+    Boolean mask: branch OR activity text contains a LANDFILL_CATEGORY_KEYWORDS
+    keyword, i.e. the site is classified as LOSSEPLADS (branch-only sites and
+    the landfill override). A subset of is_landfill_site().
+    """
+    return df[LANDFILL_CATEGORY_FLAG]
+
+
 def categorize_by_branch_activity(branch_text, activity_text):
     """
     Categorize sites by branch/activity data when no substance data is available.
     Currently handles LOSSEPLADS category identification.
 
+    Single-row convenience wrapper; bulk callers should use the precomputed
+    Is_Landfill_* flags from add_landfill_flags().
+
     Args:
         branch_text (str): Branch data
         activity_text (str): Activity data
@@ -57,48 +160,62 @@ def categorize_by_branch_activity(branch_text, activity_text):
     Returns:
         tuple: (category_name, distance_m) or ('ANDRE', default_distance)
     """
-    global _KEYWORD_STATS
-    _KEYWORD_STATS["total_checks"] += 1
-
-    def contains_landfill_terms(text):
-        if pd.isna(text):
-            return False, None
-        text_lower = str(text).lower()
-        landfill_keywords = [
-            "losseplads",
-            "affald",
-            "depon",
-            "fyldplads",
-            "skraldeplads",
-        ]
-
-        # Check each keyword and return which one matched
-        for keyword in landfill_keywords:
-            if keyword in text_lower:
-                return True, keyword
-        return False, None
-
-    # Check branch and activity data
-    branch_match, branch_keyword = contains_landfill_terms(branch_text)
-    activity_match, activity_keyword = contains_landfill_terms(activity_text)
-
-    # Track statistics
-    if branch_match:
-        _KEYWORD_STATS["branch"][branch_keyword] = (
-            _KEYWORD_STATS["branch"].get(branch_keyword, 0) + 1
-        )
-    if activity_match:
-        _KEYWORD_STATS["activity"][activity_keyword] = (
-            _KEYWORD_STATS["activity"].get(activity_keyword, 0) + 1
-        )
-
-    if branch_match or activity_match:
+    texts = pd.Series([branch_text, activity_text], dtype=object)
+    if detect_landfill_keywords(texts, _LANDFILL_CATEGORY_PATTERN).notna().any():
         return "LOSSEPLADS", get_category_distance("LOSSEPLADS")
 
     # Default to ANDRE category for non-landfill branch-only sites
     return "ANDRE", DEFAULT_DISTANCE
 
 
+def get_site_substances(distance_results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the long site-GVFK-substance table (Lokalitet_ID, GVFK, Substance).
+
+    Uses the table materialized by Step 3; if it is missing (older results),
+    the Lokalitetensstoffer strings of `distance_results` are split once instead.
+    """
+    site_substances = load_site_substances()
+    if site_substances is not None:
+        return site_substances
+
+    from risikovurdering.step3_v1v2_sites import build_site_substance_table
+
+    print("  Note: Step 3 site-substance table not found - splitting Lokalitetensstoffer")
+    site_substances, dictionary = build_site_substance_table(
+        distance_results, "Lokalitet_ID", "GVFK", "Lokalitetensstoffer"
+    )
+    site_substances["Substance"] = pd.Categorical.from_codes(
+        site_substances["Substance_ID"].to_numpy(), categories=dictionary["Substance"]
+    )
+    return site_substances
+
+
+def explode_site_substances(
+    distance_results: pd.DataFrame, site_substances: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Pair each site-GVFK row with its substances.
+
+    Returns:
+        DataFrame with `_row` (position in distance_results) and `Substance`
+        (categorical), one row per substance, in input row order.
+    """
+    keys = pd.DataFrame(
+        {
+            "_row": np.arange(len(distance_results)),
+            "Lokalitet_ID": distance_results["Lokalitet_ID"].to_numpy(),
+            "GVFK": distance_results["GVFK"].to_numpy(),
+        }
+    )
+    exploded = keys.merge(
+        site_substances[["Lokalitet_ID", "GVFK", "Substance"]],
+        on=["Lokalitet_ID", "GVFK"],
+        how="inner",
+    )
+    return exploded[["_row", "Substance"]].sort_values("_row", kind="stable")
+
+
 def get_keyword_stats():
     """Return current keyword matching statistics."""
     return _KEYWORD_STATS.copy()
@@ -149,6 +266,32 @@ def create_gvfk_shapefile(high_risk_combinations, output_key):
         print(f"  Warning: Could not create shapefile {output_key}: {e}")
 
 
+def has_substance_tokens(substances: pd.Series) -> pd.Series:
+    """
+    Boolean mask: the Lokalitetensstoffer text holds at least one substance.
+
+    Tokenized like build_site_substance_table() (split on ";", stripped, empty
+    and "nan" tokens dropped), so a field such as ";" or " " has no substance.
+
+    >>> has_substance_tokens(pd.Series(["benzen; toluen", ";", " ; ", None, "nan", ""])).tolist()
+    [True, False, False, False, False, False]
+    """
+    tokens = (
+        substances.reset_index(drop=True)
+        .dropna()
+        .astype(str)
+        .str.split(";")
+        .explode()
+        .str.strip()
+    )
+    valid = (tokens != "") & (tokens != "nan")
+    has_tokens = valid.groupby(level=0).any()
+    return pd.Series(
+        has_tokens.reindex(range(len(substances)), fill_value=False).to_numpy(dtype=bool),
+        index=substances.index,
+    )
+
+
 def separate_sites_by_substance_data(distance_results):
     """
     Separate sites into those with and without qualifying data.
@@ -162,28 +305,13 @@ def separate_sites_by_substance_data(distance_results):
     Returns:
         tuple: (sites_with_qualifying_data, sites_without_qualifying_data)
     """
-    # Check which sites have substance data
-    has_substances = (
-        distance_results["Lokalitetensstoffer"].notna()
-        & (distance_results["Lokalitetensstoffer"].astype(str).str.strip() != "")
-        & (distance_results["Lokalitetensstoffer"].astype(str) != "nan")
-    )
+    # Check which sites have substance data (at least one substance token, as
+    # used by the Step 5b screening)
+    has_substances = has_substance_tokens(distance_results["Lokalitetensstoffer"])
 
     # Check which sites have landfill-related branch/activity data
-    def contains_landfill_terms(text):
-        if pd.isna(text):
-            return False
-        text_lower = str(text).lower()
-        landfill_keywords = ["losseplads", "affald", "deponi", "fyld", "skraldeplads"]
-        return any(keyword in text_lower for keyword in landfill_keywords)
-
-    has_landfill_branch = distance_results["Lokalitetensbranche"].apply(
-        contains_landfill_terms
-    )
-    has_landfill_activity = distance_results["Lokalitetensaktivitet"].apply(
-        contains_landfill_terms
-    )
-    has_landfill_data = has_landfill_branch | has_landfill_activity
+    distance_results = ensure_landfill_flags(distance_results)
+    has_landfill_data = is_landfill_site(distance_results)
 
     # Sites qualify if they have substances OR landfill data
     has_qualifying_data = has_substances | has_landfill_data
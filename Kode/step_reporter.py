@@ -161,9 +161,17 @@ def report_risikovurdering_summary(results: Dict[str, Any]):
 # SECTION 2: STEP 6 SPECIFIC REPORTING
 # ============================================================================
 
-def report_step6_filtering(audit_df: pd.DataFrame, initial_count: int):
+def report_step6_filtering(
+    audit_df: pd.DataFrame,
+    initial_count: int,
+    surviving_pairs: Optional[pd.DataFrame] = None,
+):
     """
     Report results of filtering audit.
+
+    surviving_pairs: Lokalitet_ID/GVFK of the rows left after all filters
+    (all chunks in chunked mode); adds the sites and GVFK that were removed
+    completely, counted over the whole run.
     """
     report_subsection("FILTERING CASCADE")
     print(f"  Input rows: {initial_count:,}")
@@ -178,6 +186,14 @@ def report_step6_filtering(audit_df: pd.DataFrame, initial_count: int):
     print(f"\n  Filtered total: {len(audit_df):,} rows ({len(audit_df)/initial_count*100:.1f}%)")
     report_breakdown("Reasons", reasons.to_dict(), indent=1)
 
+    if surviving_pairs is not None:
+        removed_sites = set(audit_df['Lokalitet_ID']) - set(surviving_pairs['Lokalitet_ID'])
+        removed_gvfk = set(audit_df['GVFK']) - set(surviving_pairs['GVFK'])
+        print(f"  Sites completely removed: {len(removed_sites):,} "
+              f"(of {audit_df['Lokalitet_ID'].nunique():,} with filtered rows)")
+        print(f"  GVFK completely removed: {len(removed_gvfk):,} "
+              f"(of {audit_df['GVFK'].nunique():,} with filtered rows)")
+
 
 def report_step6_flux_stats(input_rows: int, scenario_rows: int, dropped_summary: Dict[str, int]):
     """
@@ -47,7 +47,6 @@ from Kode.config import (
     RIVERS_LAYER_NAME,
     RIVERS_PATH,
     STEP6_PRIMARY_FLOW_SCENARIO,
-    STEP6_FLOW_SELECTION_MODE,
     get_output_path,
     get_visualization_path,
 )
@@ -109,8 +108,10 @@ def create_combined_impact_maps(
 
     # Load rivers and filter to GVFK contact segments (same logic as Step 4)
     from Kode.config import COLUMN_MAPPINGS, WORKFLOW_SETTINGS
+    from data_loaders import load_flow_selection, read_layer
 
-    rivers_all = gpd.read_file(RIVERS_PATH, layer=RIVERS_LAYER_NAME)
+    # Layers come from the process-wide cache (already read/projected in Step 6)
+    rivers_all = read_layer(RIVERS_PATH, RIVERS_LAYER_NAME, crs="EPSG:4326")
     rivers_all = rivers_all.reset_index().rename(columns={"index": "River_FID"})
     river_gvfk_col = COLUMN_MAPPINGS["rivers"]["gvfk_id"]
     contact_col = COLUMN_MAPPINGS["rivers"]["contact"]
@@ -131,22 +132,16 @@ def create_combined_impact_maps(
 
 
 
-    rivers_web = rivers.to_crs("EPSG:4326")
+    rivers_web = rivers
 
     # Keep all rivers for display context (but connections only to GVFK segments)
-    rivers_all_web = rivers_all.to_crs("EPSG:4326")
+    rivers_all_web = rivers_all
 
-    # Load Q-points with geometries
-    qpoints = gpd.read_file(
-        RIVER_FLOW_POINTS_PATH, layer=RIVER_FLOW_POINTS_LAYER
+    # Load Q-points with geometries (layers without CRS are taken as EPSG:25832)
+    qpoints_web = read_layer(
+        RIVER_FLOW_POINTS_PATH, RIVER_FLOW_POINTS_LAYER, crs="EPSG:4326"
     )
 
-    # Set CRS if not defined (Danish data is EPSG:25832)
-    if qpoints.crs is None:
-        qpoints = qpoints.set_crs("EPSG:25832")
-
-    qpoints_web = qpoints.to_crs("EPSG:4326")
-
     # Load Cmix results for Q95 scenario
 
     cmix_path = get_output_path("step6_cmix_results")
@@ -161,9 +156,8 @@ def create_combined_impact_maps(
             np.nan,
         )
 
-    # Identify which Q-point to use per river segment (max Q95)
-
-    qpoint_lookup = _build_qpoint_lookup_v2(qpoints_web)
+    # Q-point used per river segment (selection persisted by Step 6)
+    qpoint_lookup = _qpoint_lookup_from_selection(load_flow_selection(), qpoints_web)
 
     scenario_enabled = STEP6_MAP_SETTINGS.get("generate_combined_maps", True)
     if scenario_enabled:
@@ -200,175 +194,49 @@ def create_combined_impact_maps(
 
 
 
-# Old _build_qpoint_lookup() removed - superseded by _build_qpoint_lookup_v2()
-# The v2 function supports multiple flow scenarios (Q05-Q95) and has better error handling.
-# Old function only handled Q95 with Dict[str, Tuple] format.
-# New function returns Dict[str, Dict] with both 'by_ov' and 'by_fid' lookups.
-
-
-def _build_qpoint_lookup_v2(qpoints_gdf: gpd.GeoDataFrame) -> Dict[str, Dict]:
+def _qpoint_lookup_from_selection(
+    selection: pd.DataFrame | None, qpoints_web: gpd.GeoDataFrame
+) -> Dict[str, Dict]:
     """
-    Flow lookup with mode toggle (STEP6_FLOW_SELECTION_MODE).
-
-    Modes:
-    - max_per_ov: max Q per ov_id per scenario (entire river)
-    - max_near_segment: max Q from Q-points within 100m buffer of segment
-    - downstream_per_segment: nearest Q-point to segment's downstream end (NEW)
+    Q-point lookup from the flow selection persisted by Step 6
+    (data_loaders.load_flow_selection), so the maps show the Q-points that
+    were used for Cmix without repeating the spatial selection.
 
     Returns:
       {
-        "by_ov": {(ov_id, scenario): (flow, geom)},
-        "by_fid": {(fid, scenario): (flow, geom)},
+        "by_ov": {(ov_id, scenario): (flow, geom)},   # ov_id max rows
+        "by_fid": {(fid, scenario): (flow, geom)},    # every selected segment
         "fallback_count": int  # segments that used river-level fallback
       }
     """
     result: Dict[str, Dict] = {"by_ov": {}, "by_fid": {}, "fallback_count": 0}
-
-    valid_qpoints = qpoints_gdf[qpoints_gdf["ov_id"].notna()].copy()
-    if valid_qpoints.empty:
-        print("      WARNING: No Q-points with valid ov_id found!")
+    if selection is None or selection.empty:
+        print("      WARNING: No Step 6 flow selection available; Q-points are not shown.")
         return result
 
-    scenario_cols = [c for c in ["Q05", "Q10", "Q50", "Q90", "Q95"] if c in valid_qpoints.columns]
-    if not scenario_cols:
-        print("      WARNING: No flow scenario columns found in Q-points!")
-        return result
-
-    flow_long = valid_qpoints.melt(
-        id_vars=["ov_id", "geometry"],
-        value_vars=scenario_cols,
-        var_name="Scenario",
-        value_name="Flow_m3_s",
+    used = selection[selection["Qpoint_Index"].notna() & selection["Flow_m3_s"].notna()]
+    geoms = qpoints_web.geometry.to_numpy()[used["Qpoint_Index"].to_numpy(dtype=np.int64)]
+    for fid, ov_id, scenario, flow, source, geom in zip(
+        used["Nearest_River_FID"],
+        used["Nearest_River_ov_id"],
+        used["Flow_Scenario"],
+        used["Flow_m3_s"],
+        used["Flow_Source"],
+        geoms,
+    ):
+        result["by_fid"][(int(fid), scenario)] = (flow, geom)
+        if source == "ov_id_max":
+            result["by_ov"][(str(ov_id), scenario)] = (flow, geom)
+
+    fallback = selection.loc[selection["Is_Fallback"], "Nearest_River_FID"]
+    result["fallback_count"] = int(fallback.nunique())
+    print(
+        f"      Loaded Q-point lookup ({selection['Selection_Mode'].iloc[0]}: "
+        f"{len(result['by_fid'])} keys, fallback used: {result['fallback_count']} segments)"
     )
-    flow_long = flow_long[flow_long["Flow_m3_s"].notna() & (flow_long["Flow_m3_s"] > 0)]
-
-    # Max per ov_id per scenario (always computed as fallback)
-    idx_max = flow_long.groupby(["ov_id", "Scenario"])["Flow_m3_s"].idxmax()
-    max_ov = flow_long.loc[idx_max]
-    for _, row in max_ov.iterrows():
-        key = (str(row["ov_id"]), row["Scenario"])
-        result["by_ov"][key] = (row["Flow_m3_s"], row.geometry)
-
-    # Early exit for max_per_ov mode
-    if STEP6_FLOW_SELECTION_MODE == "max_per_ov":
-        print(f"      Built Q-point lookup (max_per_ov: {len(result['by_ov'])} keys)")
-        return result
-
-    # Load rivers for segment-based modes
-    try:
-        rivers = gpd.read_file(RIVERS_PATH, layer=RIVERS_LAYER_NAME)
-        rivers = rivers.reset_index().rename(columns={"index": "River_FID"})
-    except Exception as exc:
-        print(f"      WARNING: Cannot load rivers for segment mode ({exc}); using max_per_ov fallback.")
-        return result
-
-    if rivers.crs != valid_qpoints.crs:
-        try:
-            rivers = rivers.to_crs(valid_qpoints.crs)
-        except Exception:
-            print("      WARNING: CRS mismatch; using max_per_ov fallback.")
-            return result
-
-    # Ensure projected CRS for distance calculations
-    rivers_proj = rivers
-    qpoints_proj = valid_qpoints
-    try:
-        if rivers_proj.crs.is_geographic:
-            rivers_proj = rivers_proj.to_crs(epsg=25832)
-            qpoints_proj = valid_qpoints.to_crs(epsg=25832)
-    except Exception:
-        pass
-
-    fallback_count = 0
-
-    if STEP6_FLOW_SELECTION_MODE == "downstream_per_segment":
-        # For each segment, find nearest Q-point on same ov_id
-        # Use segment endpoint (downstream end) for distance calculation
-        for _, seg in rivers_proj.iterrows():
-            seg_fid = seg.get("River_FID")
-            seg_ov_id = str(seg.get("ov_id", ""))
-            if pd.isna(seg_fid) or seg.geometry is None or not seg_ov_id:
-                continue
-            try:
-                seg_fid_int = int(seg_fid)
-            except Exception:
-                continue
-
-            # Get Q-points on same river
-            ov_qpoints = qpoints_proj[qpoints_proj["ov_id"] == seg_ov_id]
-            if ov_qpoints.empty:
-                fallback_count += 1
-                continue
-
-            # Get segment's downstream endpoint (last coordinate)
-            try:
-                coords = list(seg.geometry.coords)
-                downstream_pt = coords[-1]  # Assuming line direction is upstream→downstream
-                from shapely.geometry import Point
-                downstream_geom = Point(downstream_pt)
-            except Exception:
-                # Fallback to centroid
-                downstream_geom = seg.geometry.centroid
-
-            # Find nearest Q-point to downstream end
-            distances = ov_qpoints.geometry.distance(downstream_geom)
-            nearest_idx = distances.idxmin()
-            nearest_qpoint = ov_qpoints.loc[nearest_idx]
-
-            # Get original WGS84 geometry for map display
-            orig_qpoint = valid_qpoints.loc[nearest_idx]
-
-            # Add entry for each scenario
-            for scenario in scenario_cols:
-                flow_val = nearest_qpoint.get(scenario)
-                if pd.notna(flow_val) and flow_val > 0:
-                    key = (seg_fid_int, scenario)
-                    result["by_fid"][key] = (flow_val, orig_qpoint.geometry)
-
-        result["fallback_count"] = fallback_count
-        print(
-            f"      Built Q-point lookup (downstream_per_segment: {len(result['by_fid'])} keys, "
-            f"fallback used: {fallback_count} segments)"
-        )
-
-    elif STEP6_FLOW_SELECTION_MODE == "max_near_segment":
-        # Original max_near_segment logic (buffer-based)
-        buffer_dist = 100  # meters
-        flow_proj = flow_long.copy()
-        flow_proj["geometry"] = qpoints_proj["geometry"].reindex(flow_long.index).values
-
-        flow_proj = flow_proj.reset_index(drop=True)
-        for _, seg in rivers_proj.iterrows():
-            seg_fid = seg.get("River_FID")
-            if pd.isna(seg_fid) or seg.geometry is None:
-                continue
-            try:
-                seg_fid_int = int(seg_fid)
-            except Exception:
-                continue
-
-            dists = flow_proj.geometry.distance(seg.geometry)
-            nearby_idx = dists <= buffer_dist
-            if not nearby_idx.any():
-                fallback_count += 1
-                continue
-
-            nearby = flow_proj[nearby_idx]
-            idx_max_near = nearby.groupby("Scenario")["Flow_m3_s"].idxmax()
-            max_near = nearby.loc[idx_max_near]
-            for _, row in max_near.iterrows():
-                key = (seg_fid_int, row["Scenario"])
-                orig_geom = flow_long.loc[row.name, "geometry"] if "geometry" in flow_long.columns else row.geometry
-                result["by_fid"][key] = (row["Flow_m3_s"], orig_geom)
-
-        result["fallback_count"] = fallback_count
-        print(
-            f"      Built Q-point lookup (max_near_segment: {len(result['by_fid'])} keys, "
-            f"fallback used: {fallback_count} segments)"
-        )
-
     return result
 
+
 def _create_scenario_map(
     scenario: str,
     site_flux: pd.DataFrame,
@@ -1136,9 +1004,12 @@ def _aggregate_gvfk_impacts(
 
 def _load_gvfk_geodata() -> Tuple[gpd.GeoDataFrame, str] | None:
     """Load GVFK polygons for overall maps."""
+    from data_loaders import read_layer
+
     gvfk_id_column = COLUMN_MAPPINGS["grundvand"]["gvfk_id"]
     try:
-        gdf = gpd.read_file(GRUNDVAND_PATH, layer=GRUNDVAND_LAYER_NAME)
+        # Cached layer; a missing CRS is taken as EPSG:25832
+        gdf = read_layer(GRUNDVAND_PATH, GRUNDVAND_LAYER_NAME, crs="EPSG:4326")
     except Exception as exc:
         print(f"      Error loading GVFK polygons: {exc}")
         return None
@@ -1147,14 +1018,6 @@ def _load_gvfk_geodata() -> Tuple[gpd.GeoDataFrame, str] | None:
         print(f"      GVFK id column '{gvfk_id_column}' not found in GVFK layer.")
         return None
 
-    try:
-        gdf = gdf.to_crs("EPSG:4326")
-    except Exception:
-        # If CRS is missing, assume EPSG:25832 then convert
-        if gdf.crs is None:
-            gdf = gdf.set_crs("EPSG:25832", allow_override=True)
-        gdf = gdf.to_crs("EPSG:4326")
-
     return gdf, gvfk_id_column
 
 
@@ -0,0 +1,167 @@
+"""
+Step 6 – Daily Flow (exceedance days)
+=====================================
+
+With daily discharge per Q-point (RIVER_DAILY_FLOW_PATH), Cmix follows the
+flow day by day:
+
+    Cmix(t) = Flux / Q(t)        Cmix(t) > MKK   <=>   Q(t) < Q* = Flux / MKK
+
+so a segment-substance exceeds MKK on the days its Q-point runs below the
+critical flow Q*. Each segment uses the Q-point of its Step 6 flow selection
+(STEP6_PRIMARY_FLOW_SCENARIO).
+
+The daily series are a (Q-points × days) memory map (data_loaders.
+load_daily_flow_series). Segment-substance rows are processed in blocks of
+STEP6_DAILY_FLOW_BLOCK_ROWS, sorted by Q-point: a block reads the series of its
+Q-points once and compares them with Q* on a (rows × days) boolean array, so
+neither the full array nor a long-format (row, day) table is held in memory.
+
+The percentile scenarios (step6_cmix_results.csv) and the flow-duration
+interpolation stay the fast path; this mode only runs with daily data.
+
+Usage:
+    from data_loaders import load_daily_flow_series
+    from tilstandsvurdering.step6_daily_flow import daily_exceedance
+
+    exceedance = daily_exceedance(cmix_results, segment_flows, load_daily_flow_series())
+
+Output (written by Step 6 to CORE_OUTPUTS["step6_daily_exceedance"]):
+    One row per (segment, category, substance) with Qpoint_Index,
+    Critical_Flow_m3_s, Valid_Days, Exceedance_Days, Exceedance_Day_Fraction
+    and Max_Exceedance_Run_Days (longest run of consecutive exceedance days).
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# Ensure repository root is importable
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from config import STEP6_DAILY_FLOW_BLOCK_ROWS, STEP6_PRIMARY_FLOW_SCENARIO
+from tilstandsvurdering.step6_flow_duration import critical_flow_m3_s
+from tilstandsvurdering.step6_tilstandsvurdering import (
+    SEGMENT_FLUX_GROUP_COLUMNS,
+    SEGMENT_KEY_COLUMNS,
+)
+
+DAILY_EXCEEDANCE_COLUMNS = SEGMENT_FLUX_GROUP_COLUMNS + [
+    "Qpoint_Index",
+    "Total_Flux_ug_per_year",
+    "MKK_ug_L",
+    "Critical_Flow_m3_s",
+    "Valid_Days",
+    "Exceedance_Days",
+    "Exceedance_Day_Fraction",
+    "Max_Exceedance_Run_Days",
+]
+
+
+def count_exceedance_days(
+    flows: np.ndarray,
+    series_rows: np.ndarray,
+    critical_flow: np.ndarray,
+    block_rows: int = STEP6_DAILY_FLOW_BLOCK_ROWS,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Days below the critical flow per row, in blocks of rows.
+
+    Args:
+        flows: (Q-points × days) daily flows, typically a read-only memmap
+        series_rows: Row in flows per input row (>= 0)
+        critical_flow: Q* per input row (m³/s)
+        block_rows: Input rows per block
+
+    Returns:
+        (valid_days, exceedance_days, max_run_days) per input row. Days
+        without a flow value (NaN) count as neither valid nor exceeding and
+        break a run.
+    """
+    n_rows, n_days = len(series_rows), flows.shape[1]
+    valid_days = np.zeros(n_rows, dtype=np.int64)
+    exceedance_days = np.zeros(n_rows, dtype=np.int64)
+    max_run_days = np.zeros(n_rows, dtype=np.int64)
+    day = np.arange(n_days, dtype=np.int32)
+
+    # Q-point order: consecutive blocks read neighbouring memmap rows
+    order = np.argsort(series_rows, kind="stable")
+    for start in range(0, n_rows, max(int(block_rows), 1)):
+        block = order[start : start + block_rows]
+        qpoints, local = np.unique(series_rows[block], return_inverse=True)
+        series = np.asarray(flows[qpoints])
+
+        below = series[local] < critical_flow[block, None]
+        valid_days[block] = np.isfinite(series).sum(axis=1)[local]
+        exceedance_days[block] = below.sum(axis=1)
+
+        # Run length = day - last day not below Q* (-1 before the series)
+        last_break = np.maximum.accumulate(np.where(below, np.int32(-1), day), axis=1)
+        max_run_days[block] = (day - last_break).max(axis=1) if n_days else 0
+    return valid_days, exceedance_days, max_run_days
+
+
+def daily_exceedance(
+    cmix_results: pd.DataFrame,
+    segment_flows: pd.DataFrame,
+    daily_flows: Tuple[np.ndarray, np.ndarray, pd.DatetimeIndex],
+    scenario: str = STEP6_PRIMARY_FLOW_SCENARIO,
+) -> pd.DataFrame:
+    """
+    Exceedance days per segment-substance from the daily Q-point flows.
+
+    Args:
+        cmix_results: step6_cmix_results rows (flux and MKK per segment-substance)
+        segment_flows: Output of _build_segment_flows() (Qpoint_Index per segment)
+        daily_flows: (flows, qpoint_index, dates) from load_daily_flow_series()
+        scenario: Flow scenario whose Q-point selection is used
+
+    Returns:
+        DAILY_EXCEEDANCE_COLUMNS. Rows without MKK or whose Q-point has no
+        daily series get NaN counts.
+    """
+    flows, qpoint_index, dates = daily_flows
+    rows = cmix_results.drop_duplicates(SEGMENT_FLUX_GROUP_COLUMNS)[
+        SEGMENT_FLUX_GROUP_COLUMNS + ["Total_Flux_ug_per_year", "MKK_ug_L"]
+    ]
+    selection = segment_flows.loc[
+        segment_flows["Flow_Scenario"] == scenario, SEGMENT_KEY_COLUMNS + ["Qpoint_Index"]
+    ].drop_duplicates(SEGMENT_KEY_COLUMNS)
+    rows = rows.merge(selection, on=SEGMENT_KEY_COLUMNS, how="left").reset_index(drop=True)
+    rows["Critical_Flow_m3_s"] = critical_flow_m3_s(
+        rows["Total_Flux_ug_per_year"].to_numpy(dtype=float),
+        rows["MKK_ug_L"].to_numpy(dtype=float),
+    )
+
+    qpoint = pd.array(rows["Qpoint_Index"], dtype="Int64").to_numpy(dtype=np.int64, na_value=-1)
+    series_rows = pd.Index(qpoint_index).get_indexer(qpoint)
+    counted = np.flatnonzero(
+        (series_rows >= 0) & (qpoint >= 0) & np.isfinite(rows["Critical_Flow_m3_s"].to_numpy())
+    )
+    valid_days, exceedance_days, max_run_days = count_exceedance_days(
+        flows, series_rows[counted], rows["Critical_Flow_m3_s"].to_numpy()[counted]
+    )
+
+    for column, values in (
+        ("Valid_Days", valid_days),
+        ("Exceedance_Days", exceedance_days),
+        ("Max_Exceedance_Run_Days", max_run_days),
+    ):
+        rows[column] = np.nan
+        rows.loc[counted, column] = values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rows["Exceedance_Day_Fraction"] = rows["Exceedance_Days"] / rows["Valid_Days"]
+    rows["Qpoint_Index"] = rows["Qpoint_Index"].astype("Int64")
+    print(
+        f"      Daily flows: {len(qpoint_index):,} Q-points × {len(dates):,} days "
+        f"({dates.min():%Y-%m-%d} - {dates.max():%Y-%m-%d}), {len(counted):,} of {len(rows):,} "
+        f"segment-substances counted"
+    )
+    return rows[DAILY_EXCEEDANCE_COLUMNS]
@@ -0,0 +1,150 @@
+"""
+Step 6 – Flow Duration (fraction of time exceeding MKK)
+=======================================================
+
+Step 6 evaluates Cmix at the discrete flow scenarios (Q05 … Q95), so a segment
+either exceeds MKK at a scenario or not. Flow Qp is exceeded a fraction p of
+the time (Q95: 95 %), and for a fixed flux
+
+    Cmix > MKK   <=>   Q < Q* = Flux / MKK
+
+so the fraction of time with MKK exceedance is 1 - p*, where Q(p*) = Q*.
+
+Flow-duration curve per segment: log Q is interpolated piecewise linearly
+against the standard normal quantile z(p) of the scenario probabilities. The
+interpolant is monotone (the scenario flows are made non-increasing in p
+first), a log-normal flow distribution is a straight line in these axes, and
+extrapolation beyond Q05/Q95 along the end segments stays inside 0 < p < 1.
+The inversion runs on a (rows × scenarios) matrix for all segment-substances
+at once.
+
+The flows of a segment come from one Q-point in the downstream_per_segment
+mode, so the curve is that Q-point's curve; the max modes combine the maxima
+per scenario.
+
+Usage:
+    from tilstandsvurdering.step6_flow_duration import exceedance_time_fraction
+
+    fractions = exceedance_time_fraction(cmix_results)
+
+Output (written by Step 6 to CORE_OUTPUTS["step6_exceedance_fraction"]):
+    One row per (segment, category, substance) with Total_Flux_ug_per_year,
+    MKK_ug_L, Critical_Flow_m3_s (Q*), Critical_Exceedance_Probability (p*),
+    Exceedance_Time_Fraction (1 - p*) and Outside_Scenario_Range (Q* outside
+    the scenario flows - extrapolated tail).
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+# Ensure repository root is importable
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from config import FLOW_SCENARIO_COLUMNS, SECONDS_PER_YEAR
+from tilstandsvurdering.step6_tilstandsvurdering import SEGMENT_FLUX_GROUP_COLUMNS
+
+FRACTION_COLUMNS = SEGMENT_FLUX_GROUP_COLUMNS + [
+    "Total_Flux_ug_per_year",
+    "MKK_ug_L",
+    "Critical_Flow_m3_s",
+    "Critical_Exceedance_Probability",
+    "Exceedance_Time_Fraction",
+    "Outside_Scenario_Range",
+]
+
+
+def critical_flow_m3_s(flux_ug_per_year: np.ndarray, mkk_ug_L: np.ndarray) -> np.ndarray:
+    """Flow Q* (m³/s) at which Cmix = MKK: flux (ug/s) / (MKK (ug/L) * 1000 L/m³)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return flux_ug_per_year / SECONDS_PER_YEAR / (mkk_ug_L * 1000.0)
+
+
+def scenario_exceedance_probabilities(scenarios: Iterable[str] | None = None) -> pd.Series:
+    """
+    Exceedance probability per flow scenario name (Q95 -> 0.95), ascending.
+    Names that are not Q<percent> are left out.
+    """
+    if scenarios is None:
+        scenarios = FLOW_SCENARIO_COLUMNS.values()
+    probabilities = {}
+    for scenario in scenarios:
+        match = re.fullmatch(r"Q(\d{1,2})", str(scenario))
+        if match and 0 < int(match.group(1)) < 100:
+            probabilities[scenario] = int(match.group(1)) / 100.0
+    return pd.Series(probabilities, dtype=float).sort_values()
+
+
+def exceedance_time_fraction(cmix_results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fraction of time each segment-substance exceeds MKK on its flow-duration curve.
+
+    Args:
+        cmix_results: step6_cmix_results rows (one per segment, substance and
+            flow scenario) with Total_Flux_ug_per_year, Flow_m3_s and MKK_ug_L
+
+    Returns:
+        FRACTION_COLUMNS, one row per segment-substance. The fraction is NaN
+        without MKK or without a positive flow in every scenario.
+    """
+    probabilities = scenario_exceedance_probabilities(
+        cmix_results["Flow_Scenario"].unique() if not cmix_results.empty else []
+    )
+    if len(probabilities) < 2:
+        return pd.DataFrame(columns=FRACTION_COLUMNS)
+
+    rows = cmix_results[cmix_results["Flow_Scenario"].isin(probabilities.index)]
+    row_codes, keys = pd.MultiIndex.from_frame(rows[SEGMENT_FLUX_GROUP_COLUMNS]).factorize()
+    scenario_codes = probabilities.index.get_indexer(rows["Flow_Scenario"])
+
+    # (rows × scenarios) flows, scenarios by ascending exceedance probability
+    flows = np.full((len(keys), len(probabilities)), np.nan)
+    flow_values = rows["Flow_m3_s"].to_numpy(dtype=float)
+    flows[row_codes, scenario_codes] = np.where(flow_values > 0, flow_values, np.nan)
+    _, first_row = np.unique(row_codes, return_index=True)
+    flux = rows["Total_Flux_ug_per_year"].to_numpy(dtype=float)[first_row]
+    mkk = rows["MKK_ug_L"].to_numpy(dtype=float)[first_row]
+
+    # Flow-duration curve: log Q against z(p), made non-increasing in p
+    z = ndtri(probabilities.to_numpy())
+    log_q = np.minimum.accumulate(np.log(flows), axis=1)
+    valid = ~np.isnan(log_q).any(axis=1) & (mkk > 0)
+
+    critical_flow = critical_flow_m3_s(flux, mkk)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        target = np.log(critical_flow)
+
+        # Knots at or above the target form a prefix; bracket (or end segment)
+        above = (log_q >= target[:, None]).sum(axis=1)
+        lower = np.clip(above - 1, 0, len(z) - 2)
+        row_index = np.arange(len(keys))
+        y0 = log_q[row_index, lower]
+        dy = log_q[row_index, lower + 1] - y0
+        z_critical = z[lower] + (target - y0) * (z[lower + 1] - z[lower]) / dy
+
+    # Flat end segment: the curve never reaches Q*
+    flat = dy == 0
+    z_critical[flat & (above == 0)] = -np.inf
+    z_critical[flat & (above > 0)] = np.inf
+    z_critical[~valid] = np.nan
+
+    critical_probability = ndtr(z_critical)
+    result = pd.DataFrame(
+        {column: keys.get_level_values(level) for level, column in enumerate(SEGMENT_FLUX_GROUP_COLUMNS)}
+    )
+    result["Total_Flux_ug_per_year"] = flux
+    result["MKK_ug_L"] = mkk
+    result["Critical_Flow_m3_s"] = np.where(valid, critical_flow, np.nan)
+    result["Critical_Exceedance_Probability"] = critical_probability
+    result["Exceedance_Time_Fraction"] = 1.0 - critical_probability
+    result["Outside_Scenario_Range"] = valid & ((above == 0) | (above == len(z)))
+    return result[FRACTION_COLUMNS]
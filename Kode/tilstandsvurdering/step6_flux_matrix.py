@@ -0,0 +1,279 @@
+"""
+Step 6 – Flux Matrix (what-if Cmix)
+===================================
+
+Cmix is linear in the standard concentration:
+
+    Flux_r = C_r · Σ_j A_j · I_j        Cmix_r,q = Flux_r / Q_r,q
+
+with r = (segment, category, scenario substance), j = (site, GVFK) and q the flow
+scenario. Step 6 persists the sparse matrix V[r, j] = A_j · I_j (m³/year) next
+to the flows per segment and scenario, so Cmix and MKK exceedances can be
+recomputed for alternative STANDARD_CONCENTRATIONS / MKK_THRESHOLDS with one
+sparse mat-vec - without re-sampling rasters or re-grouping the Step 6 frames.
+
+The matrix keeps the rows with -1 concentrations (LOSSEPLADS/ANDRE/PFAS) so an
+alternative concentration table can bring them into the assessment.
+
+Usage:
+    from tilstandsvurdering.step6_flux_matrix import load_flux_matrix
+
+    matrix = load_flux_matrix()
+    cmix = matrix.recompute(
+        standard_concentrations=my_concentrations,  # same sections as config
+        mkk_thresholds=my_thresholds,
+    )
+
+Outputs (written by Step 6 to CORE_OUTPUTS["step6_flux_matrix"]):
+    volumes.npz - V as scipy CSR matrix
+    rows.csv    - row keys (segment, category, substance, modelstof)
+    columns.csv - column keys (Lokalitet_ID, GVFK)
+    flows.csv   - Flow_m3_s (and Flow_Source) per segment and Flow_Scenario
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Ensure repository root is importable
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from config import get_output_path
+from tilstandsvurdering.step6_tilstandsvurdering import (
+    SEGMENT_KEY_COLUMNS,
+    _apply_mkk_thresholds,
+    _compute_cmix,
+    _resolve_concentrations,
+)
+
+ROW_KEY_COLUMNS = SEGMENT_KEY_COLUMNS + [
+    "Qualifying_Category",
+    "Qualifying_Substance",
+    "Modelstof",
+]
+ROW_INFO_COLUMNS = ["River_Segment_Name", "River_Segment_GVFK"]
+COLUMN_KEY_COLUMNS = ["Lokalitet_ID", "GVFK"]
+
+
+class FluxMatrix:
+    """Sparse (segment, scenario substance) x (site, GVFK) volume matrix with flows."""
+
+    def __init__(
+        self,
+        volumes: sparse.csr_matrix,
+        rows: pd.DataFrame,
+        columns: pd.DataFrame,
+        flows: pd.DataFrame,
+    ):
+        self.volumes = volumes
+        self.rows = rows.reset_index(drop=True)
+        self.columns = columns.reset_index(drop=True)
+        self.flows = flows.reset_index(drop=True)
+
+    def total_flux(
+        self,
+        standard_concentrations: Dict[str, Dict[str, float]] | None = None,
+        site_weights: np.ndarray | None = None,
+    ) -> pd.DataFrame:
+        """
+        Total flux per matrix row (µg/year) for a concentration table.
+
+        Args:
+            standard_concentrations: Alternative to STANDARD_CONCENTRATIONS
+            site_weights: Optional weight per matrix column (e.g. 0 to leave a
+                site-GVFK out); defaults to 1 for all columns
+
+        Returns:
+            Row keys with Standard_Concentration_ug_L, Concentration_Source_Level
+            and Total_Flux_ug_per_year. Rows with -1 concentration are dropped,
+            as in Step 6.
+        """
+        if site_weights is None:
+            site_weights = np.ones(self.volumes.shape[1])
+        volume_m3_yr = self.volumes @ np.asarray(site_weights, dtype=float)
+
+        concentrations = _resolve_concentrations(self.rows, standard_concentrations)
+        result = pd.concat([self.rows, concentrations], axis=1)
+        # µg/L -> µg/m³
+        result["Total_Flux_ug_per_year"] = (
+            volume_m3_yr * result["Standard_Concentration_ug_L"].to_numpy() * 1000.0
+        )
+        return result[result["Standard_Concentration_ug_L"] != -1].reset_index(drop=True)
+
+    def recompute(
+        self,
+        standard_concentrations: Dict[str, Dict[str, float]] | None = None,
+        mkk_thresholds: Dict[str, float] | None = None,
+        site_weights: np.ndarray | None = None,
+    ) -> pd.DataFrame:
+        """
+        Cmix and MKK exceedances for alternative concentrations/thresholds.
+
+        Returns:
+            One row per (segment, category, substance, flow scenario) with
+            Total_Flux_ug_per_year, Flow_m3_s, Cmix_ug_L, MKK_ug_L,
+            Exceedance_Flag and Exceedance_Ratio (same definitions as
+            step6_cmix_results.csv).
+        """
+        flux = self.total_flux(standard_concentrations, site_weights)
+        merged = flux.merge(self.flows, on=SEGMENT_KEY_COLUMNS, how="left")
+        cmix = _compute_cmix(merged)
+        return _apply_mkk_thresholds(cmix, mkk_thresholds)
+
+    def save(self, directory: Path) -> None:
+        """Write volumes.npz, rows.csv, columns.csv and flows.csv to directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(directory / "volumes.npz", self.volumes)
+        self.rows.to_csv(directory / "rows.csv", index=False, encoding="utf-8")
+        self.columns.to_csv(directory / "columns.csv", index=False, encoding="utf-8")
+        self.flows.to_csv(directory / "flows.csv", index=False, encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory: Path) -> "FluxMatrix":
+        directory = Path(directory)
+        return cls(
+            volumes=sparse.load_npz(directory / "volumes.npz").tocsr(),
+            rows=pd.read_csv(directory / "rows.csv", encoding="utf-8"),
+            columns=pd.read_csv(directory / "columns.csv", encoding="utf-8"),
+            flows=pd.read_csv(directory / "flows.csv", encoding="utf-8"),
+        )
+
+
+class FluxMatrixBuilder:
+    """
+    Build the flux matrix from Step 6 scenario rows, one chunk at a time.
+
+    add() reduces the rows of a chunk to (matrix row, matrix column, volume)
+    triplets and the chunk's row/column keys, so the scenario rows can be
+    released (chunked Step 6). build() assigns the sorted global keys and
+    assembles V.
+    """
+
+    def __init__(self):
+        self._rows: List[pd.DataFrame] = []
+        self._columns: List[pd.DataFrame] = []
+        self._volumes: List[sparse.coo_matrix] = []
+
+    @property
+    def empty(self) -> bool:
+        return not self._volumes
+
+    @property
+    def segments(self) -> pd.DataFrame:
+        """Segment keys (SEGMENT_KEY_COLUMNS) of all rows added so far."""
+        if self.empty:
+            return pd.DataFrame(columns=SEGMENT_KEY_COLUMNS)
+        return (
+            pd.concat([rows[SEGMENT_KEY_COLUMNS] for rows in self._rows], ignore_index=True)
+            .drop_duplicates()
+            .reset_index(drop=True)
+        )
+
+    def add(self, flux_rows: pd.DataFrame) -> None:
+        """Add scenario rows (output of _expand_flux_rows(), incl. -1 concentration rows)."""
+        if flux_rows.empty:
+            return
+        row_codes = flux_rows.groupby(ROW_KEY_COLUMNS, dropna=False, sort=True).ngroup().to_numpy()
+        column_codes = (
+            flux_rows.groupby(COLUMN_KEY_COLUMNS, dropna=False, sort=True).ngroup().to_numpy()
+        )
+        rows = _unique_keys(flux_rows, row_codes, ROW_KEY_COLUMNS + ROW_INFO_COLUMNS)
+        columns = _unique_keys(flux_rows, column_codes, COLUMN_KEY_COLUMNS)
+
+        # Area (m²) × infiltration (mm/year -> m/year) = m³/year
+        volume_m3_yr = (
+            flux_rows["Area_m2"].to_numpy() * flux_rows["Infiltration_mm_per_year"].to_numpy() / 1000.0
+        )
+        volumes = sparse.coo_matrix(
+            (volume_m3_yr, (row_codes, column_codes)), shape=(len(rows), len(columns))
+        )
+        volumes.sum_duplicates()
+
+        self._rows.append(rows)
+        self._columns.append(columns)
+        self._volumes.append(volumes)
+
+    def build(self, segment_flows: pd.DataFrame) -> FluxMatrix:
+        """
+        Assemble the flux matrix.
+
+        Args:
+            segment_flows: Output of _build_segment_flows() for the same segments
+        """
+        rows, row_codes = _merge_keys(self._rows, ROW_KEY_COLUMNS)
+        columns, column_codes = _merge_keys(self._columns, COLUMN_KEY_COLUMNS)
+        volumes = sparse.csr_matrix(
+            (
+                np.concatenate([part.data for part in self._volumes]),
+                (
+                    np.concatenate([codes[part.row] for codes, part in zip(row_codes, self._volumes)]),
+                    np.concatenate([codes[part.col] for codes, part in zip(column_codes, self._volumes)]),
+                ),
+            ),
+            shape=(len(rows), len(columns)),
+        )
+        volumes.sum_duplicates()
+
+        flows = segment_flows[SEGMENT_KEY_COLUMNS + ["Flow_Scenario", "Flow_m3_s", "Flow_Source"]]
+        return FluxMatrix(volumes, rows, columns, flows)
+
+
+def _unique_keys(frame: pd.DataFrame, codes: np.ndarray, key_columns: List[str]) -> pd.DataFrame:
+    """One row of key_columns per code, ordered by code."""
+    return (
+        frame.assign(_code=codes)
+        .drop_duplicates("_code")
+        .sort_values("_code")[key_columns]
+        .reset_index(drop=True)
+    )
+
+
+def _merge_keys(parts: List[pd.DataFrame], key_columns: List[str]):
+    """
+    Sorted union of per-chunk key frames.
+
+    Returns:
+        (keys, codes) - keys ordered as groupby(sort=True), and per part the
+        global code of each of its local keys
+    """
+    merged = pd.concat(parts, ignore_index=True)
+    global_codes = merged.groupby(key_columns, dropna=False, sort=True).ngroup().to_numpy()
+    keys = _unique_keys(merged, global_codes, list(merged.columns))
+    offsets = np.cumsum([len(part) for part in parts])[:-1]
+    return keys, np.split(global_codes, offsets)
+
+
+def build_flux_matrix(flux_rows: pd.DataFrame, segment_flows: pd.DataFrame) -> FluxMatrix:
+    """
+    Build the flux matrix from the Step 6 scenario rows.
+
+    Args:
+        flux_rows: Output of _expand_flux_rows() (incl. -1 concentration rows)
+        segment_flows: Output of _build_segment_flows() for the same segments
+
+    The concentration of a row only depends on its category, modelstof and
+    substance (the scenario rows carry no branch/activity context), so one
+    concentration per matrix row reproduces the Step 6 flux.
+    """
+    builder = FluxMatrixBuilder()
+    builder.add(flux_rows)
+    return builder.build(segment_flows)
+
+
+def load_flux_matrix() -> FluxMatrix:
+    """Load the flux matrix written by the last Step 6 run."""
+    directory = get_output_path("step6_flux_matrix")
+    if not (directory / "volumes.npz").exists():
+        raise FileNotFoundError(
+            f"Step 6 flux matrix not found in {directory} - run Step 6 first"
+        )
+    return FluxMatrix.load(directory)
@@ -0,0 +1,509 @@
+"""
+Step 6 – River Network (downstream accumulation)
+================================================
+
+Step 6 Cmix per segment only counts the sites whose nearest segment it is, so
+upstream loads never reach the segments below them. This module builds the
+river network topology from the segment endpoints and routes the segment flux
+downstream:
+
+    Flux_acc[s] = Flux_own[s] + Σ Flux_acc[u]   (u directly upstream of s)
+    Cmix_acc[s, q] = Flux_acc[s] / Q[s, q]
+
+with Q[s, q] the flow of segment s itself (same selection as Step 6).
+
+Topology:
+- A segment's downstream end (last vertex - lines are digitised upstream →
+  downstream, as in the downstream_per_segment flow mode) connects to the
+  segments starting within STEP6_NETWORK_SNAP_TOLERANCE_M of it (KD-tree
+  radius query).
+- With several candidates the segment on the same ov_id comes first (main
+  stem), then the lowest River_FID. Flux follows the first edge only, so loads
+  are never double counted at bifurcations.
+- Edges are stored as CSR arrays (downstream_indptr/downstream_indices).
+  Segments on closed loops (digitising errors) are treated as outlets.
+
+Accumulation runs level by level in topological order on a (segments × scenario
+substances) matrix, so all substances are routed in one pass of array
+operations.
+
+Reachability: every segment gets a pre-order DFS interval [dfs_in, dfs_out) of
+its upstream tree, so "is u upstream of s" is one range check, the segments
+upstream of s are one slice, and SiteReachability finds the sites upstream of a
+segment with a binary search.
+
+Linear referencing: QpointChainage snaps the Q-points onto their ov_id and
+stores their chainage (distance to the outlet along the network), so the
+downstream_per_segment flow mode picks the first Q-point at or below each
+segment end with a searchsorted instead of the Euclidean nearest one.
+
+Usage:
+    from tilstandsvurdering.step6_river_network import (
+        accumulate_segment_flux,
+        load_river_network,
+    )
+
+    network = load_river_network()
+    accumulated = accumulate_segment_flux(segment_flux, network)
+
+Output (written by Step 6 to CORE_OUTPUTS["step6_cmix_accumulated"]):
+    One row per (segment, category, substance, flow scenario) reached by any
+    upstream flux, with Own_Flux_ug_per_year, Upstream_Flux_ug_per_year,
+    Total_Flux_ug_per_year (accumulated) and the step6_cmix_results columns.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+# Ensure repository root is importable
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from config import COLUMN_MAPPINGS, STEP6_NETWORK_SNAP_TOLERANCE_M
+from data_loaders import load_river_segments
+from tilstandsvurdering.step6_tilstandsvurdering import (
+    SEGMENT_FLUX_GROUP_COLUMNS,
+    _apply_mkk_thresholds,
+    _build_segment_flows,
+    _compute_cmix,
+)
+
+SUBSTANCE_KEY_COLUMNS = ["Qualifying_Category", "Qualifying_Substance"]
+
+
+class RiverNetwork:
+    """River segments with downstream CSR adjacency and topological levels."""
+
+    def __init__(
+        self,
+        river_fid: np.ndarray,
+        ov_id: np.ndarray,
+        downstream_indptr: np.ndarray,
+        downstream_indices: np.ndarray,
+    ):
+        self.river_fid = np.asarray(river_fid)
+        self.ov_id = np.asarray(ov_id)
+        self.downstream_indptr = np.asarray(downstream_indptr)
+        self.downstream_indices = np.asarray(downstream_indices)
+
+        # Routing edge = first downstream candidate per segment (-1 = outlet)
+        has_edge = np.diff(self.downstream_indptr) > 0
+        self.downstream = np.full(len(self.river_fid), -1, dtype=np.int64)
+        self.downstream[has_edge] = self.downstream_indices[self.downstream_indptr[:-1][has_edge]]
+        self.levels, in_loops = _topological_levels(self.downstream)
+        self.loop_segment_count = 0
+        if in_loops.size:
+            self.downstream[in_loops] = -1
+            self.levels, _ = _topological_levels(self.downstream)
+            self.loop_segment_count = int(in_loops.size)
+
+        self._fid_index = pd.Index(self.river_fid)
+        self.dfs_in, self.dfs_out = _dfs_intervals(self.downstream, self.levels, self.accumulate)
+        self._by_dfs = np.argsort(self.dfs_in)
+
+    @property
+    def segment_count(self) -> int:
+        return len(self.river_fid)
+
+    def positions(self, river_fids) -> np.ndarray:
+        """Network position per River_FID (-1 if the segment is not in the network)."""
+        return self._fid_index.get_indexer(np.asarray(river_fids))
+
+    def accumulate(self, values: np.ndarray) -> np.ndarray:
+        """
+        Sum values (segments × k) over each segment and everything upstream of it.
+
+        One vectorized step per topological level: every segment of a level is
+        complete when its level is reached and adds its total to its downstream
+        segment.
+        """
+        accumulated = np.array(values, dtype=float, copy=True)
+        for level in self.levels:
+            level = level[self.downstream[level] >= 0]
+            if level.size:
+                np.add.at(accumulated, self.downstream[level], accumulated[level])
+        return accumulated
+
+    def distance_to_outlet(self, lengths: np.ndarray) -> np.ndarray:
+        """
+        Distance (m) along the routing path from each segment's downstream end
+        to its outlet, given the segment lengths per network position.
+        """
+        distance = np.zeros(self.segment_count)
+        # Outlet side first: a downstream segment sits on a higher level
+        for level in reversed(self.levels):
+            routed = level[self.downstream[level] >= 0]
+            parent = self.downstream[routed]
+            distance[routed] = distance[parent] + lengths[parent]
+        return distance
+
+    def is_upstream(self, upstream_position, segment_position) -> np.ndarray:
+        """
+        True where upstream_position drains into segment_position (a segment
+        counts as upstream of itself). O(1) per pair via the DFS intervals.
+        """
+        inner = self.dfs_in[upstream_position]
+        return (self.dfs_in[segment_position] <= inner) & (inner < self.dfs_out[segment_position])
+
+    def upstream_of(self, position: int) -> np.ndarray:
+        """Positions of the segment and every segment upstream of it."""
+        return self._by_dfs[self.dfs_in[position] : self.dfs_out[position]]
+
+    def downstream_of(self, position: int) -> np.ndarray:
+        """Positions from the segment down to its outlet (routing path)."""
+        path = [position]
+        while self.downstream[path[-1]] >= 0:
+            path.append(self.downstream[path[-1]])
+        return np.asarray(path, dtype=np.int64)
+
+
+class SiteReachability:
+    """
+    Sites by the DFS interval of their nearest segment, so the sites upstream of
+    any segment are one contiguous (binary-searched) slice.
+    """
+
+    def __init__(self, network: RiverNetwork, site_segments: pd.DataFrame):
+        """
+        Args:
+            network: RiverNetwork with DFS intervals
+            site_segments: Lokalitet_ID + Nearest_River_FID (e.g. from
+                step6_flux_site_segment.csv); duplicates are ignored
+        """
+        self.network = network
+        pairs = site_segments[["Lokalitet_ID", "Nearest_River_FID"]].drop_duplicates()
+        positions = network.positions(pairs["Nearest_River_FID"])
+        pairs = pairs[positions >= 0].assign(_position=positions[positions >= 0])
+        pairs["_dfs"] = network.dfs_in[pairs["_position"].to_numpy()]
+        self.sites = pairs.sort_values("_dfs", kind="stable").reset_index(drop=True)
+        self._site_dfs = self.sites["_dfs"].to_numpy()
+
+    def sites_upstream_of(self, river_fid) -> pd.DataFrame:
+        """Sites whose nearest segment is river_fid or drains into it."""
+        position = self.network.positions([river_fid])[0]
+        if position < 0:
+            return self.sites.iloc[0:0][["Lokalitet_ID", "Nearest_River_FID"]]
+        lo, hi = np.searchsorted(
+            self._site_dfs,
+            [self.network.dfs_in[position], self.network.dfs_out[position]],
+        )
+        return self.sites.iloc[lo:hi][["Lokalitet_ID", "Nearest_River_FID"]]
+
+    def segments_downstream_of_site(self, lokalitet_id: str) -> pd.DataFrame:
+        """Segments (River_FID, ov_id, steps from the site's own segment) below a site."""
+        positions = self.sites.loc[self.sites["Lokalitet_ID"] == lokalitet_id, "_position"]
+        rows = [
+            (self.network.river_fid[pos], self.network.ov_id[pos], step, self.network.river_fid[start])
+            for start in positions.unique()
+            for step, pos in enumerate(self.network.downstream_of(start))
+        ]
+        return pd.DataFrame(
+            rows, columns=["River_FID", "ov_id", "Steps_Downstream", "Site_Segment_FID"]
+        )
+
+
+class QpointChainage:
+    """
+    Linear-referencing index of the Q-points on the river network.
+
+    Each Q-point is snapped onto the nearest segment of its own ov_id and gets
+    a chainage: distance (m) along the network from the point to the outlet.
+    Chainages are sorted once per ov_id, so the first Q-point at or downstream
+    of a segment end is a binary search (first_downstream).
+    """
+
+    def __init__(
+        self,
+        network: RiverNetwork,
+        rivers: gpd.GeoDataFrame,
+        qpoints: gpd.GeoDataFrame,
+        tolerance_m: float = STEP6_NETWORK_SNAP_TOLERANCE_M,
+    ):
+        """
+        Args:
+            network: RiverNetwork over (at least) the segments in rivers
+            rivers: Segments with River_FID and geometry (metric CRS)
+            qpoints: Q-points with ov_id and geometry (same CRS as rivers)
+            tolerance_m: A Q-point this far upstream of a segment end still
+                counts as at the end
+        """
+        self.network = network
+        self.tolerance_m = tolerance_m
+        n_segments = network.segment_count
+
+        # Geometry and length per network position
+        positions = network.positions(rivers["River_FID"])
+        in_network = positions >= 0
+        self.segment_geoms = np.full(n_segments, None, dtype=object)
+        self.segment_geoms[positions[in_network]] = rivers.geometry.to_numpy()[in_network]
+        self.lengths = np.nan_to_num(shapely.length(self.segment_geoms))
+        self.end_chainage = network.distance_to_outlet(self.lengths)
+
+        # ov_id codes shared by segments and Q-points
+        self.segment_codes, ov_ids = pd.factorize(network.ov_id)
+        qpoint_codes = pd.Index(ov_ids).get_indexer(qpoints["ov_id"].astype(str).to_numpy())
+        qpoint_geoms = qpoints.geometry.to_numpy()
+        candidates = np.flatnonzero((qpoint_codes >= 0) & ~shapely.is_missing(qpoint_geoms))
+
+        # Snap: nearest segment of the same ov_id per Q-point (one distance call
+        # over all Q-point/segment pairs of a river)
+        segment_order = np.argsort(self.segment_codes, kind="stable")
+        group_size = np.bincount(self.segment_codes, minlength=len(ov_ids))
+        group_start = np.cumsum(group_size) - group_size
+        pair_count = group_size[qpoint_codes[candidates]]
+        pair_q = np.repeat(candidates, pair_count)
+        pair_offset = np.arange(len(pair_q)) - np.repeat(np.cumsum(pair_count) - pair_count, pair_count)
+        pair_seg = segment_order[np.repeat(group_start[qpoint_codes[candidates]], pair_count) + pair_offset]
+        distances = shapely.distance(qpoint_geoms[pair_q], self.segment_geoms[pair_seg])
+        distances = np.where(np.isnan(distances), np.inf, distances)
+        ranked = np.lexsort((distances, pair_q))
+        first = np.r_[True, pair_q[ranked][1:] != pair_q[ranked][:-1]] & np.isfinite(distances[ranked])
+        snapped_q = pair_q[ranked][first]
+        snapped_seg = pair_seg[ranked][first]
+
+        # Chainage = distance to outlet of the segment end + remaining length on the segment
+        along = shapely.line_locate_point(self.segment_geoms[snapped_seg], qpoint_geoms[snapped_q])
+        chainage = self.end_chainage[snapped_seg] + self.lengths[snapped_seg] - along
+
+        # Sorted per ov_id by chainage; among equal chainages the lowest Q-point
+        # row ends up last, i.e. is the one a right-side search lands on
+        order = np.lexsort((-snapped_q, chainage, qpoint_codes[snapped_q]))
+        self.qpoint = snapped_q[order]
+        self.segment = snapped_seg[order]
+        self.chainage = chainage[order]
+        self._codes = qpoint_codes[self.qpoint]
+        self._group_start = np.searchsorted(self._codes, np.arange(len(ov_ids) + 1))
+        # Offset per ov_id so one global searchsorted stays inside the ov_id:
+        # larger than any Q-point chainage and any search target
+        max_chainage = max(
+            self.end_chainage.max() if n_segments else 0.0,
+            self.chainage.max() if len(self.chainage) else 0.0,
+        )
+        self._span = float(max_chainage + tolerance_m + 1.0)
+        self._keys = self._codes * self._span + self.chainage
+
+    def first_downstream(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Q-point row (in the qpoints passed to the constructor) of the first
+        Q-point at or downstream of each segment's end on its own ov_id and on
+        its routing path; -1 where there is none.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        codes = self.segment_codes[positions]
+        target = codes * self._span + self.end_chainage[positions] + self.tolerance_m
+        candidate = np.searchsorted(self._keys, target, side="right") - 1
+        # Never start in a later ov_id's block
+        candidate = np.minimum(candidate, self._group_start[codes + 1] - 1)
+        lowest = self._group_start[codes]
+
+        # Walk down the sorted chainages past Q-points on other branches of the ov_id
+        selected = np.full(len(positions), -1, dtype=np.int64)
+        pending = np.flatnonzero(candidate >= lowest)
+        while pending.size:
+            on_path = self.network.is_upstream(positions[pending], self.segment[candidate[pending]])
+            selected[pending[on_path]] = self.qpoint[candidate[pending[on_path]]]
+            pending = pending[~on_path]
+            candidate[pending] -= 1
+            pending = pending[candidate[pending] >= lowest[pending]]
+        return selected
+
+
+def _dfs_intervals(downstream: np.ndarray, levels: List[np.ndarray], accumulate) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pre-order DFS intervals of the upstream trees: segment u is upstream of s
+    iff dfs_in[s] <= dfs_in[u] < dfs_out[s].
+
+    Computed without recursion: subtree sizes come from accumulate(1), and the
+    levels are walked from the outlets upwards, handing each child the next
+    free block of its downstream segment's interval.
+    """
+    n_segments = len(downstream)
+    size = accumulate(np.ones((n_segments, 1)))[:, 0].astype(np.int64)
+    dfs_in = np.zeros(n_segments, dtype=np.int64)
+
+    outlets = np.flatnonzero(downstream < 0)
+    dfs_in[outlets] = np.cumsum(size[outlets]) - size[outlets]
+    next_free = dfs_in + 1
+    for level in reversed(levels):
+        children = level[downstream[level] >= 0]
+        if not children.size:
+            continue
+        parent = downstream[children]
+        order = np.argsort(parent, kind="stable")
+        children, parent = children[order], parent[order]
+        # Offset of each child within the block its parent hands out at this level
+        group_start = np.r_[True, parent[1:] != parent[:-1]]
+        cumulative = np.cumsum(size[children])
+        offset = cumulative - size[children]
+        offset -= np.maximum.accumulate(np.where(group_start, offset, 0))
+        dfs_in[children] = next_free[parent] + offset
+        np.add.at(next_free, parent, size[children])
+        next_free[children] = dfs_in[children] + 1
+    return dfs_in, dfs_in + size
+
+
+def _topological_levels(downstream: np.ndarray) -> tuple[List[np.ndarray], np.ndarray]:
+    """
+    Kahn levels of the routing forest (each segment has at most one downstream
+    segment). Returns (levels, segments on closed loops that were never freed).
+    """
+    n_segments = len(downstream)
+    routed = downstream >= 0
+    indegree = np.bincount(downstream[routed], minlength=n_segments)
+    frontier = np.flatnonzero(indegree == 0)
+    levels: List[np.ndarray] = []
+    visited = np.zeros(n_segments, dtype=bool)
+    while frontier.size:
+        levels.append(frontier)
+        visited[frontier] = True
+        targets = downstream[frontier]
+        targets = targets[targets >= 0]
+        np.subtract.at(indegree, targets, 1)
+        targets = np.unique(targets)
+        frontier = targets[indegree[targets] == 0]
+    return levels, np.flatnonzero(~visited)
+
+
+def build_river_network(
+    rivers: gpd.GeoDataFrame, snap_tolerance_m: float = STEP6_NETWORK_SNAP_TOLERANCE_M
+) -> RiverNetwork:
+    """
+    Build the segment topology from line endpoints.
+
+    Args:
+        rivers: Segments with River_FID, ov_id and geometry (metric CRS)
+        snap_tolerance_m: Max distance (m) between a segment end and the start
+            of its downstream segment
+    """
+    river_id_col = COLUMN_MAPPINGS["rivers"]["river_id"]
+    river_fid = rivers["River_FID"].to_numpy()
+    ov_id = rivers[river_id_col].astype(str).to_numpy()
+    n_segments = len(rivers)
+
+    # First and last vertex per segment (any line type)
+    coords, owner = shapely.get_coordinates(rivers.geometry.to_numpy(), return_index=True)
+    has_coords = np.bincount(owner, minlength=n_segments) > 0
+    first = np.searchsorted(owner, np.arange(n_segments), side="left")
+    last = np.searchsorted(owner, np.arange(n_segments), side="right") - 1
+
+    # Candidate edges: end of a segment within snap_tolerance_m of the start of another
+    with_coords = np.flatnonzero(has_coords)
+    start_tree = cKDTree(coords[first[with_coords]])
+    end_tree = cKDTree(coords[last[with_coords]])
+    pairs = end_tree.sparse_distance_matrix(start_tree, snap_tolerance_m, output_type="ndarray")
+    source = with_coords[pairs["i"]]
+    target = with_coords[pairs["j"]]
+    keep = source != target
+    source, target = source[keep], target[keep]
+
+    # Per source: same ov_id first, then lowest River_FID
+    rank = np.lexsort((river_fid[target], ov_id[source] != ov_id[target], source))
+    source, target = source[rank], target[rank]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=n_segments))])
+
+    return RiverNetwork(river_fid, ov_id, indptr, target)
+
+
+_NETWORK_CACHE: Dict[float, RiverNetwork] = {}
+
+
+def load_river_network() -> RiverNetwork:
+    """
+    River network from the full river layer (EPSG:25832, layer cache). Built
+    once per process and snap tolerance - flow selection and accumulation share it.
+    """
+    if STEP6_NETWORK_SNAP_TOLERANCE_M in _NETWORK_CACHE:
+        return _NETWORK_CACHE[STEP6_NETWORK_SNAP_TOLERANCE_M]
+    network = build_river_network(load_river_segments(crs="EPSG:25832", contact_only=False))
+    _NETWORK_CACHE[STEP6_NETWORK_SNAP_TOLERANCE_M] = network
+    outlets = int((network.downstream < 0).sum())
+    print(
+        f"      River network: {network.segment_count:,} segments, "
+        f"{len(network.levels):,} topological levels, {outlets:,} outlets"
+        + (f", {network.loop_segment_count} segments on closed loops" if network.loop_segment_count else "")
+    )
+    return network
+
+
+def accumulate_segment_flux(segment_flux: pd.DataFrame, network: RiverNetwork) -> pd.DataFrame:
+    """
+    Route the Step 6 segment flux downstream.
+
+    Args:
+        segment_flux: Output of _aggregate_flux_by_segment()
+        network: RiverNetwork covering the segments
+
+    Returns:
+        SEGMENT_FLUX_GROUP_COLUMNS + Own_Flux_ug_per_year,
+        Upstream_Flux_ug_per_year and Total_Flux_ug_per_year (own + upstream),
+        one row per segment and scenario substance with accumulated flux > 0.
+    """
+    positions = network.positions(segment_flux["Nearest_River_FID"])
+    outside = positions < 0
+    if outside.any():
+        print(f"NOTE: {int(outside.sum())} segment flux rows not in the river network; not routed.")
+    routed = segment_flux[~outside]
+    positions = positions[~outside]
+
+    substance_codes, substances = pd.MultiIndex.from_frame(routed[SUBSTANCE_KEY_COLUMNS]).factorize()
+    own = np.zeros((network.segment_count, len(substances)))
+    np.add.at(own, (positions, substance_codes), routed["Total_Flux_ug_per_year"].to_numpy(dtype=float))
+
+    accumulated = network.accumulate(own)
+    segment, substance = np.nonzero(accumulated)
+    result = pd.DataFrame(
+        {
+            "Nearest_River_FID": network.river_fid[segment],
+            "Nearest_River_ov_id": network.ov_id[segment],
+        }
+    )
+    for level, column in enumerate(SUBSTANCE_KEY_COLUMNS):
+        result[column] = substances.get_level_values(level)[substance]
+    result["Own_Flux_ug_per_year"] = own[segment, substance]
+    result["Total_Flux_ug_per_year"] = accumulated[segment, substance]
+    result["Upstream_Flux_ug_per_year"] = (
+        result["Total_Flux_ug_per_year"] - result["Own_Flux_ug_per_year"]
+    )
+    return result[
+        SEGMENT_FLUX_GROUP_COLUMNS
+        + ["Own_Flux_ug_per_year", "Upstream_Flux_ug_per_year", "Total_Flux_ug_per_year"]
+    ]
+
+
+def accumulated_cmix(
+    segment_flux: pd.DataFrame,
+    network: RiverNetwork,
+    flow_scenarios: pd.DataFrame,
+    qpoints_gdf: gpd.GeoDataFrame | None = None,
+    chainage=None,
+) -> pd.DataFrame:
+    """
+    Cmix and MKK exceedances from the downstream-accumulated flux, each segment
+    against its own flow (same selection as Step 6, incl. Flow_Source).
+    chainage: the run's QpointChainage, reused instead of rebuilt.
+    """
+    accumulated = accumulate_segment_flux(segment_flux, network)
+    if accumulated.empty:
+        return accumulated
+    segment_flows = _build_segment_flows(
+        accumulated[["Nearest_River_FID", "Nearest_River_ov_id"]],
+        flow_scenarios,
+        qpoints_gdf,
+        chainage,
+    )
+    merged = accumulated.merge(
+        segment_flows.drop(columns=["Qpoint_Index"]),
+        on=["Nearest_River_FID", "Nearest_River_ov_id"],
+        how="left",
+    )
+    return _apply_mkk_thresholds(_compute_cmix(merged))
@@ -21,7 +21,10 @@ config.py and data_loaders.py for maintainability.
 from __future__ import annotations
 
 # Ensure repository root is importable
+import gc
+import shutil
 import sys
+from collections import Counter
 from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
@@ -29,6 +32,7 @@ import geopandas as gpd
 import numpy as np
 import pandas as pd
 import rasterio
+import shapely
 from rasterio.mask import mask
 from shapely.geometry import mapping
 
@@ -43,7 +47,11 @@ from config import (
     GRUNDVAND_LAYER_NAME,
     GVD_RASTER_DIR,
     FLOW_SCENARIO_COLUMNS,
+    STEP6_BYTES_PER_INPUT_ROW,
+    STEP6_DOWNSTREAM_ACCUMULATION,
+    STEP6_FLOW_DURATION_EXCEEDANCE,
     STEP6_FLOW_SELECTION_MODE,
+    STEP6_MEMORY_BUDGET_MB,
     STEP6_PRIMARY_FLOW_SCENARIO,
     MKK_THRESHOLDS,
     MODELSTOFFER,
@@ -56,11 +64,14 @@ from config import (
 
 # Import data loaders
 from data_loaders import (
+    flow_selection_input_hash,
+    load_daily_flow_series,
     load_flow_scenarios,
     load_flow_scenarios_extended,
     load_gvfk_layer_mapping,
     load_river_segments,
     load_site_geometries,
+    load_step5_combinations,
     load_step5_results,
 )
 from step_reporter import (
@@ -90,6 +101,9 @@ def run_step6() -> Dict[str, pd.DataFrame]:
     Returns:
         Dict with keys: site_flux, segment_flux, cmix_results, segment_summary,
         site_exceedances, gvfk_exceedances, negative_infiltration
+
+    With STEP6_MEMORY_BUDGET_MB set, Step 6 runs in GVFK chunks instead
+    (see _run_step6_chunked).
     """
     ensure_results_directory()
 
@@ -97,11 +111,17 @@ def run_step6() -> Dict[str, pd.DataFrame]:
 
     # Load data
     print("\n[1/6] Loading data...")
-    step5_results = load_step5_results()
     site_geometries = load_site_geometries()
     layer_mapping = load_gvfk_layer_mapping(columns=["GVForekom", "dkmlag", "dknr"])
     river_segments = load_river_segments()
 
+    if STEP6_MEMORY_BUDGET_MB:
+        return _run_step6_chunked(
+            site_geometries, layer_mapping, river_segments, STEP6_MEMORY_BUDGET_MB
+        )
+
+    step5_results = load_step5_results()
+
     # Prepare flux inputs (filtering + infiltration)
     print("\n[2/6] Preparing flux inputs (filtering + infiltration)...")
     enriched_results, negative_infiltration, filtering_audit, pixel_data_records = _prepare_flux_inputs(
@@ -110,11 +130,14 @@ def run_step6() -> Dict[str, pd.DataFrame]:
 
     # Report filtering results
     initial_count = len(step5_results)
-    report_step6_filtering(filtering_audit, initial_count)
+    report_step6_filtering(
+        filtering_audit, initial_count, enriched_results[["Lokalitet_ID", "GVFK"]]
+    )
 
     # Calculate flux
     print("\n[3/6] Calculating flux (scenario-based approach)...")
-    flux_details, flux_stats = _calculate_flux(enriched_results)
+    flux_rows = _expand_flux_rows(enriched_results)
+    flux_details, flux_stats = _calculate_flux(enriched_results, flux_rows)
 
     # Aggregate by segment
     print("[4/6] Aggregating flux by segment...")
@@ -125,7 +148,12 @@ def run_step6() -> Dict[str, pd.DataFrame]:
     # Load flows (ov_id max) and raw Q-points (for nearest-per-segment mode)
     flow_scenarios, qpoints_gdf = load_flow_scenarios_extended()
 
-    cmix_results = _calculate_cmix(segment_flux, flow_scenarios, qpoints_gdf)
+    # Flows for every segment reached by a scenario (also -1 concentrations,
+    # so the flux matrix can re-evaluate them with other concentrations)
+    chainage = _qpoint_chainage(qpoints_gdf)
+    segment_flows = _build_segment_flows(flux_rows, flow_scenarios, qpoints_gdf, chainage)
+
+    cmix_results = _calculate_cmix(segment_flux, flow_scenarios, qpoints_gdf, segment_flows)
     cmix_results = _apply_mkk_thresholds(cmix_results)
     _report_cmix_exceedance_summary(cmix_results)
 
@@ -137,6 +165,7 @@ def run_step6() -> Dict[str, pd.DataFrame]:
     )
 
     # Export
+    cmix_results = _attach_contributing_site_ids(cmix_results, flux_details)
     _export_results(
         flux_details,
         cmix_results,
@@ -144,6 +173,13 @@ def run_step6() -> Dict[str, pd.DataFrame]:
         site_exceedances,
     )
 
+    # Export flux matrix for what-if Cmix recomputation
+    _export_flux_matrix(flux_rows, segment_flows)
+    _export_flow_selection(segment_flows)
+    _export_accumulated_cmix(segment_flux, flow_scenarios, qpoints_gdf, chainage)
+    _export_exceedance_fraction(cmix_results)
+    _export_daily_exceedance(cmix_results, segment_flows)
+
     # Export filtering audit
     if not filtering_audit.empty:
         audit_path = get_output_path("step6_filtering_audit")
@@ -189,6 +225,234 @@ def run_step6() -> Dict[str, pd.DataFrame]:
     }
 
 
+def _plan_gvfk_chunks(gvfk_rows: pd.Series, memory_budget_mb: float) -> List[List[str]]:
+    """
+    Pack GVFKs (in name order) into chunks that fit the memory budget.
+
+    Args:
+        gvfk_rows: Step 5 row count per GVFK
+        memory_budget_mb: Budget per chunk; converted to rows with
+            STEP6_BYTES_PER_INPUT_ROW
+
+    A GVFK larger than the budget becomes a chunk of its own.
+    """
+    max_rows = max(int(memory_budget_mb * 1024**2 / STEP6_BYTES_PER_INPUT_ROW), 1)
+
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    current_rows = 0
+    for gvfk, rows in gvfk_rows.sort_index().items():
+        if current and current_rows + rows > max_rows:
+            chunks.append(current)
+            current, current_rows = [], 0
+        if rows > max_rows:
+            print(f"  NOTE: GVFK {gvfk} ({rows:,} rows) exceeds the chunk budget on its own")
+        current.append(gvfk)
+        current_rows += rows
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _run_step6_chunked(
+    site_geometries: gpd.GeoDataFrame,
+    layer_mapping: pd.DataFrame,
+    river_segments: gpd.GeoDataFrame,
+    memory_budget_mb: float,
+) -> Dict[str, Any]:
+    """
+    Step 6 in GVFK chunks that fit a memory budget.
+
+    A site-GVFK row only reaches the nearest segment within its GVFK, so each
+    GVFK chunk runs infiltration → flux → partial segment aggregation on its
+    own. Site-level flux is streamed to step6_flux_site_segment.csv and spilled
+    to disk; segment totals are reduced from the per-chunk aggregates, and the
+    exceedance views re-read only the spilled rows on exceeding segments. The
+    scenario rows are reduced to flux matrix triplets per chunk
+    (FluxMatrixBuilder), which also provide the segment keys for the flows.
+
+    Raster pixel samples are dropped after each chunk and the Step 6
+    visualizations are skipped (run without a memory budget to get them).
+    """
+    try:
+        from .step6_flux_matrix import FluxMatrixBuilder
+    except ImportError:
+        from step6_flux_matrix import FluxMatrixBuilder
+
+    gvfk_rows = load_step5_combinations(columns=["GVFK"])["GVFK"].value_counts()
+    chunks = _plan_gvfk_chunks(gvfk_rows, memory_budget_mb)
+    print(
+        f"  Chunked mode: {len(chunks)} GVFK chunks "
+        f"(budget {memory_budget_mb:,} MB, {int(gvfk_rows.sum()):,} rows; "
+        "no visualizations)"
+    )
+
+    spill_dir = get_output_path("step6_chunk_spill")
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    spill_dir.mkdir(parents=True)
+
+    flux_path = get_output_path("step6_flux_site_segment")
+    flux_columns: List[str] | None = None
+    flux_parts: List[Path] = []
+    audits: List[pd.DataFrame] = []
+    # Site-GVFK pairs left after the filters; a site can span chunks, so the
+    # completely removed sites are only known over all chunks
+    surviving: List[pd.DataFrame] = []
+    negatives: List[pd.DataFrame] = []
+    partials: List[pd.DataFrame] = []
+    site_pairs: List[pd.DataFrame] = []
+    # Flux matrix triplets and segment keys, reduced per chunk
+    matrix_builder = FluxMatrixBuilder()
+    flux_input_count = 0
+    flux_output_count = 0
+    dropped_summary: Counter = Counter()
+
+    print("\n[2-4/6] Infiltration, flux and segment aggregation per GVFK chunk...")
+    for index, gvfks in enumerate(chunks, start=1):
+        step5_chunk = load_step5_results(filters=[("GVFK", "in", gvfks)])
+        print(f"\n  Chunk {index}/{len(chunks)}: {len(gvfks)} GVFK, {len(step5_chunk):,} rows")
+
+        enriched, negative_rows, audit, pixel_data_records = _prepare_flux_inputs(
+            step5_chunk, site_geometries, layer_mapping, river_segments
+        )
+        del step5_chunk, pixel_data_records
+        audits.append(audit)
+        surviving.append(enriched[["Lokalitet_ID", "GVFK"]].drop_duplicates())
+        negatives.append(negative_rows)
+
+        flux_rows = _expand_flux_rows(enriched)
+        flux_details, flux_stats = _calculate_flux(enriched, flux_rows)
+        flux_input_count += flux_stats["input_count"]
+        flux_output_count += flux_stats["output_count"]
+        dropped_summary.update(flux_stats["dropped_concentration_summary"])
+        matrix_builder.add(flux_rows)
+
+        if not flux_details.empty:
+            if flux_columns is None:
+                flux_columns = list(flux_details.columns)
+            flux_details = flux_details.reindex(columns=flux_columns)
+            flux_details.to_csv(
+                flux_path,
+                mode="a" if flux_parts else "w",
+                header=not flux_parts,
+                index=False,
+                encoding="utf-8",
+            )
+            part_path = spill_dir / f"flux_{index:04d}.pkl"
+            flux_details.to_pickle(part_path)
+            flux_parts.append(part_path)
+
+            partial, pairs = _partial_segment_flux(flux_details)
+            partials.append(partial)
+            site_pairs.append(pairs)
+
+        del enriched, flux_rows, flux_details
+        gc.collect()
+
+    if not flux_parts:
+        pd.DataFrame().to_csv(flux_path, index=False, encoding="utf-8")
+
+    filtering_audit = pd.concat(audits, ignore_index=True) if audits else pd.DataFrame()
+    negative_infiltration = pd.concat(negatives, ignore_index=True)
+    surviving_pairs = (
+        pd.concat(surviving, ignore_index=True)
+        if surviving
+        else pd.DataFrame(columns=["Lokalitet_ID", "GVFK"])
+    )
+    report_step6_filtering(filtering_audit, int(gvfk_rows.sum()), surviving_pairs)
+
+    # Reduce segment totals
+    segment_flux = (
+        _reduce_segment_flux(partials, site_pairs) if partials else pd.DataFrame()
+    )
+    segment_sites = (
+        pd.concat(site_pairs, ignore_index=True)
+        if site_pairs
+        else pd.DataFrame(columns=SEGMENT_FLUX_GROUP_COLUMNS + ["Lokalitet_ID"])
+    )
+    print("[5/6] Computing Cmix (all flow scenarios: Q05, Q10, Q50, Q90, Q95)...")
+    flow_scenarios, qpoints_gdf = load_flow_scenarios_extended()
+    chainage = _qpoint_chainage(qpoints_gdf)
+    segment_flows = _build_segment_flows(
+        matrix_builder.segments, flow_scenarios, qpoints_gdf, chainage
+    )
+    cmix_results = _calculate_cmix(segment_flux, flow_scenarios, qpoints_gdf, segment_flows)
+    cmix_results = _apply_mkk_thresholds(cmix_results)
+    _report_cmix_exceedance_summary(cmix_results)
+
+    print("\n[6/6] Building summaries & exporting...")
+    segment_summary = _build_segment_summary(segment_sites, segment_flux, cmix_results)
+    site_exceedances, gvfk_exceedances = _extract_exceedance_views(
+        _load_exceeding_flux(flux_parts, cmix_results), cmix_results
+    )
+
+    print(f"\nExported {flux_output_count} site-level flux records ({len(flux_parts)} chunks)")
+    cmix_results = _attach_contributing_site_ids(cmix_results, segment_sites)
+    _export_results(None, cmix_results, segment_summary, site_exceedances)
+    _export_flux_matrix(matrix_builder, segment_flows)
+    _export_flow_selection(segment_flows)
+    _export_accumulated_cmix(segment_flux, flow_scenarios, qpoints_gdf, chainage)
+    _export_exceedance_fraction(cmix_results)
+    _export_daily_exceedance(cmix_results, segment_flows)
+    if not filtering_audit.empty:
+        filtering_audit.to_csv(
+            get_output_path("step6_filtering_audit"), index=False, encoding="utf-8"
+        )
+    shutil.rmtree(spill_dir, ignore_errors=True)
+
+    report_step6_summary(
+        segment_sites,
+        cmix_results,
+        segment_summary,
+        site_exceedances,
+        gvfk_exceedances,
+        flux_input_count=flux_input_count,
+        flux_output_count=flux_output_count,
+        dropped_concentration_summary=dict(dropped_summary),
+    )
+    print(
+        "\nNOTE: Step 6 visualizations (figures and maps) are not produced in chunked "
+        "mode - they need all site flux rows and raster pixel samples in memory. "
+        "The CSV outputs above are complete; set STEP6_MEMORY_BUDGET_MB = None "
+        "to also get the visualizations."
+    )
+
+    report_completion(6)
+
+    return {
+        "success": True,
+        "site_flux": None,
+        "segment_flux": segment_flux,
+        "cmix_results": cmix_results,
+        "segment_summary": segment_summary,
+        "site_exceedances": site_exceedances,
+        "gvfk_exceedances": gvfk_exceedances,
+        "negative_infiltration": negative_infiltration,
+    }
+
+
+def _load_exceeding_flux(flux_parts: List[Path], cmix_results: pd.DataFrame) -> pd.DataFrame:
+    """Spilled site-level flux rows on segment/substance groups with an MKK exceedance."""
+    merge_cols = [
+        "Nearest_River_FID",
+        "Nearest_River_ov_id",
+        "Qualifying_Substance",
+        "Qualifying_Category",
+    ]
+    if cmix_results.empty or "Exceedance_Flag" not in cmix_results.columns or not flux_parts:
+        return pd.DataFrame(columns=merge_cols)
+
+    exceeding_keys = cmix_results.loc[
+        cmix_results["Exceedance_Flag"] == True, merge_cols
+    ].drop_duplicates()
+
+    rows = [
+        pd.read_pickle(part).merge(exceeding_keys, on=merge_cols, how="inner")
+        for part in flux_parts
+    ]
+    return pd.concat(rows, ignore_index=True)
+
+
 def _report_cmix_exceedance_summary(cmix_results: pd.DataFrame) -> None:
     """Print scenario-level exceedance counts for segments and GVFK."""
     if cmix_results.empty:
@@ -216,6 +480,39 @@ def _report_cmix_exceedance_summary(cmix_results: pd.DataFrame) -> None:
 # ===========================================================================
 
 
+AUDIT_COLUMNS = [
+    "Lokalitet_ID",
+    "Lokalitetsnavn",
+    "GVFK",
+    "Qualifying_Category",
+    "Nearest_River_ov_id",
+    "Distance_to_River_m",
+    "Filter_Stage",
+    "Filter_Reason",
+    "Additional_Info",
+]
+
+
+def _audit_frame(
+    filtered: pd.DataFrame,
+    stage: str,
+    reason: str | pd.Series,
+    info: str | pd.Series,
+) -> pd.DataFrame:
+    """Filtering audit rows (AUDIT_COLUMNS) for the rows removed by one filter stage."""
+    audit = pd.DataFrame(index=filtered.index)
+    audit["Lokalitet_ID"] = filtered["Lokalitet_ID"]
+    audit["Lokalitetsnavn"] = filtered.get("Lokalitetsnavn", "N/A")
+    audit["GVFK"] = filtered["GVFK"]
+    audit["Qualifying_Category"] = filtered["Qualifying_Category"]
+    audit["Nearest_River_ov_id"] = filtered.get("Nearest_River_ov_id", "N/A")
+    audit["Distance_to_River_m"] = filtered.get("Distance_to_River_m", None)
+    audit["Filter_Stage"] = stage
+    audit["Filter_Reason"] = reason
+    audit["Additional_Info"] = info
+    return audit[AUDIT_COLUMNS]
+
+
 def _prepare_flux_inputs(
     step5_results: pd.DataFrame,
     site_geometries: gpd.GeoDataFrame,
@@ -239,8 +536,8 @@ def _prepare_flux_inputs(
     enriched = step5_results.copy()
     negative_rows = pd.DataFrame(columns=enriched.columns)
 
-    # Initialize filtering audit trail
-    filtering_audit = []
+    # Initialize filtering audit trail (one frame per filter stage)
+    filtering_audit: List[pd.DataFrame] = []
 
     # Attach areas and centroids
     area_lookup = dict(zip(site_geometries["Lokalitet_"], site_geometries["Area_m2"]))
@@ -298,20 +595,15 @@ def _prepare_flux_inputs(
 
         # Track filtered rows in audit
         filtered = enriched[enriched["DK-modellag"].isna()]
-        for _, row in filtered.iterrows():
-            filtering_audit.append(
-                {
-                    "Lokalitet_ID": row["Lokalitet_ID"],
-                    "Lokalitetsnavn": row.get("Lokalitetsnavn", "N/A"),
-                    "GVFK": row["GVFK"],
-                    "Qualifying_Category": row["Qualifying_Category"],
-                    "Nearest_River_ov_id": row.get("Nearest_River_ov_id", "N/A"),
-                    "Distance_to_River_m": row.get("Distance_to_River_m", None),
-                    "Filter_Stage": "Filter_1_Missing_Modellag",
-                    "Filter_Reason": f"No dkmlag mapping for GVFK {row['GVFK']}",
-                    "Additional_Info": f"Add {row['GVFK']} to Grunddata layer '{GRUNDVAND_LAYER_NAME}'",
-                }
+        gvfk_text = filtered["GVFK"].astype(str)
+        filtering_audit.append(
+            _audit_frame(
+                filtered,
+                stage="Filter_1_Missing_Modellag",
+                reason="No dkmlag mapping for GVFK " + gvfk_text,
+                info="Add " + gvfk_text + f" to Grunddata layer '{GRUNDVAND_LAYER_NAME}'",
             )
+        )
 
         # Filter out rows with missing modellag
         enriched = enriched[enriched["DK-modellag"].notna()].copy()
@@ -350,27 +642,29 @@ def _prepare_flux_inputs(
         before_filter2_gvfk = enriched["GVFK"].nunique()
 
         negative_rows = enriched.loc[negative_mask].copy()
-        negative_rows["Sampled_Layers"] = negative_rows["DK-modellag"].apply(
-            lambda text: ", ".join(_parse_dk_modellag(text)) if pd.notna(text) else ""
-        )
+        if "DK-modellag" in negative_rows.columns:
+            negative_rows["Sampled_Layers"] = negative_rows["DK-modellag"].apply(
+                lambda text: ", ".join(_parse_dk_modellag(text)) if pd.notna(text) else ""
+            )
         removed_sites = sorted(enriched.loc[negative_mask, "Lokalitet_ID"].unique())
         removed_gvfk = sorted(enriched.loc[negative_mask, "GVFK"].unique())
 
         # Track filtered rows in audit
-        for _, row in negative_rows.iterrows():
-            filtering_audit.append(
-                {
-                    "Lokalitet_ID": row["Lokalitet_ID"],
-                    "Lokalitetsnavn": row.get("Lokalitetsnavn", "N/A"),
-                    "GVFK": row["GVFK"],
-                    "Qualifying_Category": row["Qualifying_Category"],
-                    "Nearest_River_ov_id": row.get("Nearest_River_ov_id", "N/A"),
-                    "Distance_to_River_m": row.get("Distance_to_River_m", None),
-                    "Filter_Stage": "Filter_2_Negative_Infiltration",
-                    "Filter_Reason": f"Negative infiltration: {row['Infiltration_mm_per_year']:.1f} mm/yr",
-                    "Additional_Info": f"Opstrømningszone - layers: {row.get('Sampled_Layers', 'N/A')}",
-                }
+        filtering_audit.append(
+            _audit_frame(
+                negative_rows,
+                stage="Filter_2_Negative_Infiltration",
+                reason="Negative infiltration: "
+                + negative_rows["Infiltration_mm_per_year"].map("{:.1f}".format)
+                + " mm/yr",
+                info="Opstrømningszone - layers: "
+                + negative_rows.get(
+                    "Sampled_Layers", pd.Series("N/A", index=negative_rows.index)
+                )
+                .fillna("N/A")
+                .astype(str),
             )
+        )
 
         enriched = enriched[~negative_mask].copy()
 
@@ -378,12 +672,13 @@ def _prepare_flux_inputs(
         after_filter2_sites = enriched["Lokalitet_ID"].nunique()
         after_filter2_gvfk = enriched["GVFK"].nunique()
 
-        remaining_sites = set(enriched["Lokalitet_ID"].unique())
-        remaining_gvfk = set(enriched["GVFK"].unique())
-        completely_removed_sites = [
-            s for s in removed_sites if s not in remaining_sites
-        ]
-        completely_removed_gvfk = [g for g in removed_gvfk if g not in remaining_gvfk]
+        # Anti-join: removed sites/GVFK without any remaining row
+        completely_removed_sites = sorted(
+            set(removed_sites).difference(enriched["Lokalitet_ID"].unique())
+        )
+        completely_removed_gvfk = sorted(
+            set(removed_gvfk).difference(enriched["GVFK"].unique())
+        )
 
         print(f"FILTER 2: Negative infiltration (opstroemningszoner)")
         print(
@@ -420,20 +715,15 @@ def _prepare_flux_inputs(
 
         # Track filtered rows in audit
         filtered = enriched[enriched["Infiltration_mm_per_year"].isna()]
-        for _, row in filtered.iterrows():
-            filtering_audit.append(
-                {
-                    "Lokalitet_ID": row["Lokalitet_ID"],
-                    "Lokalitetsnavn": row.get("Lokalitetsnavn", "N/A"),
-                    "GVFK": row["GVFK"],
-                    "Qualifying_Category": row["Qualifying_Category"],
-                    "Nearest_River_ov_id": row.get("Nearest_River_ov_id", "N/A"),
-                    "Distance_to_River_m": row.get("Distance_to_River_m", None),
-                    "Filter_Stage": "Filter_3_Missing_Infiltration",
-                    "Filter_Reason": "No infiltration data",
-                    "Additional_Info": f"Site outside raster coverage or at nodata location - layers: {row.get('DK-modellag', 'N/A')}",
-                }
+        filtering_audit.append(
+            _audit_frame(
+                filtered,
+                stage="Filter_3_Missing_Infiltration",
+                reason="No infiltration data",
+                info="Site outside raster coverage or at nodata location - layers: "
+                + filtered["DK-modellag"].astype(str),
             )
+        )
 
         enriched = enriched[enriched["Infiltration_mm_per_year"].notna()].copy()
 
@@ -488,8 +778,10 @@ def _prepare_flux_inputs(
     final_sites = enriched["Lokalitet_ID"].nunique()
     final_gvfk = enriched["GVFK"].nunique()
 
-    # Convert audit to DataFrame
-    audit_df = pd.DataFrame(filtering_audit)
+    # Combine audit stages
+    audit_df = (
+        pd.concat(filtering_audit, ignore_index=True) if filtering_audit else pd.DataFrame()
+    )
 
     return enriched, negative_rows, audit_df, pixel_data_records
 
@@ -868,96 +1160,165 @@ def _build_raster_filename(layer: str, model_region: str | None) -> str | None:
 # ===========================================================================
 
 
-def _lookup_concentration_for_scenario(
-    scenario_modelstof: str | None,
-    category: str,
-    original_substance: str | None,
-    row: pd.Series,
-) -> float:
+# Hierarchy levels in priority order; the name is written to Concentration_Source_Level
+CONCENTRATION_SOURCE_LEVELS = (
+    "activity_substance",  # 1. Activity/branch + substance (e.g. "Servicestationer_Benzen")
+    "losseplads_substance",  # 2. Losseplads context + substance
+    "losseplads_category",  # 3. Losseplads context + category
+    "compound",  # 4. Compound (modelstof) default
+    "category_scenario",  # 5. Category scenario ("BTXER__via_Benzen")
+    "category",  # 6. Category fallback (LOSSEPLADS/ANDRE/PFAS = -1)
+)
+
+
+def _compile_concentration_tables(
+    standard_concentrations: Dict[str, Dict[str, float]] | None = None,
+) -> Dict[str, pd.Series]:
     """
-    Lookup concentration for a scenario using the hierarchy.
+    STANDARD_CONCENTRATIONS (or an alternative with the same sections) as one
+    lookup Series per hierarchy level.
 
-    Args:
-        scenario_modelstof: The modelstof for this scenario (e.g., "Benzen", "Olie C10-C25")
-                           None for categories without scenarios
-        category: The compound category (e.g., "BTXER")
-        original_substance: Original substance name (only used if no scenario)
-        row: The data row with site information (for activity/losseplads context)
+    The losseplads section serves both level 2 (substance keys) and level 3
+    (category keys); the category section serves level 5 ("__via_" keys) and 6.
+    """
+    if standard_concentrations is None:
+        standard_concentrations = STANDARD_CONCENTRATIONS
 
-    Returns:
-        Concentration in µg/L
+    def table(section: str) -> pd.Series:
+        return pd.Series(standard_concentrations.get(section, {}), dtype=float)
+
+    return {
+        "activity_substance": table("activity_substance"),
+        "losseplads_substance": table("losseplads"),
+        "losseplads_category": table("losseplads"),
+        "compound": table("compound"),
+        "category_scenario": table("category"),
+        "category": table("category"),
+    }
+
+
+def _industry_context(df: pd.DataFrame) -> pd.Series:
+    """
+    Branch/activity names per row (exploded, original row position as index).
+
+    Empty when the rows carry no Lokalitetensbranche/Lokalitetensaktivitet
+    (or Branche/Aktivitet) columns.
+    """
+    parts = []
+    for columns in (("Lokalitetensbranche", "Branche"), ("Lokalitetensaktivitet", "Aktivitet")):
+        column = next((c for c in columns if c in df.columns), None)
+        if column is not None:
+            parts.append(df[column].reset_index(drop=True))
+    if not parts:
+        return pd.Series(dtype=object)
+
+    # Branches before activities, each in their ";"-separated order
+    names = pd.concat(
+        [part.dropna().astype(str).str.split(";").explode() for part in parts]
+    ).str.strip()
+    names = names[names.notna() & (names != "")]
+    return names.sort_index(kind="stable")
+
+
+def _resolve_concentrations(
+    expanded: pd.DataFrame,
+    standard_concentrations: Dict[str, Dict[str, float]] | None = None,
+) -> pd.DataFrame:
+    """
+    Standard concentration and hierarchy level for every expanded flux row.
 
-    Hierarchy:
-        1. Activity + Modelstof (e.g., "Servicestationer_Benzen")
-        2. Losseplads + Modelstof
-        3. Losseplads + Category
+    Each level of the compiled hierarchy is one vectorized lookup over the rows
+    that are still unresolved, in priority order:
+        1. Activity + substance      (only when rows carry branch/activity context)
+        2. Losseplads + substance    (LOSSEPLADS or "Landfill Override:" rows)
+        3. Losseplads + category
         4. Compound (modelstof)
         5. Category scenario
+        6. Category fallback
+
+    Scenario rows look up their modelstof; rows without a scenario look up their
+    original substance (with any "Landfill Override:" prefix removed).
+    standard_concentrations replaces STANDARD_CONCENTRATIONS (e.g. for what-if runs).
+
+    Returns:
+        DataFrame aligned by position with Standard_Concentration_ug_L and
+        Concentration_Source_Level.
     """
-    # Extract context from row
-    branche = row.get("Lokalitetensbranche") or row.get("Branche") or ""
-    aktivitet = row.get("Lokalitetensaktivitet") or row.get("Aktivitet") or ""
-    industries = str(branche).split(";") if pd.notna(branche) else []
-    activities = str(aktivitet).split(";") if pd.notna(aktivitet) else []
-    all_industries = [x.strip() for x in industries + activities if x.strip()]
+    tables = _compile_concentration_tables(standard_concentrations)
+    rows = expanded.reset_index(drop=True)
+    category = rows["Qualifying_Category"].astype(str)
+    modelstof = rows["Modelstof"]
+    has_scenario = modelstof.notna()
+
+    # object dtype keeps .str usable when every row has a scenario (all NaN)
+    original = rows["Qualifying_Substance"].astype(object).where(~has_scenario)
+    is_override = original.str.contains("Landfill Override:", regex=False, na=False)
+    is_losseplads = (category == "LOSSEPLADS") | is_override
+
+    lookup_substance = modelstof.where(has_scenario, original)
+    strip_prefix = ~has_scenario & original.str.lower().str.startswith(
+        "landfill override:", na=False
+    )
+    lookup_substance = lookup_substance.mask(
+        strip_prefix, original[strip_prefix].str.split(":", n=1).str[1].str.strip()
+    )
+
+    industries = _industry_context(expanded)
+    if industries.empty:
+        activity_hits = pd.Series(np.nan, index=rows.index)
+    else:
+        activity_keys = industries + "_" + lookup_substance.reindex(industries.index)
+        activity_hits = (
+            activity_keys.map(tables["activity_substance"])
+            .groupby(level=0)
+            .first()
+            .reindex(rows.index)
+        )
 
-    is_losseplads = category == "LOSSEPLADS" or (
-        original_substance and "Landfill Override:" in original_substance
+    level_values = {
+        "activity_substance": activity_hits,
+        "losseplads_substance": lookup_substance.where(is_losseplads).map(
+            tables["losseplads_substance"]
+        ),
+        "losseplads_category": category.where(is_losseplads).map(
+            tables["losseplads_category"]
+        ),
+        "compound": lookup_substance.map(tables["compound"]),
+        "category_scenario": (category + "__via_" + modelstof).map(
+            tables["category_scenario"]
+        ),
+        "category": category.map(tables["category"]),
+    }
+
+    concentration = pd.Series(np.nan, index=rows.index)
+    source_level = pd.Series(None, index=rows.index, dtype=object)
+    for level in CONCENTRATION_SOURCE_LEVELS:
+        hit = concentration.isna() & level_values[level].notna()
+        concentration[hit] = level_values[level][hit]
+        source_level[hit] = level
+
+    unresolved = concentration.isna()
+    if unresolved.any():
+        first = rows[unresolved].iloc[0]
+        raise ValueError(
+            f"No concentration for scenario:\n"
+            f"  Category: {first['Qualifying_Category']}\n"
+            f"  Modelstof: {first['Modelstof'] if pd.notna(first['Modelstof']) else None}\n"
+            f"  Original substance: {first['Qualifying_Substance']}\n"
+            f"  ({unresolved.sum()} rows without concentration)"
+        )
+
+    return pd.DataFrame(
+        {
+            "Standard_Concentration_ug_L": concentration.to_numpy(),
+            "Concentration_Source_Level": source_level.to_numpy(),
+        }
     )
 
-    # Determine which substance to use for hierarchy lookup
-    lookup_substance = scenario_modelstof if scenario_modelstof else original_substance
-    if (
-        not scenario_modelstof
-        and isinstance(lookup_substance, str)
-        and lookup_substance.lower().startswith("landfill override:")
-    ):
-        lookup_substance = lookup_substance.split(":", 1)[1].strip()
-
-    # Level 1: Activity + Substance
-    for industry in all_industries:
-        key = f"{industry}_{lookup_substance}"
-        if key in STANDARD_CONCENTRATIONS["activity_substance"]:
-            return STANDARD_CONCENTRATIONS["activity_substance"][key]
-
-    # Level 2: Losseplads context
-    if is_losseplads:
-        # Try exact substance match
-        if (
-            lookup_substance
-            and lookup_substance in STANDARD_CONCENTRATIONS["losseplads"]
-        ):
-            return STANDARD_CONCENTRATIONS["losseplads"][lookup_substance]
-        # Try category match
-        if category in STANDARD_CONCENTRATIONS["losseplads"]:
-            return STANDARD_CONCENTRATIONS["losseplads"][category]
-
-    # Level 3: Direct compound lookup (for modelstoffer)
-    if lookup_substance and lookup_substance in STANDARD_CONCENTRATIONS["compound"]:
-        return STANDARD_CONCENTRATIONS["compound"][lookup_substance]
-
-    # Level 4: Category scenario
-    if scenario_modelstof:
-        scenario_key = f"{category}__via_{scenario_modelstof}"
-        if scenario_key in STANDARD_CONCENTRATIONS["category"]:
-            return STANDARD_CONCENTRATIONS["category"][scenario_key]
-
-    # Level 5: Category fallback (for categories without scenarios)
-    if category in STANDARD_CONCENTRATIONS["category"]:
-        return STANDARD_CONCENTRATIONS["category"][category]
-
-    # No match - raise error
-    raise ValueError(
-        f"No concentration for scenario:\n"
-        f"  Category: {category}\n"
-        f"  Modelstof: {scenario_modelstof}\n"
-        f"  Original substance: {original_substance}"
-    )
-
-
-def _compute_flux_from_concentration(row: pd.Series) -> pd.Series:
+
+def _compute_flux_from_concentration(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Compute flux from concentration, area, and infiltration.
+    Compute flux from concentration, area, and infiltration (column-wise).
 
     Formula: Flux = Area × Infiltration × Concentration
 
@@ -967,18 +1328,18 @@ def _compute_flux_from_concentration(row: pd.Series) -> pd.Series:
         Concentration: µg/L → converted to µg/m³
         Flux: µg/year → also converted to mg, g, kg
     """
-    infiltration_m_yr = row["Infiltration_mm_per_year"] / 1000.0
-    volume_m3_yr = row["Area_m2"] * infiltration_m_yr
-    concentration_ug_m3 = row["Standard_Concentration_ug_L"] * 1000.0
+    infiltration_m_yr = df["Infiltration_mm_per_year"] / 1000.0
+    volume_m3_yr = df["Area_m2"] * infiltration_m_yr
+    concentration_ug_m3 = df["Standard_Concentration_ug_L"] * 1000.0
 
     flux_ug_yr = volume_m3_yr * concentration_ug_m3
 
-    row["Pollution_Flux_ug_per_year"] = flux_ug_yr
-    row["Pollution_Flux_mg_per_year"] = flux_ug_yr / 1000.0
-    row["Pollution_Flux_g_per_year"] = flux_ug_yr / 1_000_000.0
-    row["Pollution_Flux_kg_per_year"] = flux_ug_yr / 1_000_000_000.0
+    df["Pollution_Flux_ug_per_year"] = flux_ug_yr
+    df["Pollution_Flux_mg_per_year"] = flux_ug_yr / 1000.0
+    df["Pollution_Flux_g_per_year"] = flux_ug_yr / 1_000_000.0
+    df["Pollution_Flux_kg_per_year"] = flux_ug_yr / 1_000_000_000.0
 
-    return row
+    return df
 
 
 # ===========================================================================
@@ -986,22 +1347,61 @@ def _compute_flux_from_concentration(row: pd.Series) -> pd.Series:
 # ===========================================================================
 
 
-def _calculate_flux(enriched: pd.DataFrame) -> pd.DataFrame:
+def _category_scenario_table() -> pd.DataFrame:
+    """CATEGORY_SCENARIOS as a table: Qualifying_Category, Modelstof, Scenario_Order."""
+    records = [
+        (category, modelstof, order)
+        for category, modelstoffer in CATEGORY_SCENARIOS.items()
+        for order, modelstof in enumerate(modelstoffer)
+    ]
+    return pd.DataFrame.from_records(
+        records, columns=["Qualifying_Category", "Modelstof", "Scenario_Order"]
+    )
+
+
+def _expand_category_scenarios(
+    site_categories: pd.DataFrame, enriched: pd.DataFrame
+) -> pd.DataFrame:
     """
-    Compute pollution flux (J = A · C · I) with scenario-based aggregation.
+    Expand grouped site categories to one row per modelstof scenario.
 
-    Key approach:
-    - All compounds in a category use modelstof concentrations (scenarios)
-    - One flux value per scenario per site per river SEGMENT (FID)
-    - Categories with multiple modelstoffer generate multiple scenarios
-    - Each (Site, GVFK, FID) combination is treated separately to avoid double-counting
+    Categories with scenarios get Qualifying_Substance "<CATEGORY>__via_<Modelstof>";
+    categories without scenarios (LOSSEPLADS, ANDRE, PFAS) keep one row whose
+    Qualifying_Substance is the first substance of that site-GVFK-category.
+    Rows keep the group order, scenarios follow CATEGORY_SCENARIOS order.
+    """
+    expanded = (
+        site_categories.rename_axis("_group")
+        .reset_index()
+        .merge(_category_scenario_table(), on="Qualifying_Category", how="left")
+        .sort_values(["_group", "Scenario_Order"], kind="stable")
+    )
 
-    Example: Site with 4 different BTXER compounds generates 2 flux rows:
-      - BTXER__via_Benzen (400 µg/L)
-      - BTXER__via_Olie C10-C25 (3000 µg/L)
+    first_substance = enriched.drop_duplicates(
+        ["Lokalitet_ID", "GVFK", "Qualifying_Category"]
+    )[["Lokalitet_ID", "GVFK", "Qualifying_Category", "Qualifying_Substance"]]
+    expanded = expanded.merge(
+        first_substance,
+        on=["Lokalitet_ID", "GVFK", "Qualifying_Category"],
+        how="left",
+        sort=False,
+    )
 
-    Note: A site in multiple GVFKs will have separate flux rows for each GVFK's
-    nearest river segment - this is correct as they affect different physical segments.
+    has_scenario = expanded["Modelstof"].notna()
+    expanded.loc[has_scenario, "Qualifying_Substance"] = (
+        expanded.loc[has_scenario, "Qualifying_Category"]
+        + "__via_"
+        + expanded.loc[has_scenario, "Modelstof"]
+    )
+    expanded.index = expanded.pop("_group").to_numpy()
+    return expanded.drop(columns=["Scenario_Order"])
+
+
+def _expand_flux_rows(enriched: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per (site, GVFK, segment, category, scenario) with its standard
+    concentration, before flux calculation and before dropping -1 concentrations.
+    Keeps the Modelstof column of the scenario (NaN for categories without one).
     """
     # Group by site + GVFK + segment (FID) + category to keep each combination separate
     # This prevents double-counting when a site spans multiple GVFKs that border
@@ -1026,59 +1426,38 @@ def _calculate_flux(enriched: pd.DataFrame) -> pd.DataFrame:
         .reset_index()
     )
 
-    site_categories = grouped
-
-    flux_rows = []
-
-    for _, site_cat in site_categories.iterrows():
-        category = site_cat["Qualifying_Category"]
+    # One row per (site, GVFK, segment, category, scenario), in group order
+    df = _expand_category_scenarios(grouped, enriched)
+    concentrations = _resolve_concentrations(df)
+    df["Standard_Concentration_ug_L"] = concentrations["Standard_Concentration_ug_L"].to_numpy()
+    df["Concentration_Source_Level"] = concentrations["Concentration_Source_Level"].to_numpy()
+    return df
 
-        # Get scenarios for this category
-        scenarios = CATEGORY_SCENARIOS.get(category, [])
 
-        if not scenarios:
-            # Category has no scenarios (LOSSEPLADS, ANDRE, PFAS)
-            # Use old approach: pick first substance as representative
-            site_substances = enriched[
-                (enriched["Lokalitet_ID"] == site_cat["Lokalitet_ID"])
-                & (enriched["GVFK"] == site_cat["GVFK"])
-                & (enriched["Qualifying_Category"] == category)
-            ]
-            first_substance = site_substances.iloc[0]["Qualifying_Substance"]
+def _calculate_flux(
+    enriched: pd.DataFrame, flux_rows: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """
+    Compute pollution flux (J = A · C · I) with scenario-based aggregation.
 
-            # Lookup concentration using old method
-            conc = _lookup_concentration_for_scenario(
-                scenario_modelstof=None,
-                category=category,
-                original_substance=first_substance,
-                row=site_cat,
-            )
+    Key approach:
+    - All compounds in a category use modelstof concentrations (scenarios)
+    - One flux value per scenario per site per river SEGMENT (FID)
+    - Categories with multiple modelstoffer generate multiple scenarios
+    - Each (Site, GVFK, FID) combination is treated separately to avoid double-counting
 
-            # Create single flux row
-            flux_row = site_cat.copy()
-            flux_row["Qualifying_Substance"] = first_substance
-            flux_row["Standard_Concentration_ug_L"] = conc
-            flux_row = _compute_flux_from_concentration(flux_row)
-            flux_rows.append(flux_row)
-        else:
-            # Category has scenarios - generate one flux row per scenario
-            for modelstof in scenarios:
-                # Lookup concentration for this scenario
-                conc = _lookup_concentration_for_scenario(
-                    scenario_modelstof=modelstof,
-                    category=category,
-                    original_substance=None,  # Not used for scenarios
-                    row=site_cat,
-                )
+    Example: Site with 4 different BTXER compounds generates 2 flux rows:
+      - BTXER__via_Benzen (400 µg/L)
+      - BTXER__via_Olie C10-C25 (3000 µg/L)
 
-                # Create flux row for this scenario
-                flux_row = site_cat.copy()
-                flux_row["Qualifying_Substance"] = f"{category}__via_{modelstof}"
-                flux_row["Standard_Concentration_ug_L"] = conc
-                flux_row = _compute_flux_from_concentration(flux_row)
-                flux_rows.append(flux_row)
+    Note: A site in multiple GVFKs will have separate flux rows for each GVFK's
+    nearest river segment - this is correct as they affect different physical segments.
 
-    df = pd.DataFrame(flux_rows)
+    flux_rows can be passed when _expand_flux_rows() was already run on enriched.
+    """
+    if flux_rows is None:
+        flux_rows = _expand_flux_rows(enriched)
+    df = _compute_flux_from_concentration(flux_rows.drop(columns=["Modelstof"]))
 
     # Filter out rows with invalid concentration (-1)
     rows_before = len(df)
@@ -1096,6 +1475,152 @@ def _calculate_flux(enriched: pd.DataFrame) -> pd.DataFrame:
     return df, flux_stats
 
 
+SEGMENT_FLUX_GROUP_COLUMNS = [
+    "Nearest_River_FID",
+    "Nearest_River_ov_id",
+    "Qualifying_Category",
+    "Qualifying_Substance",
+]
+
+
+def _contributing_site_ids(site_pairs: pd.DataFrame, group_columns: List[str]) -> pd.DataFrame:
+    """Sorted, comma-separated Lokalitet_IDs per group (one join per group)."""
+    pairs = (
+        site_pairs[group_columns + ["Lokalitet_ID"]]
+        .drop_duplicates()
+        .sort_values("Lokalitet_ID", kind="stable")
+    )
+    return (
+        pairs.groupby(group_columns, dropna=False)["Lokalitet_ID"]
+        .agg(", ".join)
+        .reset_index(name="Contributing_Site_IDs")
+    )
+
+
+SEGMENT_METADATA_COLUMNS = ["River_Segment_Name", "River_Segment_Length_m", "River_Segment_GVFK"]
+
+
+def _partial_segment_flux(flux_details: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Segment aggregates of one block of flux rows (map step).
+
+    Returns:
+        Tuple of (additive aggregates per segment group, distinct
+        (segment group, Lokalitet_ID) pairs). Combine blocks with
+        _reduce_segment_flux(); the pairs also feed
+        _attach_contributing_site_ids() at export.
+    """
+    group_columns = SEGMENT_FLUX_GROUP_COLUMNS
+
+    # Totals and site statistics in one pass
+    partial = (
+        flux_details.groupby(group_columns, dropna=False)
+        .agg(
+            Total_Flux_ug_per_year=("Pollution_Flux_ug_per_year", "sum"),
+            Total_Flux_mg_per_year=("Pollution_Flux_mg_per_year", "sum"),
+            Total_Flux_g_per_year=("Pollution_Flux_g_per_year", "sum"),
+            Total_Flux_kg_per_year=("Pollution_Flux_kg_per_year", "sum"),
+            Min_Distance_to_River_m=("Distance_to_River_m", "min"),
+            Max_Distance_to_River_m=("Distance_to_River_m", "max"),
+            River_Segment_Count=("River_Segment_Count", "max"),
+        )
+        .reset_index()
+    )
+
+    # Segment metadata - take first occurrence (first row, not first non-null)
+    metadata = flux_details.drop_duplicates(group_columns)[
+        group_columns + SEGMENT_METADATA_COLUMNS
+    ]
+    partial = partial.merge(metadata, on=group_columns, how="left")
+
+    site_pairs = flux_details[group_columns + ["Lokalitet_ID"]].drop_duplicates()
+    return partial, site_pairs
+
+
+def _reduce_segment_flux(
+    partials: List[pd.DataFrame], site_pairs: List[pd.DataFrame]
+) -> pd.DataFrame:
+    """
+    Combine _partial_segment_flux() blocks into the segment flux table (reduce step).
+
+    Only Contributing_Site_Count is computed here; the Contributing_Site_IDs
+    text is joined once, at export (_attach_contributing_site_ids()).
+    """
+    group_columns = SEGMENT_FLUX_GROUP_COLUMNS
+
+    combined = pd.concat(partials, ignore_index=True)
+    segment_flux = (
+        combined.groupby(group_columns, dropna=False)
+        .agg(
+            Total_Flux_ug_per_year=("Total_Flux_ug_per_year", "sum"),
+            Total_Flux_mg_per_year=("Total_Flux_mg_per_year", "sum"),
+            Total_Flux_g_per_year=("Total_Flux_g_per_year", "sum"),
+            Total_Flux_kg_per_year=("Total_Flux_kg_per_year", "sum"),
+            Min_Distance_to_River_m=("Min_Distance_to_River_m", "min"),
+            Max_Distance_to_River_m=("Max_Distance_to_River_m", "max"),
+            River_Segment_Count=("River_Segment_Count", "max"),
+        )
+        .reset_index()
+    )
+    metadata = combined.drop_duplicates(group_columns)[group_columns + SEGMENT_METADATA_COLUMNS]
+    segment_flux = segment_flux.merge(metadata, on=group_columns, how="left")
+
+    pairs = pd.concat(site_pairs, ignore_index=True).drop_duplicates()
+    site_counts = (
+        pairs.groupby(group_columns, dropna=False)["Lokalitet_ID"]
+        .nunique()
+        .reset_index(name="Contributing_Site_Count")
+    )
+    segment_flux = segment_flux.merge(site_counts, on=group_columns, how="left")
+
+    segment_flux["Nearest_River_FID"] = segment_flux["Nearest_River_FID"].astype(int)
+    segment_flux["River_Segment_Count"] = segment_flux["River_Segment_Count"].astype(int)
+
+    return segment_flux[
+        group_columns
+        + SEGMENT_METADATA_COLUMNS
+        + [
+            "Total_Flux_ug_per_year",
+            "Total_Flux_mg_per_year",
+            "Total_Flux_g_per_year",
+            "Total_Flux_kg_per_year",
+            "Contributing_Site_Count",
+            "Min_Distance_to_River_m",
+            "Max_Distance_to_River_m",
+            "River_Segment_Count",
+        ]
+    ]
+
+
+def _attach_contributing_site_ids(
+    cmix_results: pd.DataFrame, site_pairs: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Add Contributing_Site_IDs (after Contributing_Site_Count) for export.
+
+    Args:
+        cmix_results: Cmix rows per segment group and flow scenario
+        site_pairs: (segment group, Lokalitet_ID) rows, e.g. the site flux
+            table or the pairs from _partial_segment_flux()
+    """
+    if cmix_results.empty or site_pairs.empty:
+        return cmix_results
+
+    group_columns = SEGMENT_FLUX_GROUP_COLUMNS
+    site_ids = _contributing_site_ids(site_pairs, group_columns)
+    site_ids["Nearest_River_FID"] = site_ids["Nearest_River_FID"].astype(int)
+    result = cmix_results.merge(site_ids, on=group_columns, how="left")
+
+    columns = list(cmix_results.columns)
+    position = (
+        columns.index("Contributing_Site_Count") + 1
+        if "Contributing_Site_Count" in columns
+        else len(columns)
+    )
+    columns.insert(position, "Contributing_Site_IDs")
+    return result[columns]
+
+
 def _aggregate_flux_by_segment(flux_details: pd.DataFrame) -> pd.DataFrame:
     """
     Aggregate fluxes per river segment and substance.
@@ -1106,40 +1631,8 @@ def _aggregate_flux_by_segment(flux_details: pd.DataFrame) -> pd.DataFrame:
     if flux_details.empty:
         return pd.DataFrame()
 
-    records: List[Dict[str, object]] = []
-    # Group by FID + ov_id + category + substance
-    group_columns = [
-        "Nearest_River_FID",
-        "Nearest_River_ov_id",
-        "Qualifying_Category",
-        "Qualifying_Substance",
-    ]
-
-    for group_keys, group_df in flux_details.groupby(group_columns, dropna=False):
-        record = dict(zip(group_columns, group_keys))
-        # Aggregate metadata - take first occurrence
-        record["Nearest_River_FID"] = int(group_df["Nearest_River_FID"].iloc[0])
-        record["River_Segment_Name"] = group_df["River_Segment_Name"].iloc[0]
-        record["River_Segment_Length_m"] = group_df["River_Segment_Length_m"].iloc[0]
-        record["River_Segment_GVFK"] = group_df["River_Segment_GVFK"].iloc[0]
-
-        # Aggregate flux values
-        record["Total_Flux_ug_per_year"] = group_df["Pollution_Flux_ug_per_year"].sum()
-        record["Total_Flux_mg_per_year"] = group_df["Pollution_Flux_mg_per_year"].sum()
-        record["Total_Flux_g_per_year"] = group_df["Pollution_Flux_g_per_year"].sum()
-        record["Total_Flux_kg_per_year"] = group_df["Pollution_Flux_kg_per_year"].sum()
-
-        # Aggregate site information
-        record["Contributing_Site_Count"] = group_df["Lokalitet_ID"].nunique()
-        record["Contributing_Site_IDs"] = ", ".join(
-            sorted(group_df["Lokalitet_ID"].unique())
-        )
-        record["Min_Distance_to_River_m"] = group_df["Distance_to_River_m"].min()
-        record["Max_Distance_to_River_m"] = group_df["Distance_to_River_m"].max()
-        record["River_Segment_Count"] = int(group_df["River_Segment_Count"].max())
-        records.append(record)
-
-    return pd.DataFrame.from_records(records)
+    partial, site_pairs = _partial_segment_flux(flux_details)
+    return _reduce_segment_flux([partial], [site_pairs])
 
 
 # ===========================================================================
@@ -1147,14 +1640,30 @@ def _aggregate_flux_by_segment(flux_details: pd.DataFrame) -> pd.DataFrame:
 # ===========================================================================
 
 
+SEGMENT_KEY_COLUMNS = ["Nearest_River_FID", "Nearest_River_ov_id"]
+# Flow per River_FID and scenario from the segment-based selection modes
+FID_FLOW_COLUMNS = ["Nearest_River_FID", "Flow_Scenario", "Flow_segment", "Qpoint_segment"]
+# Persisted segment -> Q-point -> flow selection (step6_flow_selection.csv)
+FLOW_SELECTION_COLUMNS = SEGMENT_KEY_COLUMNS + [
+    "Flow_Scenario",
+    "Qpoint_Index",
+    "Flow_m3_s",
+    "Flow_Source",
+]
+
+
 def _calculate_cmix(
     segment_flux: pd.DataFrame,
     flow_scenarios: pd.DataFrame,
     qpoints_gdf: gpd.GeoDataFrame | None = None,
+    segment_flows: pd.DataFrame | None = None,
 ) -> pd.DataFrame:
     """
     Combine aggregated flux with flow scenarios to compute Cmix.
     Returns an empty DataFrame if either input is empty.
+
+    segment_flows can be passed when the flow table from _build_segment_flows()
+    was already built (it must cover all segments in segment_flux).
     """
     if segment_flux.empty or flow_scenarios.empty:
         if segment_flux.empty:
@@ -1163,146 +1672,377 @@ def _calculate_cmix(
             print("NOTE: Flow scenarios missing. Cmix calculation skipped.")
         return pd.DataFrame()
 
-    # Build flow lookup by ov_id (baseline)
-    flow_by_ov = {
-        (str(row["ov_id"]), row["Scenario"]): row["Flow_m3_s"]
-        for _, row in flow_scenarios.iterrows()
-        if pd.notna(row["Flow_m3_s"])
-    }
+    if segment_flows is None:
+        segment_flows = _build_segment_flows(
+            segment_flux[SEGMENT_KEY_COLUMNS], flow_scenarios, qpoints_gdf
+        )
 
-    # Optional: build flow lookup by River_FID (segment-based modes)
-    flow_by_fid = {}
+    merged = segment_flux.merge(
+        segment_flows.drop(columns=["Qpoint_Index"], errors="ignore"),
+        on=SEGMENT_KEY_COLUMNS,
+        how="left",
+    )
+    return _compute_cmix(merged)
+
+
+def _build_segment_flows(
+    segments: pd.DataFrame,
+    flow_scenarios: pd.DataFrame,
+    qpoints_gdf: gpd.GeoDataFrame | None = None,
+    chainage=None,
+) -> pd.DataFrame:
+    """
+    Flow per river segment and flow scenario.
+
+    Args:
+        segments: Nearest_River_FID + Nearest_River_ov_id (duplicates are ignored)
+        flow_scenarios: ov_id, Scenario, Flow_m3_s (max per ov_id per scenario)
+        qpoints_gdf: Raw Q-points for the segment-based selection modes
+        chainage: _qpoint_chainage(qpoints_gdf), built once per run and shared
+            by all calls (built here if None in downstream_per_segment mode)
+
+    Returns:
+        Nearest_River_FID, Nearest_River_ov_id, Flow_Scenario, Flow_m3_s,
+        Flow_Source and Qpoint_Index - one row per segment and scenario of its
+        ov_id (one NaN row if the ov_id has no flow). Flow_Source is the
+        segment-based selection mode, "ov_id_max" or "none"; Qpoint_Index is the
+        row position of the selected Q-point in the Q-point layer.
+    """
+    segments = segments[SEGMENT_KEY_COLUMNS].drop_duplicates()
+
+    # Optional: flow per River_FID and scenario (segment-based modes)
+    fid_flows = pd.DataFrame(columns=FID_FLOW_COLUMNS)
     if (
         qpoints_gdf is not None
         and STEP6_FLOW_SELECTION_MODE in ("max_near_segment", "downstream_per_segment")
         and "geometry" in qpoints_gdf.columns
     ):
         try:
-            rivers = load_river_segments()
-            if rivers.crs != qpoints_gdf.crs:
-                rivers = rivers.to_crs(qpoints_gdf.crs)
-
             scenario_cols = [c for c in FLOW_SCENARIO_COLUMNS if c in qpoints_gdf.columns]
             if scenario_cols:
-                # Project to metric CRS for distance calculations if needed
-                rivers_proj = rivers
-                qpoints_proj = qpoints_gdf
-                try:
-                    if rivers_proj.crs.is_geographic:
-                        rivers_proj = rivers_proj.to_crs(epsg=25832)
-                        qpoints_proj = qpoints_gdf.to_crs(epsg=25832)
-                except Exception:
-                    pass
-
-                fallback_count = 0
-
+                rivers_proj, qpoints_proj = _metric_flow_layers(qpoints_gdf)
                 if STEP6_FLOW_SELECTION_MODE == "downstream_per_segment":
-                    # For each segment, find nearest Q-point on same ov_id
-                    # Use segment endpoint (downstream end) for distance calculation
-                    from shapely.geometry import Point
-                    for _, seg in rivers_proj.iterrows():
-                        seg_fid = seg.get("River_FID")
-                        seg_ov_id = str(seg.get("ov_id", ""))
-                        if pd.isna(seg_fid) or seg.geometry is None or not seg_ov_id:
-                            continue
-                        try:
-                            seg_fid_int = int(seg_fid)
-                        except Exception:
-                            continue
-
-                        # Get Q-points on same river
-                        ov_qpoints = qpoints_proj[qpoints_proj["ov_id"] == seg_ov_id]
-                        if ov_qpoints.empty:
-                            fallback_count += 1
-                            continue
-
-                        # Get segment's downstream endpoint (last coordinate)
-                        try:
-                            coords = list(seg.geometry.coords)
-                            downstream_pt = coords[-1]  # Assuming line direction is upstream→downstream
-                            downstream_geom = Point(downstream_pt)
-                        except Exception:
-                            # Fallback to centroid
-                            downstream_geom = seg.geometry.centroid
-
-                        # Find nearest Q-point to downstream end
-                        distances = ov_qpoints.geometry.distance(downstream_geom)
-                        nearest_idx = distances.idxmin()
-                        nearest_qpoint = qpoints_gdf.loc[nearest_idx]  # Use original (non-projected) for values
-
-                        # Add entry for each scenario
-                        for scenario_col in scenario_cols:
-                            flow_val = nearest_qpoint.get(scenario_col)
-                            scenario_name = FLOW_SCENARIO_COLUMNS.get(scenario_col, scenario_col)
-                            if pd.notna(flow_val) and flow_val > 0:
-                                flow_by_fid[(seg_fid_int, scenario_name)] = flow_val
-
-                    print(f"      Built segment flow lookup (downstream_per_segment: {len(flow_by_fid)} keys, fallback: {fallback_count})")
+                    # First Q-point on same ov_id at or below each segment's end
+                    if chainage is None:
+                        chainage = _qpoint_chainage(qpoints_gdf)
+                    rivers_proj = rivers_proj[
+                        rivers_proj["River_FID"].isin(segments["Nearest_River_FID"])
+                    ]
+                    fid_flows, fallback_count = _downstream_segment_flows(
+                        rivers_proj, qpoints_proj, qpoints_gdf, scenario_cols, chainage
+                    )
+
+                    print(f"      Built segment flow lookup (downstream_per_segment: {len(fid_flows)} keys, fallback: {fallback_count})")
 
                 else:  # max_near_segment mode
-                    flow_long = qpoints_gdf.melt(
-                        id_vars=["ov_id", "geometry"],
-                        value_vars=scenario_cols,
-                        var_name="Scenario_raw",
-                        value_name="Flow_m3_s",
+                    rivers_proj = rivers_proj[
+                        rivers_proj["River_FID"].isin(segments["Nearest_River_FID"])
+                    ]
+                    # Max flow per scenario among Q-points within 100 m of each segment
+                    fid_flows, fallback_count = _max_near_segment_flows(
+                        rivers_proj, qpoints_proj, qpoints_gdf, scenario_cols
                     )
-                    flow_long["Scenario"] = flow_long["Scenario_raw"].map(FLOW_SCENARIO_COLUMNS)
-                    flow_long = flow_long.drop(columns=["Scenario_raw"])
-                    flow_long = flow_long[
-                        flow_long["Flow_m3_s"].notna() & (flow_long["Flow_m3_s"] > 0)
-                    ].reset_index(drop=True)
-
-                    flow_proj = flow_long.copy()
-                    try:
-                        flow_proj["geometry"] = flow_long["geometry"].to_crs(epsg=25832).values
-                    except Exception:
-                        pass
-
-                    buffer_dist = 100.0
-                    for _, seg in rivers_proj.iterrows():
-                        seg_fid = seg.get("River_FID")
-                        if pd.isna(seg_fid) or seg.geometry is None:
-                            continue
-                        try:
-                            seg_fid_int = int(seg_fid)
-                        except Exception:
-                            continue
-                        dists = flow_proj.geometry.distance(seg.geometry)
-                        nearby_idx = dists <= buffer_dist
-                        if not nearby_idx.any():
-                            fallback_count += 1
-                            continue
-                        nearby = flow_proj[nearby_idx]
-                        idx_max_near = nearby.groupby("Scenario")["Flow_m3_s"].idxmax()
-                        max_near = nearby.loc[idx_max_near]
-                        for _, row in max_near.iterrows():
-                            flow_by_fid[(seg_fid_int, row["Scenario"])] = row["Flow_m3_s"]
-
-                    print(f"      Built segment flow lookup (max_near_segment: {len(flow_by_fid)} keys, fallback: {fallback_count})")
+
+                    print(f"      Built segment flow lookup (max_near_segment: {len(fid_flows)} keys, fallback: {fallback_count})")
 
             else:
                 print("NOTE: No scenario columns in Q-point data for segment-based flow.")
         except Exception as exc:
             print(f"NOTE: Segment-based flow lookup failed; using ov_id max only. ({exc})")
 
-    merged = segment_flux.merge(
-        flow_scenarios,
+    # Keyed flow frames: FID-based (segment modes) and ov_id max (baseline)
+    fid_flows = fid_flows.astype(
+        {"Nearest_River_FID": segments["Nearest_River_FID"].dtype, "Flow_segment": float}
+    )
+    valid_ov = flow_scenarios[flow_scenarios["Flow_m3_s"].notna()]
+    ov_flows = pd.DataFrame(
+        {
+            "_ov_key": valid_ov["ov_id"].astype(str).to_numpy(),
+            "Flow_Scenario": valid_ov["Scenario"].to_numpy(),
+            "Flow_ov_id": valid_ov["Flow_m3_s"].to_numpy(),
+        }
+    ).drop_duplicates(["_ov_key", "Flow_Scenario"], keep="last")
+    if qpoints_gdf is not None:
+        ov_flows = ov_flows.merge(
+            _ov_max_qpoints(qpoints_gdf), on=["_ov_key", "Flow_Scenario"], how="left"
+        )
+    else:
+        ov_flows["Qpoint_ov_id"] = np.nan
+
+    # One row per segment and scenario of its ov_id
+    merged = segments.merge(
+        flow_scenarios[["ov_id", "Scenario"]],
         left_on="Nearest_River_ov_id",
         right_on="ov_id",
         how="left",
     ).drop(columns=["ov_id"])
-
     merged = merged.rename(columns={"Scenario": "Flow_Scenario"})
+    merged["_ov_key"] = merged["Nearest_River_ov_id"].astype(str)
+
+    # FID-based flow if available (segment modes), else ov_id max
+    merged = merged.merge(fid_flows, on=["Nearest_River_FID", "Flow_Scenario"], how="left")
+    merged = merged.merge(ov_flows, on=["_ov_key", "Flow_Scenario"], how="left")
+    merged["Flow_m3_s"] = merged["Flow_segment"].combine_first(merged["Flow_ov_id"])
+    merged["Flow_Source"] = np.select(
+        [merged["Flow_segment"].notna(), merged["Flow_ov_id"].notna()],
+        [STEP6_FLOW_SELECTION_MODE, "ov_id_max"],
+        default="none",
+    )
+    merged["Qpoint_Index"] = pd.array(
+        np.where(
+            merged["Flow_segment"].notna(), merged["Qpoint_segment"], merged["Qpoint_ov_id"]
+        ).astype(float),
+        dtype="Int64",
+    )
+    return merged.drop(
+        columns=["_ov_key", "Flow_segment", "Flow_ov_id", "Qpoint_segment", "Qpoint_ov_id"]
+    )
+
+
+def _ov_max_qpoints(qpoints_gdf: gpd.GeoDataFrame) -> pd.DataFrame:
+    """Position of the Q-point holding the max flow per ov_id and scenario (first on ties)."""
+    scenario_cols = [c for c in FLOW_SCENARIO_COLUMNS if c in qpoints_gdf.columns]
+    flow_long = (
+        qpoints_gdf[scenario_cols]
+        .set_axis(np.arange(len(qpoints_gdf)))
+        .assign(_ov_key=qpoints_gdf["ov_id"].astype(str).to_numpy())
+        .rename_axis("Qpoint_ov_id")
+        .reset_index()
+        .melt(id_vars=["Qpoint_ov_id", "_ov_key"], var_name="Scenario_raw", value_name="_flow")
+    )
+    flow_long["Flow_Scenario"] = flow_long["Scenario_raw"].map(FLOW_SCENARIO_COLUMNS)
+    flow_long["_flow"] = pd.to_numeric(flow_long["_flow"], errors="coerce")
+    return (
+        flow_long[flow_long["_flow"].notna()]
+        .sort_values("_flow", ascending=False, kind="stable")
+        .drop_duplicates(["_ov_key", "Flow_Scenario"])[["_ov_key", "Flow_Scenario", "Qpoint_ov_id"]]
+    )
+
+
+def _metric_flow_layers(
+    qpoints_gdf: gpd.GeoDataFrame,
+) -> Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    """Full river layer and Q-points in a metric CRS (layer cache; projected if geographic)."""
+    # Full network: segments reached by downstream routing may lack GVFK contact
+    rivers_proj = load_river_segments(crs=qpoints_gdf.crs, contact_only=False)
+    qpoints_proj = qpoints_gdf
+    try:
+        if rivers_proj.crs.is_geographic:
+            rivers_proj = load_river_segments(crs="EPSG:25832", contact_only=False)
+            qpoints_proj = qpoints_gdf.to_crs(epsg=25832)
+    except Exception:
+        pass
+    return rivers_proj, qpoints_proj
+
+
+def _qpoint_chainage(qpoints_gdf: gpd.GeoDataFrame | None):
+    """
+    Linear-referencing index of the Q-points on the full river network
+    (downstream_per_segment mode), built on the cached load_river_network().
 
-    # Override Flow_m3_s using FID-based lookup if available (nearest mode), else ov_id max
-    def _flow_lookup(row):
-        key_fid = (row.get("Nearest_River_FID"), row.get("Flow_Scenario"))
-        if key_fid in flow_by_fid:
-            return flow_by_fid[key_fid]
-        key_ov = (str(row.get("Nearest_River_ov_id")), row.get("Flow_Scenario"))
-        return flow_by_ov.get(key_ov, np.nan)
+    Returns None outside that mode, without Q-point geometry, or if it cannot
+    be built (the downstream mode then uses the nearest Q-point to the
+    segment end only).
+    """
+    if (
+        qpoints_gdf is None
+        or STEP6_FLOW_SELECTION_MODE != "downstream_per_segment"
+        or "geometry" not in qpoints_gdf.columns
+    ):
+        return None
+    try:
+        from .step6_river_network import QpointChainage, load_river_network
+    except ImportError:
+        from step6_river_network import QpointChainage, load_river_network
+
+    try:
+        rivers_proj, qpoints_proj = _metric_flow_layers(qpoints_gdf)
+        return QpointChainage(load_river_network(), rivers_proj, qpoints_proj)
+    except Exception as exc:
+        print(f"NOTE: Q-point linear referencing failed; using nearest Q-point to segment end. ({exc})")
+        return None
+
+
+def _downstream_segment_flows(
+    rivers_proj: gpd.GeoDataFrame,
+    qpoints_proj: gpd.GeoDataFrame,
+    qpoints_gdf: gpd.GeoDataFrame,
+    scenario_cols: List[str],
+    chainage=None,
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Flow per (River_FID, scenario) from the first Q-point downstream of each
+    segment on the same ov_id.
+
+    With a linear-referencing index (chainage, a QpointChainage over
+    qpoints_proj) the Q-point is the first one at or below the segment end
+    along the river network. Segments it cannot place (not in the network, no
+    Q-point below them) - or all segments without an index - use the Q-point
+    nearest to the downstream end of the segment. Q-points are grouped by
+    ov_id once (stable sort + offsets), so all segment/Q-point pairs of the
+    same river are measured in one vectorized distance call.
 
-    merged["Flow_m3_s"] = merged.apply(_flow_lookup, axis=1)
+    Returns:
+        (fid_flows, fallback_count) - fid_flows has FID_FLOW_COLUMNS, and
+        fallback_count is the number of segments whose ov_id has no Q-points.
+    """
+    seg_fid = pd.to_numeric(rivers_proj["River_FID"], errors="coerce")
+    if "ov_id" in rivers_proj.columns:
+        seg_ov = rivers_proj["ov_id"].astype(str)
+    else:
+        seg_ov = pd.Series("", index=rivers_proj.index)
+    valid = (
+        seg_fid.notna().to_numpy()
+        & rivers_proj.geometry.notna().to_numpy()
+        & (seg_ov != "").to_numpy()
+    )
+    seg_fid = seg_fid.to_numpy()[valid].astype(np.int64)
+    seg_geoms = rivers_proj.geometry.to_numpy()[valid]
+
+    # Q-point positions grouped by ov_id (original order kept within a group)
+    q_codes, q_ov_ids = pd.factorize(qpoints_proj["ov_id"])
+    order = np.argsort(q_codes, kind="stable")
+    group_size = np.bincount(q_codes[q_codes >= 0], minlength=len(q_ov_ids))
+    group_start = np.searchsorted(q_codes[order], np.arange(len(q_ov_ids)))
+
+    seg_codes = pd.Index(q_ov_ids).get_indexer(seg_ov.to_numpy()[valid])
+    has_qpoints = seg_codes >= 0
+    fallback_count = int((~has_qpoints).sum())
+    seg_fid = seg_fid[has_qpoints]
+    seg_geoms = seg_geoms[has_qpoints]
+    seg_codes = seg_codes[has_qpoints]
+    if len(seg_codes) == 0:
+        return pd.DataFrame(columns=FID_FLOW_COLUMNS), fallback_count
+
+    # Downstream end = last vertex (lines digitised upstream -> downstream);
+    # centroid for geometries without a single coordinate sequence
+    downstream = shapely.get_point(seg_geoms, -1)
+    no_point = shapely.is_missing(downstream)
+    downstream[no_point] = shapely.centroid(seg_geoms[no_point])
+
+    # One row per segment and Q-point on its ov_id
+    pair_count = group_size[seg_codes]
+    pair_seg = np.repeat(np.arange(len(seg_codes)), pair_count)
+    pair_offset = np.arange(len(pair_seg)) - np.repeat(np.cumsum(pair_count) - pair_count, pair_count)
+    pair_q = order[np.repeat(group_start[seg_codes], pair_count) + pair_offset]
+    distances = shapely.distance(downstream[pair_seg], qpoints_proj.geometry.to_numpy()[pair_q])
+
+    # Nearest per segment; stable sort keeps the first Q-point on ties
+    ranked = np.lexsort((distances, pair_seg))
+    first = np.r_[True, pair_seg[ranked][1:] != pair_seg[ranked][:-1]]
+    nearest_q = pair_q[ranked][first]
+
+    if chainage is not None:
+        positions = chainage.network.positions(seg_fid)
+        in_network = np.flatnonzero(positions >= 0)
+        linear_q = chainage.first_downstream(positions[in_network])
+        placed = linear_q >= 0
+        nearest_q[in_network[placed]] = linear_q[placed]
+        print(
+            f"      Linear referencing: {int(placed.sum())} of {len(seg_fid)} segments "
+            f"on the first Q-point downstream, rest on the nearest to the segment end"
+        )
+
+    # Values from the original (non-projected) Q-points
+    frames = []
+    for scenario_col in scenario_cols:
+        flows = qpoints_gdf[scenario_col].to_numpy()[nearest_q]
+        keep = pd.notna(flows) & (flows > 0)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Nearest_River_FID": seg_fid[keep],
+                    "Flow_Scenario": FLOW_SCENARIO_COLUMNS.get(scenario_col, scenario_col),
+                    "Flow_segment": flows[keep],
+                    "Qpoint_segment": nearest_q[keep],
+                }
+            )
+        )
+    # Segments sharing a River_FID: the last segment wins
+    fid_flows = pd.concat(frames, ignore_index=True).drop_duplicates(
+        ["Nearest_River_FID", "Flow_Scenario"], keep="last"
+    )
+    return fid_flows, fallback_count
+
+
+def _max_near_segment_flows(
+    rivers_proj: gpd.GeoDataFrame,
+    qpoints_proj: gpd.GeoDataFrame,
+    qpoints_gdf: gpd.GeoDataFrame,
+    scenario_cols: List[str],
+    buffer_dist: float = 100.0,
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Flow per (River_FID, scenario) as the max flow among all Q-points within
+    buffer_dist (m) of each segment, regardless of ov_id.
+
+    One sjoin (dwithin) on the spatial index of the Q-point geometries gives
+    the segment/Q-point pairs; the scenario flows are attached per pair and
+    reduced to the max per segment and scenario.
+
+    Returns:
+        (fid_flows, fallback_count) - fid_flows has FID_FLOW_COLUMNS, and
+        fallback_count is the number of segments without a positive flow within
+        buffer_dist.
+    """
+    seg_fid = pd.to_numeric(rivers_proj["River_FID"], errors="coerce")
+    valid = seg_fid.notna().to_numpy() & rivers_proj.geometry.notna().to_numpy()
+    segments = gpd.GeoDataFrame(
+        {
+            "_seg": np.arange(int(valid.sum())),
+            "River_FID": seg_fid.to_numpy()[valid].astype(np.int64),
+        },
+        geometry=rivers_proj.geometry.to_numpy()[valid],
+        crs=rivers_proj.crs,
+    )
+    qpoints = gpd.GeoDataFrame(
+        {"_qpoint": np.arange(len(qpoints_proj))},
+        geometry=qpoints_proj.geometry.to_numpy(),
+        crs=qpoints_proj.crs,
+    )
+    pairs = gpd.sjoin(
+        segments, qpoints, how="inner", predicate="dwithin", distance=buffer_dist
+    )[["_seg", "River_FID", "_qpoint"]]
+
+    # Positive scenario flows per Q-point (values from the non-projected data)
+    flow_long = (
+        qpoints_gdf[scenario_cols]
+        .set_axis(np.arange(len(qpoints_gdf)))
+        .rename_axis("_qpoint")
+        .reset_index()
+        .melt(id_vars="_qpoint", var_name="Scenario_raw", value_name="Flow_m3_s")
+    )
+    flow_long["Flow_m3_s"] = pd.to_numeric(flow_long["Flow_m3_s"], errors="coerce")
+    flow_long = flow_long[flow_long["Flow_m3_s"] > 0]
+    flow_long["Scenario"] = flow_long["Scenario_raw"].map(FLOW_SCENARIO_COLUMNS)
+
+    # Max per segment and scenario (first Q-point on ties)
+    near_max = (
+        pairs.merge(flow_long[["_qpoint", "Scenario", "Flow_m3_s"]], on="_qpoint")
+        .sort_values(
+            ["_seg", "Scenario", "Flow_m3_s", "_qpoint"], ascending=[True, True, False, True]
+        )
+        .drop_duplicates(["_seg", "Scenario"])
+    )
+    fallback_count = len(segments) - near_max["_seg"].nunique()
+
+    # Segments sharing a River_FID: the last segment wins
+    fid_flows = (
+        near_max.rename(
+            columns={
+                "River_FID": "Nearest_River_FID",
+                "Scenario": "Flow_Scenario",
+                "Flow_m3_s": "Flow_segment",
+                "_qpoint": "Qpoint_segment",
+            }
+        )[FID_FLOW_COLUMNS]
+        .drop_duplicates(["Nearest_River_FID", "Flow_Scenario"], keep="last")
+    )
+    return fid_flows, fallback_count
+
+
+def _compute_cmix(merged: pd.DataFrame) -> pd.DataFrame:
+    """Add Has_Flow_Data, Flux_ug_per_second and Cmix_ug_L from Total_Flux and Flow_m3_s."""
     valid_flow = merged["Flow_m3_s"].notna() & (merged["Flow_m3_s"] > 0)
     merged["Has_Flow_Data"] = valid_flow
     merged["Flux_ug_per_second"] = merged["Total_Flux_ug_per_year"] / SECONDS_PER_YEAR
@@ -1316,25 +2056,28 @@ def _calculate_cmix(
     return merged
 
 
-def _apply_mkk_thresholds(cmix_results: pd.DataFrame) -> pd.DataFrame:
+def _apply_mkk_thresholds(
+    cmix_results: pd.DataFrame, mkk_thresholds: Dict[str, float] | None = None
+) -> pd.DataFrame:
     """
     Apply in-memory MKK thresholds (if provided) and compute exceedance flags.
     The lookup checks substance first and then falls back to category.
+    mkk_thresholds replaces MKK_THRESHOLDS (e.g. for what-if runs).
     """
     if cmix_results.empty:
         return cmix_results
 
-    if not MKK_THRESHOLDS:
+    if mkk_thresholds is None:
+        mkk_thresholds = MKK_THRESHOLDS
+
+    if not mkk_thresholds:
         cmix_results["MKK_ug_L"] = np.nan
         cmix_results["Exceedance_Flag"] = False
         cmix_results["Exceedance_Ratio"] = np.nan
         print("NOTE: No MKK thresholds defined. Exceedance metrics left blank.")
         return cmix_results
 
-    def lookup_threshold(row: pd.Series) -> float:
-        substance = row.get("Qualifying_Substance")
-        category = row.get("Qualifying_Category")
-
+    def lookup_threshold(substance: str | None, category: str) -> float:
         # Strip "Landfill Override:" prefix if present
         if substance and "Landfill Override:" in substance:
             substance = substance.replace("Landfill Override:", "").strip()
@@ -1348,16 +2091,28 @@ def _apply_mkk_thresholds(cmix_results: pd.DataFrame) -> pd.DataFrame:
             substance = substance.split("__via_")[1].strip()
 
         # Per meeting decision: Only use substance-specific MKK for the 16 modelstoffer
-        if substance in MODELSTOFFER and substance in MKK_THRESHOLDS:
-            return MKK_THRESHOLDS[substance]
+        if substance in MODELSTOFFER and substance in mkk_thresholds:
+            return mkk_thresholds[substance]
 
         # All other substances use category MKK
-        if category in MKK_THRESHOLDS:
-            return MKK_THRESHOLDS[category]
+        if category in mkk_thresholds:
+            return mkk_thresholds[category]
         return np.nan
 
+    # Resolve once per unique (substance, category) pair and merge back
+    pair_columns = ["Qualifying_Substance", "Qualifying_Category"]
+    pairs = cmix_results[pair_columns].drop_duplicates()
+    pairs["MKK_ug_L"] = [
+        lookup_threshold(substance, category)
+        for substance, category in pairs.itertuples(index=False)
+    ]
+
     cmix_results = cmix_results.copy()
-    cmix_results["MKK_ug_L"] = cmix_results.apply(lookup_threshold, axis=1)
+    cmix_results["MKK_ug_L"] = (
+        cmix_results[pair_columns]
+        .merge(pairs, on=pair_columns, how="left")["MKK_ug_L"]
+        .to_numpy(dtype=float)
+    )
     cmix_results["Exceedance_Flag"] = cmix_results["MKK_ug_L"].notna() & (
         cmix_results["Cmix_ug_L"] > cmix_results["MKK_ug_L"]
     )
@@ -1384,6 +2139,9 @@ def _build_segment_summary(
     """
     Build a one-row-per-segment summary showing total flux, max exceedance ratio,
     scenario lists, and contributing sites.
+
+    Only Nearest_River_FID, Nearest_River_ov_id and Lokalitet_ID of flux_details
+    are used (chunked runs pass the segment-site pairs instead).
     """
     if cmix_results.empty:
         return pd.DataFrame()
@@ -1435,20 +2193,17 @@ def _build_segment_summary(
 
     # Add Failing_Scenarios column (expected by visualization code)
     # This identifies which flow scenarios exceed MKK for each segment
-    failing_scenarios = []
-    for _, row in summary.iterrows():
-        ov_id = row["Nearest_River_ov_id"]
-        segment_cmix = cmix_results[
-            (cmix_results["Nearest_River_ov_id"] == ov_id)
-            & (cmix_results["Exceedance_Flag"] == True)
-        ]
-        if not segment_cmix.empty:
-            scenarios = sorted(segment_cmix["Flow_Scenario"].unique())
-            failing_scenarios.append(", ".join(scenarios))
-        else:
-            failing_scenarios.append("")
-
-    summary["Failing_Scenarios"] = failing_scenarios
+    exceedances = cmix_results[cmix_results["Exceedance_Flag"] == True]
+    failing_scenarios = (
+        exceedances[group_cols + ["Flow_Scenario"]]
+        .drop_duplicates()
+        .sort_values("Flow_Scenario", kind="stable")
+        .groupby(group_cols, dropna=False)["Flow_Scenario"]
+        .agg(", ".join)
+        .reset_index(name="Failing_Scenarios")
+    )
+    summary = summary.merge(failing_scenarios, on=group_cols, how="left")
+    summary["Failing_Scenarios"] = summary["Failing_Scenarios"].fillna("")
 
     return summary.sort_values(
         "Max_Exceedance_Ratio", ascending=False, na_position="last"
@@ -1596,15 +2351,16 @@ def _extract_exceedance_views(
 
 
 def _export_results(
-    flux_details: pd.DataFrame,
+    flux_details: pd.DataFrame | None,
     cmix_results: pd.DataFrame,
     segment_summary: pd.DataFrame,
     site_exceedances: pd.DataFrame,
 ) -> None:
-    """Write Step 6 core outputs to disk."""
-    flux_details.to_csv(
-        get_output_path("step6_flux_site_segment"), index=False, encoding="utf-8"
-    )
+    """Write Step 6 core outputs to disk (flux_details None: already streamed)."""
+    if flux_details is not None:
+        flux_details.to_csv(
+            get_output_path("step6_flux_site_segment"), index=False, encoding="utf-8"
+        )
     cmix_results.to_csv(
         get_output_path("step6_cmix_results"), index=False, encoding="utf-8"
     )
@@ -1615,7 +2371,8 @@ def _export_results(
         get_output_path("step6_site_mkk_exceedances"), index=False, encoding="utf-8"
     )
 
-    print(f"\nExported {len(flux_details)} site-level flux records")
+    if flux_details is not None:
+        print(f"\nExported {len(flux_details)} site-level flux records")
     print(f"Exported {len(cmix_results)} Cmix scenarios")
     print(f"Exported {len(segment_summary)} segment summaries")
     print(f"Exported {len(site_exceedances)} site exceedance records")
@@ -1627,6 +2384,116 @@ def _export_results(
     print(f"  - site_exceedances: {get_output_path('step6_site_mkk_exceedances')}")
 
 
+def _export_flux_matrix(flux_rows, segment_flows: pd.DataFrame) -> None:
+    """
+    Persist the sparse flux matrix used for what-if Cmix recomputation.
+
+    flux_rows: the Step 6 scenario rows, or a FluxMatrixBuilder they were
+    added to chunk by chunk (chunked mode).
+    """
+    try:
+        from .step6_flux_matrix import FluxMatrixBuilder, build_flux_matrix
+    except ImportError:
+        from step6_flux_matrix import FluxMatrixBuilder, build_flux_matrix
+
+    if flux_rows.empty:
+        return
+    if isinstance(flux_rows, FluxMatrixBuilder):
+        flux_matrix = flux_rows.build(segment_flows)
+    else:
+        flux_matrix = build_flux_matrix(flux_rows, segment_flows)
+    flux_matrix.save(get_output_path("step6_flux_matrix"))
+    print(f"  - flux_matrix:      {get_output_path('step6_flux_matrix')}")
+
+
+def _export_flow_selection(segment_flows: pd.DataFrame) -> None:
+    """
+    Persist the segment -> Q-point -> flow selection (read by the Step 6 maps
+    and tools/trace_river_workflow.py via data_loaders.load_flow_selection).
+    """
+    segment_mode = STEP6_FLOW_SELECTION_MODE in ("max_near_segment", "downstream_per_segment")
+    selection = segment_flows[FLOW_SELECTION_COLUMNS].assign(
+        Selection_Mode=STEP6_FLOW_SELECTION_MODE,
+        Is_Fallback=segment_mode & (segment_flows["Flow_Source"] == "ov_id_max"),
+        Input_Hash=flow_selection_input_hash(),
+    )
+    selection_path = get_output_path("step6_flow_selection")
+    selection.to_csv(selection_path, index=False, encoding="utf-8")
+    print(f"  - flow_selection:   {selection_path}")
+
+
+def _export_accumulated_cmix(
+    segment_flux: pd.DataFrame,
+    flow_scenarios: pd.DataFrame,
+    qpoints_gdf: gpd.GeoDataFrame | None,
+    chainage=None,
+) -> None:
+    """Cmix from flux routed downstream along the river network (STEP6_DOWNSTREAM_ACCUMULATION)."""
+    if not STEP6_DOWNSTREAM_ACCUMULATION or segment_flux.empty or flow_scenarios.empty:
+        return
+    try:
+        from .step6_river_network import accumulated_cmix, load_river_network
+    except ImportError:
+        from step6_river_network import accumulated_cmix, load_river_network
+
+    accumulated = accumulated_cmix(
+        segment_flux, load_river_network(), flow_scenarios, qpoints_gdf, chainage
+    )
+    accumulated_path = get_output_path("step6_cmix_accumulated")
+    accumulated.to_csv(accumulated_path, index=False, encoding="utf-8")
+    if not accumulated.empty:
+        exceeding = accumulated.loc[accumulated["Exceedance_Flag"], "Nearest_River_FID"].nunique()
+        print(
+            f"  Downstream accumulation: {accumulated['Nearest_River_FID'].nunique():,} segments "
+            f"reached, {exceeding:,} with MKK exceedance"
+        )
+    print(f"  - cmix_accumulated: {accumulated_path}")
+
+
+def _export_exceedance_fraction(cmix_results: pd.DataFrame) -> None:
+    """Fraction of time exceeding MKK from the flow-duration curves (STEP6_FLOW_DURATION_EXCEEDANCE)."""
+    if not STEP6_FLOW_DURATION_EXCEEDANCE or cmix_results.empty:
+        return
+    try:
+        from .step6_flow_duration import exceedance_time_fraction
+    except ImportError:
+        from step6_flow_duration import exceedance_time_fraction
+
+    fractions = exceedance_time_fraction(cmix_results)
+    fraction_path = get_output_path("step6_exceedance_fraction")
+    fractions.to_csv(fraction_path, index=False, encoding="utf-8")
+    if not fractions.empty:
+        fraction = fractions["Exceedance_Time_Fraction"]
+        print(
+            f"  Flow-duration exceedance: {fraction.notna().sum():,} segment-substances, "
+            f"{(fraction > 0.05).sum():,} exceed MKK more than 5% of the time "
+            f"({fractions['Outside_Scenario_Range'].sum():,} extrapolated beyond Q05/Q95)"
+        )
+    print(f"  - exceedance_fraction: {fraction_path}")
+
+
+def _export_daily_exceedance(cmix_results: pd.DataFrame, segment_flows: pd.DataFrame) -> None:
+    """Exceedance days per segment-substance from daily Q-point flows (RIVER_DAILY_FLOW_PATH)."""
+    daily_flows = load_daily_flow_series()
+    if daily_flows is None or cmix_results.empty:
+        return
+    try:
+        from .step6_daily_flow import daily_exceedance
+    except ImportError:
+        from step6_daily_flow import daily_exceedance
+
+    exceedance = daily_exceedance(cmix_results, segment_flows, daily_flows)
+    exceedance_path = get_output_path("step6_daily_exceedance")
+    exceedance.to_csv(exceedance_path, index=False, encoding="utf-8")
+    days = exceedance["Exceedance_Days"]
+    exceeding = exceedance.loc[days > 0, "Nearest_River_FID"].nunique()
+    print(
+        f"  Daily exceedance: {exceeding:,} segments with MKK exceedance days "
+        f"(max {days.max():,.0f} days, longest run {exceedance['Max_Exceedance_Run_Days'].max():,.0f} days)"
+    )
+    print(f"  - daily_exceedance: {exceedance_path}")
+
+
 # ===========================================================================
 # Entry point
 # ===========================================================================
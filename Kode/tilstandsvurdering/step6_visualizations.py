@@ -734,7 +734,9 @@ def _overlay_gvfk_boundaries(negative_df: pd.DataFrame, fmap: folium.Map) -> Non
         print("  GVFK polygon source not found – skipping boundary overlay.")
         return
 
-    gvfk_geo = gpd.read_file(source_path)
+    from data_loaders import read_layer
+
+    gvfk_geo = read_layer(source_path, crs="EPSG:4326")
     id_column = None
     normalized_cols = {col.lower(): col for col in gvfk_geo.columns}
     preferred_keys = [
@@ -766,7 +768,6 @@ def _overlay_gvfk_boundaries(negative_df: pd.DataFrame, fmap: folium.Map) -> Non
         print("  GVFK polygons not found for removed IDs; skipping overlay.")
         return
 
-    subset = subset.to_crs(epsg=4326)
     folium.GeoJson(
         subset[[id_column, "geometry"]],
         name="Grundvandsforekomster (GVFK)",
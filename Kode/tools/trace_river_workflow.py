@@ -18,6 +18,10 @@ Example usage:
     python tools/trace_river_workflow.py --list-rivers
     python tools/trace_river_workflow.py --list-sites
 
+    # River network queries (Step 6 sites, routed along the network)
+    python tools/trace_river_workflow.py --upstream-sites 12345
+    python tools/trace_river_workflow.py --downstream-segments 731-00045
+
 This helps answer questions like:
 - How many segments does this river have?
 - Which segments have GVFK contact?
@@ -27,6 +31,7 @@ This helps answer questions like:
 - Which GVFKs is a site located in?
 - Which river segments are nearest to a site?
 - Does the site pass risk thresholds and reach Step 6?
+- Which Step 6 sites drain into a segment, and which segments lie below a site?
 """
 
 import sys
@@ -47,7 +52,9 @@ from config import (
     RIVERS_LAYER_NAME,
     GRUNDVAND_PATH,
     GRUNDVAND_LAYER_NAME,
+    STEP6_PRIMARY_FLOW_SCENARIO,
 )
+from data_loaders import load_flow_selection, load_step5_combinations
 
 
 def load_rivers():
@@ -81,15 +88,11 @@ def load_workflow_data():
     if step4_path.exists():
         data['step4'] = pd.read_csv(step4_path)
 
-    # Step 5b: Compound combinations
+    # Step 5b: Compound combinations (the detailed output is the same file - read once)
     step5b_path = get_output_path("step5b_compound_combinations")
     if step5b_path.exists():
-        data['step5b'] = pd.read_csv(step5b_path)
-
-    # Step 5 detailed (with river FID)
-    step5_detail_path = get_output_path("step5_compound_detailed_combinations")
-    if step5_detail_path.exists():
-        data['step5_detail'] = pd.read_csv(step5_detail_path)
+        data['step5b'] = load_step5_combinations()
+        data['step5_detail'] = data['step5b']
 
     # Step 6: Flux details
     step6_flux_path = get_output_path("step6_flux_site_segment")
@@ -106,6 +109,11 @@ def load_workflow_data():
     if step6_summary_path.exists():
         data['step6_summary'] = pd.read_csv(step6_summary_path)
 
+    # Step 6: Q-point/flow selection per segment (None if missing or out of date)
+    flow_selection = load_flow_selection()
+    if flow_selection is not None:
+        data['step6_flow_selection'] = flow_selection
+
     return data
 
 
@@ -346,6 +354,26 @@ def trace_river(ov_id: str, verbose: bool = False):
     else:
         print("  Step 6 flux data not available")
 
+    # Step 6: Flow selection (Q-point used per segment)
+    if 'step6_flow_selection' in data:
+        selection = data['step6_flow_selection']
+        selection_river = selection[
+            (selection['Nearest_River_ov_id'] == ov_id)
+            & (selection['Flow_Scenario'] == STEP6_PRIMARY_FLOW_SCENARIO)
+        ]
+
+        print(f"\n  Flow selection for {ov_id} ({STEP6_PRIMARY_FLOW_SCENARIO}): {len(selection_river)} segments")
+
+        if not selection_river.empty:
+            print(f"  {'FID':<8} {'Q-point':<10} {'Flow (m³/s)':<14} {'Source'}")
+            print("  " + "-" * 60)
+
+            for _, row in selection_river.sort_values('Nearest_River_FID').iterrows():
+                qpoint = row['Qpoint_Index']
+                qpoint_str = str(int(qpoint)) if pd.notna(qpoint) else 'N/A'
+                source = row['Flow_Source'] + (" (fallback)" if row['Is_Fallback'] else "")
+                print(f"  {int(row['Nearest_River_FID']):<8} {qpoint_str:<10} {row['Flow_m3_s']:<14.4f} {source}")
+
     # Step 6: Cmix results
     if 'step6_cmix' in data:
         step6_cmix = data['step6_cmix']
@@ -670,6 +698,70 @@ def trace_site(lokalitet_id: str, verbose: bool = False):
         print(f"  In Step 6: No")
 
 
+def load_site_reachability():
+    """Reachability index over the river network for the Step 6 site-segment pairs."""
+    # Imported here: the Step 6 package pulls in rasterio/folium
+    from tilstandsvurdering.step6_river_network import SiteReachability, load_river_network
+
+    step6_flux_path = get_output_path("step6_flux_site_segment")
+    if not step6_flux_path.exists():
+        print(f"Step 6 flux file not found: {step6_flux_path} - run Step 6 first")
+        return None
+    site_segments = pd.read_csv(
+        step6_flux_path, usecols=["Lokalitet_ID", "Nearest_River_FID"], dtype={"Lokalitet_ID": str}
+    )
+    network = load_river_network()
+    return SiteReachability(network, site_segments)
+
+
+def trace_upstream_sites(reachability, river_fid: int, verbose: bool = False):
+    """Print the Step 6 sites whose nearest segment is river_fid or drains into it."""
+    network = reachability.network
+    position = network.positions([river_fid])[0]
+    print("\n" + "=" * 80)
+    print(f"UPSTREAM SITES: River_FID {river_fid}")
+    print("=" * 80)
+    if position < 0:
+        print("  River_FID not found in the river network")
+        return
+
+    upstream_segments = network.upstream_of(position)
+    sites = reachability.sites_upstream_of(river_fid)
+    print(f"  ov_id: {network.ov_id[position]}")
+    print(f"  Upstream segments (incl. itself): {len(upstream_segments)}")
+    print(f"  Contributing Step 6 sites: {sites['Lokalitet_ID'].nunique()}")
+    if sites.empty:
+        return
+
+    per_segment = sites.groupby("Nearest_River_FID")["Lokalitet_ID"].apply(sorted)
+    shown = per_segment if verbose else per_segment.head(20)
+    for fid, site_ids in shown.items():
+        own = " (this segment)" if fid == river_fid else ""
+        print(f"    FID {fid}{own}: {', '.join(site_ids)}")
+    if len(shown) < len(per_segment):
+        print(f"    ... {len(per_segment) - len(shown)} more segments (use --verbose)")
+
+
+def trace_downstream_segments(reachability, lokalitet_id: str, verbose: bool = False):
+    """Print the routing path from a Step 6 site's nearest segment(s) to the outlet."""
+    print("\n" + "=" * 80)
+    print(f"DOWNSTREAM SEGMENTS: {lokalitet_id}")
+    print("=" * 80)
+    path = reachability.segments_downstream_of_site(lokalitet_id)
+    if path.empty:
+        print("  Site not found among the Step 6 site-segment pairs")
+        return
+
+    for start_fid, steps in path.groupby("Site_Segment_FID", sort=False):
+        rivers = steps["ov_id"].drop_duplicates().tolist()
+        print(f"\n  From FID {start_fid}: {len(steps)} segments to the outlet via {' -> '.join(map(str, rivers))}")
+        shown = steps if verbose else steps.head(20)
+        for _, row in shown.iterrows():
+            print(f"    {int(row['Steps_Downstream']):4d}  FID {row['River_FID']}  {row['ov_id']}")
+        if len(shown) < len(steps):
+            print(f"    ... {len(steps) - len(shown)} more segments (use --verbose)")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Trace a specific river or site through the workflow",
@@ -687,6 +779,10 @@ Examples:
     # List available IDs
     python tools/trace_river_workflow.py --list-rivers
     python tools/trace_river_workflow.py --list-sites
+
+    # River network queries
+    python tools/trace_river_workflow.py --upstream-sites 12345
+    python tools/trace_river_workflow.py --downstream-segments 731-00045
         """
     )
     parser.add_argument("--river", "-r", help="River ID to trace (e.g., DKRIVER726)")
@@ -694,6 +790,10 @@ Examples:
     parser.add_argument("--verbose", "-v", action="store_true", help="Print detailed output")
     parser.add_argument("--list-rivers", action="store_true", help="List available river IDs")
     parser.add_argument("--list-sites", action="store_true", help="List available site IDs")
+    parser.add_argument("--upstream-sites", type=int, metavar="RIVER_FID",
+                        help="List Step 6 sites on or upstream of a river segment (River_FID)")
+    parser.add_argument("--downstream-segments", metavar="SITE",
+                        help="List river segments downstream of a Step 6 site")
 
     # Legacy support: positional argument as river ID
     parser.add_argument("ov_id", nargs="?", help="(Legacy) River ID to trace")
@@ -721,6 +821,16 @@ Examples:
             print("Step 4 data not available")
         return
 
+    if args.upstream_sites is not None or args.downstream_segments:
+        reachability = load_site_reachability()
+        if reachability is None:
+            return
+        if args.upstream_sites is not None:
+            trace_upstream_sites(reachability, args.upstream_sites, verbose=args.verbose)
+        if args.downstream_segments:
+            trace_downstream_segments(reachability, args.downstream_segments, verbose=args.verbose)
+        return
+
     # Determine what to trace
     if args.site:
         trace_site(args.site, verbose=args.verbose)
@@ -108,6 +108,7 @@ def create_gvfk_progression_plot(figures_path):
     from config import (
         GRUNDVAND_PATH, GRUNDVAND_LAYER_NAME, COLUMN_MAPPINGS, get_output_path
     )
+    from data_loaders import load_step5_combinations
     import geopandas as gpd
 
     gvfk_col = COLUMN_MAPPINGS['grundvand']['gvfk_id']
@@ -166,7 +167,7 @@ def create_gvfk_progression_plot(figures_path):
     step5b_path = get_output_path("step5b_compound_combinations")
     if step5b_path.exists():
         try:
-            step5b_df = pd.read_csv(step5b_path)
+            step5b_df = load_step5_combinations(columns=["GVFK"])
             step5b_gvfks = step5b_df["GVFK"].nunique()
         except:
             pass
@@ -231,6 +232,7 @@ def create_sites_progression_plot(figures_path):
     Shows the funnel from V1/V2 sites through risk assessment to MKK exceedances.
     """
     from config import get_output_path, COLUMN_MAPPINGS
+    from data_loaders import load_step5_combinations
     import geopandas as gpd
 
     sites_counts = []
@@ -280,7 +282,7 @@ def create_sites_progression_plot(figures_path):
     step5b_path = get_output_path("step5b_compound_combinations")
     if step5b_path.exists():
         try:
-            step5b_df = pd.read_csv(step5b_path)
+            step5b_df = load_step5_combinations(columns=["Lokalitet_ID"])
             step5b_sites = step5b_df["Lokalitet_ID"].nunique()
             sites_counts.append(step5b_sites)
             stages.append("Stofspecifik risiko\n(Trin 5b)")
@@ -339,6 +341,7 @@ def create_gvfk_area_volume_plot(figures_path):
     from config import (
         GRUNDVAND_GDB_PATH, GRUNDVAND_LAYER_NAME, COLUMN_MAPPINGS, get_output_path
     )
+    from data_loaders import load_step5_combinations
     import geopandas as gpd
 
     gvfk_col = COLUMN_MAPPINGS['grundvand']['gvfk_id']
@@ -403,7 +406,7 @@ def create_gvfk_area_volume_plot(figures_path):
     step5b_path = get_output_path("step5b_compound_combinations")
     if step5b_path.exists():
         try:
-            step5b_df = pd.read_csv(step5b_path)
+            step5b_df = load_step5_combinations(columns=["GVFK"])
             gvfk_ids = step5b_df["GVFK"].unique()
             area, volume = calc_area_volume(gvfk_ids)
             stages.append("Stofspecifik risiko\n(Trin 5b)")
@@ -521,6 +524,7 @@ def create_regional_summary_tables(output_dir):
     from config import (
         DATA_DIR, GRUNDVAND_PATH, GRUNDVAND_LAYER_NAME, COLUMN_MAPPINGS, get_output_path
     )
+    from data_loaders import load_step5_combinations
     import geopandas as gpd
     import pandas as pd
     from pathlib import Path
@@ -740,7 +744,7 @@ def create_regional_summary_tables(output_dir):
     # Step 5b: Compound Risk
     step5b_path = get_output_path("step5b_compound_combinations")
     if step5b_path.exists():
-        step5b_df = pd.read_csv(step5b_path)
+        step5b_df = load_step5_combinations(columns=["Lokalitet_ID", "GVFK"])
         # Sites need to be spatial 
         sites_geom = None
         if base_sites_gdf is not None: